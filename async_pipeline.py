@@ -0,0 +1,243 @@
+"""
+async_pipeline.py
+
+Optional asyncio message pipeline (ASYNC_PIPELINE=1), selected in main.py
+instead of the synchronous loop. Every message passes through stages
+connected by bounded queues:
+
+    read -> parse -> store -> infer -> page -> ack
+
+read   decodes MLLP frames from the socket
+parse  parses the HL7 messages queued so far, on the parser pool if one is
+       given (see parsing.pool)
+store  applies it to the DB on a dedicated thread (message_parsing.main.store_message),
+       committing the group-commit writer if one is installed
+infer  predicts for the records that became ready, one model call for
+       whatever is queued (up to 'batch_rows')
+page   hands the predictions to ml.main.handle_prediction on a second
+       thread, which queues pages on the (journaled) pager dispatcher
+ack    sends the MLLP ACKs
+
+Each stage has a single consumer and keeps FIFO order, so ACKs leave in
+arrival order, and only once the message's DB writes are committed and its
+page is queued. A full queue blocks the stage in front of it, back to the
+reader, which then stops reading from the socket (backpressure). Queue
+depths are exported as the pipeline_queue_depth gauge.
+"""
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from utils import MLLPDecoder
+from parsing.hl7 import mssg_parser
+from message_parsing.main import store_message
+from database_functionality import db_operations
+from ml.inference import preprocess_batch, predict_aki_batch
+from ml.main import handle_prediction
+from monitoring.metrics import (
+    MESSAGES_PROCESSED,
+    PROCESSING_TIME,
+    PIPELINE_QUEUE_DEPTH,
+    SOCKET_TIMEOUTS,
+    MLLP_RECEIVED_BYTES,
+    MLLP_RECV_CALLS,
+    record_error,
+)
+
+READ_SIZE = 64 * 1024
+POLL_INTERVAL = 1.0  # seconds between checks for a shutdown request while the socket is idle
+STAGES = ("parse", "store", "infer", "page", "ack")
+
+
+class StageQueue(asyncio.Queue):
+    """Bounded queue in front of a stage, reporting its depth."""
+
+    def __init__(self, stage, maxsize):
+        super().__init__(maxsize)
+        self.depth = PIPELINE_QUEUE_DEPTH.labels(stage=stage)
+        self.depth.set(0)
+
+    def put_nowait(self, item):
+        super().put_nowait(item)
+        self.depth.set(self.qsize())
+
+    def get_nowait(self):
+        item = super().get_nowait()
+        self.depth.set(self.qsize())
+        return item
+
+    async def get_batch(self, limit):
+        """Wait for one item, then take whatever else is queued (up to 'limit' items)."""
+        batch = [await self.get()]
+        while len(batch) < limit and batch[-1] is not None and not self.empty():
+            batch.append(self.get_nowait())
+        return batch
+
+
+class Message:
+    """One HL7 message on its way through the pipeline."""
+    __slots__ = ("raw", "start", "type", "data", "record", "prediction")
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.start = time.time()
+        self.type = None
+        self.data = None
+        self.record = None      # feature record ready for inference
+        self.prediction = None
+
+
+class AsyncPipeline:
+    """Runs the staged pipeline over one connection at a time (see serve)."""
+
+    def __init__(self, ack_message, killer, timeout=20, queue_size=256, batch_rows=32, parser_pool=None):
+        self.ack_message = ack_message
+        self.parser_pool = parser_pool  # parsing.pool.ParserPool, or None to parse on the loop
+        self.killer = killer          # utils.GracefulKiller
+        self.timeout = timeout        # seconds without data before reconnecting
+        self.queue_size = queue_size
+        self.batch_rows = batch_rows
+        # Single threads keep the DB and pager work in message order
+        self.db_thread = ThreadPoolExecutor(1, thread_name_prefix="pipeline-db")
+        self.pager_thread = ThreadPoolExecutor(1, thread_name_prefix="pipeline-pager")
+
+    async def serve(self, sock):
+        """
+        Process messages from the connected 'sock' until the simulator closes
+        it, it stays idle for 'timeout' seconds or a shutdown is requested.
+        Returns True if the simulator closed the connection. A failing stage
+        stops the pipeline and its exception is raised; messages not ACKed yet
+        are redelivered after reconnecting.
+        """
+        self.loop = asyncio.get_running_loop()
+        self.queues = {stage: StageQueue(stage, self.queue_size) for stage in STAGES}
+        self.closed = False
+        reader, writer = await asyncio.open_connection(sock=sock)
+        tasks = [asyncio.create_task(stage) for stage in (
+            self.read(reader), self.parse(), self.store(), self.infer(), self.page(), self.ack(writer))]
+        try:
+            done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+            for task in done:
+                task.result()
+        except Exception as e:
+            record_error(error_type=str(e.__class__.__name__), component="async_pipeline")
+            raise
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            if db_operations.writer is not None:
+                # Runs after any commit in flight on the DB thread
+                await self.loop.run_in_executor(self.db_thread, db_operations.writer.rollback)
+            writer.close()
+        return self.closed
+
+    async def read(self, reader):
+        decoder = MLLPDecoder()
+        idle = 0.0
+        while not self.killer.kill_now:
+            try:
+                data = await asyncio.wait_for(reader.read(READ_SIZE), POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                idle += POLL_INTERVAL
+                if idle >= self.timeout:
+                    SOCKET_TIMEOUTS.inc()
+                    break
+                continue
+            if not data:
+                print("[main] Simulator closed connection.")
+                self.closed = True
+                break
+            idle = 0.0
+            MLLP_RECV_CALLS.inc()
+            MLLP_RECEIVED_BYTES.inc(len(data))
+            decoder.feed(data)
+            for frame in decoder:
+                await self.queues["parse"].put(Message(bytes(frame)))
+        await self.queues["parse"].put(None)
+
+    async def parse(self):
+        while True:
+            batch = await self.queues["parse"].get_batch(self.queue_size)
+            done = batch[-1] is None
+            batch = batch[:-1] if done else batch
+            if self.parser_pool is not None and batch:
+                parsed = await self.parser_pool.parse_async(self.loop, [message.raw for message in batch])
+            else:
+                parsed = [mssg_parser(message.raw) for message in batch]
+            for message, (message.type, message.data) in zip(batch, parsed):
+                MESSAGES_PROCESSED.labels(message_type=message.type).inc()
+                await self.queues["store"].put(message)
+            if done:
+                await self.queues["store"].put(None)
+                return
+
+    async def store(self):
+        held = []  # stored, waiting for the group commit
+        while True:
+            message = await self.queues["store"].get()
+            if message is not None:
+                message.record = await self.loop.run_in_executor(
+                    self.db_thread, store_message, message.type, message.data)
+                held.append(message)
+
+            group = db_operations.writer
+            if group is not None and len(group):
+                if message is not None and not group.due() and not self.queues["store"].empty():
+                    continue
+                await self.loop.run_in_executor(self.db_thread, group.commit)
+            for stored in held:
+                await self.queues["infer"].put(stored)
+            held.clear()
+            if message is None:
+                await self.queues["infer"].put(None)
+                return
+
+    async def infer(self):
+        while True:
+            batch = await self.queues["infer"].get_batch(self.batch_rows)
+            done = batch[-1] is None
+            batch = batch[:-1] if done else batch
+            ready = [message for message in batch if message.record is not None]
+            if ready:
+                features, _, _ = preprocess_batch([message.record for message in ready])
+                predictions = predict_aki_batch(features)
+                if predictions is None:
+                    print("[ml_consumer] Prediction Error")
+                else:
+                    for message, prediction in zip(ready, predictions):
+                        message.prediction = prediction
+            for message in batch:
+                await self.queues["page"].put(message)
+            if done:
+                await self.queues["page"].put(None)
+                return
+
+    async def page(self):
+        while (message := await self.queues["page"].get()) is not None:
+            if message.prediction is not None:
+                try:
+                    await self.loop.run_in_executor(
+                        self.pager_thread, handle_prediction, message.prediction,
+                        message.record["PID"], message.record["Latest_Result_Timestamp"], message.record)
+                except Exception as e:
+                    record_error(error_type=str(e.__class__.__name__), component="ml_inference")
+                    print(f"[ml_consumer] ERROR: {e}")
+            await self.queues["ack"].put(message)
+        await self.queues["ack"].put(None)
+
+    async def ack(self, writer):
+        while True:
+            batch = await self.queues["ack"].get_batch(self.queue_size)
+            done = batch[-1] is None
+            batch = batch[:-1] if done else batch
+            if batch:
+                writer.write(self.ack_message * len(batch))
+                await writer.drain()
+                print("[main] Sent MLLP ACK." if len(batch) == 1 else f"[main] Sent {len(batch)} MLLP ACKs.")
+                end = time.time()
+                for message in batch:
+                    if message.type == "ORU^R01":
+                        PROCESSING_TIME.labels(message_type=message.type).observe(end - message.start)
+            if done:
+                return
@@ -0,0 +1,101 @@
+"""
+bench_db.py
+
+Messages per second through the database operations of message_consumer
+(handle_adt_a01, handle_adt_a03, handle_oru_a01 + update_feature_store), against a
+/state-style database file:
+
+  - before:      a new sqlite3.connect per operation, default journal settings
+  - pool:        the persistent db_operations.pool (WAL, synchronous=NORMAL)
+  - process_oru: the pool, with one read-modify-write transaction per ORU
+  - cache:       process_oru served by the write-back FeatureCache
+  - group_commit: process_oru buffered in a GroupCommitWriter, 100 rows per commit
+
+Usage:
+    python -m benchmarks.bench_db --messages 5000 --patients 500
+"""
+import argparse
+import contextlib
+import io
+import os
+import sqlite3
+import tempfile
+import time
+from unittest.mock import patch
+
+from benchmarks.synthetic import hl7_messages
+from database_functionality import create_db, db_operations
+from database_functionality.feature_cache import FeatureCache
+from database_functionality.group_commit import GroupCommitWriter
+from database_functionality.db_operations import handle_adt_a01, handle_adt_a03, handle_oru_a01, update_feature_store, process_oru
+from ml.feature_construct import update
+from parsing.hl7 import mssg_parser
+
+
+def construct_feature(old_feat, data, mssg_type):
+    new_feature = update(old_feat, data, mssg_type)
+    new_feature["Ready_for_Inference"] = "No"
+    return new_feature
+
+
+def replay(parsed, single_transaction):
+    """The database part of message_parsing.main.message_consumer."""
+    for mssg_type, data in parsed:
+        if mssg_type == "ADT^A01":
+            handle_adt_a01(data)
+        elif mssg_type == "ADT^A03":
+            handle_adt_a03(data)
+        elif mssg_type == "ORU^R01" and single_transaction:
+            process_oru(data, lambda old_feat: construct_feature(old_feat, data, mssg_type))
+            if db_operations.writer is not None and db_operations.writer.due():
+                db_operations.writer.commit()
+        elif mssg_type == "ORU^R01":
+            old_feat = handle_oru_a01(data)
+            if old_feat is not None:
+                new_feature = construct_feature(old_feat, data, mssg_type)
+                update_feature_store(new_feature["PID"], new_feature)
+
+
+def run(name, parsed, directory, persistent, single_transaction=False, cached=False, group_commit=False):
+    path = os.path.join(directory, f"{name}.db")
+    with contextlib.redirect_stdout(io.StringIO()):
+        create_db.main(path)
+    pool = db_operations.ConnectionPool(path)
+    connect = pool.connection if persistent else (lambda: sqlite3.connect(path))
+
+    with patch.object(db_operations, "connect_db", connect), contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        if cached:
+            db_operations.enable_feature_cache(FeatureCache(connect, os.path.join(directory, f"{name}.journal")).open())
+        if group_commit:
+            db_operations.enable_group_commit(GroupCommitWriter(connect, max_rows=100, max_delay=60))
+        replay(parsed, single_transaction)
+        if group_commit:
+            db_operations.writer.commit()
+            db_operations.enable_group_commit(None)
+        if cached:
+            db_operations.cache.close()  # includes the final write-back
+            db_operations.enable_feature_cache(None)
+        elapsed = time.perf_counter() - start
+    pool.discard()
+    print(f"{name:<13} {len(parsed) / elapsed:10.0f} msgs/s  {1e6 * elapsed / len(parsed):8.1f} us/msg")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", default=5000, type=int, help="Number of synthetic messages")
+    parser.add_argument("--patients", default=500, type=int, help="Number of distinct MRNs")
+    parser.add_argument("--directory", default=None, help="Where to create the databases (default: a temp dir)")
+    flags = parser.parse_args()
+
+    parsed = [mssg_parser(m) for m in hl7_messages(flags.messages, patients=flags.patients)]
+    with tempfile.TemporaryDirectory(dir=flags.directory) as directory:
+        run("before", parsed, directory, persistent=False)
+        run("pool", parsed, directory, persistent=True)
+        run("process_oru", parsed, directory, persistent=True, single_transaction=True)
+        run("cache", parsed, directory, persistent=True, single_transaction=True, cached=True)
+        run("group_commit", parsed, directory, persistent=True, single_transaction=True, group_commit=True)
+
+
+if __name__ == "__main__":
+    main()
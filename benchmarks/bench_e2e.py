@@ -0,0 +1,276 @@
+"""
+bench_e2e.py
+
+End-to-end throughput and latency of main.main, driven the way the
+simulator drives it: a synthetic HL7 stream (benchmarks/synthetic.py, of
+--messages messages over --patients MRNs in the --mix ADT^A01/ORU^R01/
+ADT^A03 ratio) is replayed over MLLP, ACKs are verified as simulator.py
+does, and pages go to simulator.py's pager handler.
+
+main.main runs in this process (on the main thread, for its signal
+handlers) against a database, feature cache journal and pager journal in
+a temporary directory, never /state. Settings are given as NAME=VALUE
+arguments and applied to the environment before main is imported, e.g.
+GROUP_COMMIT=1 FEATURE_CACHE=1.
+
+Reported, after the first --warmup messages (model load, first connects):
+
+  - messages per second, from the first message sent to the last ACK
+  - latency percentiles of each stage, timed around the functions that
+    implement it; time spent in a nested stage is not counted twice:
+      parse      parsing.hl7.mssg_parser (not timed with PARSE_WORKERS)
+      db         handle_adt_a01, handle_adt_a03, process_oru
+      commit     GroupCommitWriter.commit (GROUP_COMMIT=1)
+      inference  predict_aki / predict_aki_batch
+      page       PagerClient.send, on the dispatcher's worker threads
+      ack        message sent to its ACK received, as seen by the simulator
+
+The simulator sends one message and waits for its ACK; --window N keeps up
+to N messages in flight instead, so ACK batching settings can be measured.
+
+--output writes the results as JSON; --baseline compares them with an
+earlier --output, so a regression between two commits shows as a drop in
+msgs/s or a rise in the stage percentiles.
+
+Usage:
+    python -m benchmarks.bench_e2e --messages 20000 --patients 1000 --output after.json
+    python -m benchmarks.bench_e2e --baseline before.json --window 32 GROUP_COMMIT=1 MICRO_BATCH=1
+"""
+import argparse
+import collections
+import contextlib
+import functools
+import json
+import os
+import signal
+import socket
+import statistics
+import subprocess
+import tempfile
+import threading
+import time
+from unittest.mock import patch
+
+import simulator
+from benchmarks.bench_pager import pager_server
+from benchmarks.synthetic import hl7_messages, to_mllp
+
+STAGES = ("parse", "db", "commit", "inference", "page", "ack")
+MLLP_TIMEOUT = 30  # seconds without an ACK (or a connection) before giving up
+
+
+class StageTimer:
+    """Durations of the calls to the functions wrapped with wrap(), per stage."""
+
+    def __init__(self):
+        self.samples = collections.defaultdict(list)
+        self._local = threading.local()
+
+    def reset(self):
+        self.samples = collections.defaultdict(list)
+
+    def wrap(self, stage, func):
+        @functools.wraps(func)
+        def timed(*args, **kwargs):
+            nested = self._local.__dict__.setdefault("nested", [])
+            nested.append(0.0)  # time spent in stages called from this one
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+                inner = nested.pop()
+                if nested:
+                    nested[-1] += elapsed
+                self.samples[stage].append(elapsed - inner)
+        return timed
+
+
+def timed_stages(timer):
+    """Patch the stage functions of the application with timer.wrap."""
+    import async_pipeline
+    import main
+    import message_parsing.main
+    import ml.main
+    from database_functionality.group_commit import GroupCommitWriter
+    from ml.pager import PagerClient
+
+    stack = contextlib.ExitStack()
+    for owner, name, stage in (
+            (message_parsing.main, "mssg_parser", "parse"),
+            (async_pipeline, "mssg_parser", "parse"),
+            (message_parsing.main, "handle_adt_a01", "db"),
+            (message_parsing.main, "handle_adt_a03", "db"),
+            (message_parsing.main, "process_oru", "db"),
+            (GroupCommitWriter, "commit", "commit"),
+            (ml.main, "predict_aki", "inference"),
+            (ml.main, "predict_aki_batch", "inference"),
+            (async_pipeline, "predict_aki_batch", "inference"),
+            (PagerClient, "send", "page")):
+        stack.enter_context(patch.object(owner, name, timer.wrap(stage, getattr(owner, name))))
+    return stack
+
+
+def replay(listener, frames, window, warmup, timer, result):
+    """
+    Serve 'frames' to the first client of 'listener' with up to 'window'
+    unacknowledged, then stop main.main: SIGTERM to the main thread, then
+    close the connection.
+    """
+    try:
+        listener.settimeout(MLLP_TIMEOUT)
+        client, _ = listener.accept()
+    except OSError as e:
+        result["error"] = e
+        signal.pthread_kill(threading.main_thread().ident, signal.SIGTERM)
+        return
+    client.settimeout(MLLP_TIMEOUT)
+    sent = collections.deque()  # send times of the unacknowledged messages
+    latencies = []
+    buffer = b""
+    result["start"] = time.perf_counter()
+    try:
+        while len(latencies) < len(frames):
+            while len(latencies) + len(sent) < len(frames) and len(sent) < window:
+                sent.append(time.perf_counter())
+                client.sendall(frames[len(latencies) + len(sent) - 1])
+            data = client.recv(simulator.MLLP_BUFFER_SIZE)
+            received = time.perf_counter()
+            if not data:
+                raise ConnectionError("main closed the connection")
+            acks, buffer = simulator.parse_mllp_messages(buffer + data, "bench_e2e")
+            for ack in acks:
+                accepted, error = simulator.verify_ack([ack])
+                if not accepted:
+                    raise ValueError(error or "message not acknowledged")
+                latencies.append(received - sent.popleft())
+                if len(latencies) == warmup:
+                    timer.reset()
+                    result["start"] = received
+        result["end"] = time.perf_counter()
+    except Exception as e:
+        result["error"] = e
+    finally:
+        result["latencies"] = latencies[warmup:]
+        signal.pthread_kill(threading.main_thread().ident, signal.SIGTERM)
+        client.close()
+
+
+def run(frames, settings, window, warmup, directory):
+    """Replay 'frames' through main.main with 'settings' in the environment. Returns the results dict."""
+    os.environ.update(settings)
+    os.environ["PROMETHEUS_PORT"] = "0"  # any free port
+    import main
+    from database_functionality import create_db, db_operations
+
+    db_path = os.path.join(directory, "patient_database.db")
+    timer = StageTimer()
+    result = {}
+    listener = socket.create_server(("127.0.0.1", 0))
+    os.environ["MLLP_ADDRESS"] = f"127.0.0.1:{listener.getsockname()[1]}"
+    handlers = {signum: signal.getsignal(signum) for signum in (signal.SIGINT, signal.SIGTERM)}
+    # main prints every ACK and the simulator every page: discarded, but still paid for
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull), \
+            pager_server(simulator.PagerRequestHandler) as pager_address, timed_stages(timer), \
+            patch.object(db_operations, "pool", db_operations.ConnectionPool(db_path)), \
+            patch.object(create_db, "main", functools.partial(create_db.main, db_path)), \
+            patch.object(main, "FEATURE_CACHE_JOURNAL", os.path.join(directory, "feature_cache.journal")), \
+            patch.object(main, "PAGER_JOURNAL", os.path.join(directory, "pager.journal")):
+        create_db.main()  # created before main.main starts, so it does not load /data/history.csv
+        os.environ["PAGER_ADDRESS"] = pager_address
+        server = threading.Thread(target=replay, args=(listener, frames, window, warmup, timer, result),
+                                  name="bench-mllp", daemon=True)
+        server.start()
+        try:
+            main.main()
+        finally:
+            for signum, handler in handlers.items():
+                signal.signal(signum, handler)
+            server.join(MLLP_TIMEOUT)
+            listener.close()
+    if "error" in result:
+        raise RuntimeError(f"Replay failed after {len(result.get('latencies', []))} messages: {result['error']}")
+
+    seconds = result["end"] - result["start"]
+    samples = dict(timer.samples, ack=result["latencies"])
+    return {
+        "commit": git_commit(),
+        "settings": settings,
+        "messages": len(frames) - warmup,
+        "window": window,
+        "seconds": seconds,
+        "msgs_per_s": (len(frames) - warmup) / seconds,
+        "stages": {stage: percentiles(samples[stage]) for stage in STAGES if len(samples.get(stage, ())) > 1},
+    }
+
+
+def percentiles(samples):
+    """Count and p50/p90/p99/max of 'samples' (seconds), in milliseconds."""
+    cuts = statistics.quantiles(samples, n=100, method="inclusive")
+    return {"count": len(samples), "p50_ms": 1000 * cuts[49], "p90_ms": 1000 * cuts[89],
+            "p99_ms": 1000 * cuts[98], "max_ms": 1000 * max(samples)}
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def report(results, baseline=None):
+    def change(new, old):
+        return f"  ({100 * (new / old - 1):+6.1f}%)" if old else ""
+
+    print(f"{results['messages']} messages, window {results['window']}, {results['seconds']:.2f} s: "
+          f"{results['msgs_per_s']:8.0f} msgs/s"
+          + (change(results["msgs_per_s"], baseline["msgs_per_s"]) if baseline else ""))
+    print(f"{'stage':<10} {'count':>8} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    for stage, cuts in results["stages"].items():
+        line = (f"{stage:<10} {cuts['count']:>8} {cuts['p50_ms']:>9.3f} {cuts['p90_ms']:>9.3f} "
+                f"{cuts['p99_ms']:>9.3f} {cuts['max_ms']:>9.3f}")
+        old = (baseline or {}).get("stages", {}).get(stage)
+        if old:
+            line += f"   p50{change(cuts['p50_ms'], old['p50_ms'])}  p99{change(cuts['p99_ms'], old['p99_ms'])}"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("settings", nargs="*", metavar="NAME=VALUE", help="Environment settings for main.py")
+    parser.add_argument("--messages", default=20000, type=int, help="Number of synthetic messages")
+    parser.add_argument("--patients", default=1000, type=int, help="Number of distinct MRNs")
+    parser.add_argument("--mix", default="0.2,0.7,0.1", help="ADT^A01,ORU^R01,ADT^A03 ratio")
+    parser.add_argument("--seed", default=0, type=int, help="Seed of the synthetic stream")
+    parser.add_argument("--window", default=1, type=int, help="Messages in flight (1: lockstep, as simulator.py)")
+    parser.add_argument("--warmup", default=200, type=int, help="Messages left out of the results")
+    parser.add_argument("--output", default=None, help="Write the results to this JSON file")
+    parser.add_argument("--baseline", default=None, help="Compare with the JSON results of an earlier run")
+    parser.add_argument("--directory", default=None, help="Where to create the database (default: a temp dir)")
+    flags = parser.parse_args()
+
+    settings = dict(setting.split("=", 1) for setting in flags.settings)
+    mix = tuple(float(weight) for weight in flags.mix.split(","))
+    frames = [to_mllp(message)
+              for message in hl7_messages(flags.messages + flags.warmup, patients=flags.patients, mix=mix,
+                                          seed=flags.seed)]
+
+    with tempfile.TemporaryDirectory(dir=flags.directory) as directory:
+        results = run(frames, settings, flags.window, flags.warmup, directory)
+    results.update(patients=flags.patients, mix=mix, seed=flags.seed)
+
+    baseline = None
+    if flags.baseline:
+        with open(flags.baseline) as f:
+            baseline = json.load(f)
+        print(f"baseline: {flags.baseline} (commit {baseline.get('commit')}, settings {baseline.get('settings')})")
+    report(results, baseline)
+    if flags.output:
+        with open(flags.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {flags.output}")
+
+
+if __name__ == "__main__":
+    main()
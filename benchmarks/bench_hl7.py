@@ -0,0 +1,35 @@
+"""
+bench_hl7.py
+
+Per-message cost of parsing.hl7.fast_mssg_parser against the hl7apy path.
+
+Usage:
+    python -m benchmarks.bench_hl7 --messages 5000
+"""
+import argparse
+import time
+
+from parsing.hl7 import fast_mssg_parser, hl7apy_mssg_parser
+from benchmarks.synthetic import hl7_messages
+
+
+def report(name, func, messages):
+    start = time.perf_counter()
+    for msg in messages:
+        func(msg)
+    elapsed = time.perf_counter() - start
+    print(f"{name:<20} {len(messages) / elapsed:10.0f} msgs/s  {1e6 * elapsed / len(messages):8.1f} us/msg")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", default=5000, type=int, help="Number of synthetic messages")
+    flags = parser.parse_args()
+
+    messages = list(hl7_messages(flags.messages))
+    report("hl7apy", hl7apy_mssg_parser, messages)
+    report("fast path", fast_mssg_parser, messages)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+bench_inference.py
+
+Rows per second of ml.inference.predict_aki_batch against batch size,
+with predict_aki (one model call per patient) as the baseline, for the
+sklearn pickle and for its compiled export (ml.compiled_model).
+
+Usage:
+    python -m benchmarks.bench_inference --rows 20000
+"""
+import argparse
+import time
+
+import pickle
+
+import numpy as np
+
+import ml.inference
+from ml import compiled_model
+from ml.inference import predict_aki, predict_aki_batch
+
+BATCH_SIZES = (1, 2, 4, 8, 16, 32, 64, 128, 256, 1024)
+
+
+def synthetic_features(rows, seed=0):
+    """Feature rows (Age, Sex, Mean, Std, Max, Min, Last) in plausible ranges."""
+    rng = np.random.default_rng(seed)
+    mean = rng.uniform(50, 200, rows)
+    std = rng.uniform(0, 30, rows)
+    return np.column_stack([
+        rng.integers(18, 90, rows), rng.integers(0, 2, rows), mean, std,
+        mean + 2 * std, np.maximum(mean - 2 * std, 10), rng.uniform(50, 400, rows),
+    ]).astype(float)
+
+
+def report(name, rows, elapsed):
+    print(f"{name:<20} {rows / elapsed:10.0f} rows/s  {1e6 * elapsed / rows:8.1f} us/row")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", default=20000, type=int, help="Number of synthetic patients")
+    flags = parser.parse_args()
+
+    features = synthetic_features(flags.rows)
+    columns = ("Age", "Sex", "Mean", "Standard_Deviation", "Max", "Min", "Last_Result_Value")
+    records = [dict(zip(columns, row), PID="1", Latest_Result_Timestamp="20240101000000")
+               for row in features[:min(flags.rows, 2000)].tolist()]
+
+    for name in ("sklearn", "compiled"):
+        start = time.perf_counter()
+        if name == "sklearn":
+            with open(ml.inference.MODEL_PATH, "rb") as f:
+                ml.inference.model = pickle.load(f)
+        else:
+            ml.inference.model = compiled_model.load(ml.inference.COMPILED_MODEL_PATH)
+        print(f"--- {name} model (loaded in {1000 * (time.perf_counter() - start):.1f} ms)")
+
+        start = time.perf_counter()
+        for record in records:
+            predict_aki(record)
+        report("predict_aki", len(records), time.perf_counter() - start)
+
+        for size in BATCH_SIZES:
+            start = time.perf_counter()
+            for first in range(0, flags.rows, size):
+                predict_aki_batch(features[first:first + size])
+            report(f"batch of {size}", flags.rows, time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    main()
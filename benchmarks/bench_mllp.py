@@ -0,0 +1,62 @@
+"""
+bench_mllp.py
+
+Throughput of utils.MLLPDecoder against the original utils.parse_mllp_stream
+on a multi-megabyte MLLP replay.
+
+Usage:
+    python -m benchmarks.bench_mllp --megabytes 8 --chunk 1024
+"""
+import argparse
+import time
+
+from utils import MLLPDecoder, parse_mllp_stream
+from benchmarks.synthetic import mllp_stream
+
+
+def run_parse_mllp_stream(stream, chunk):
+    # Mirrors the original main loop: leftover += chunk, then re-parse
+    count = 0
+    leftover = b""
+    for i in range(0, len(stream), chunk):
+        leftover += stream[i:i + chunk]
+        messages, leftover = parse_mllp_stream(leftover)
+        count += len(messages)
+    return count
+
+
+def run_decoder(stream, chunk):
+    count = 0
+    decoder = MLLPDecoder()
+    for i in range(0, len(stream), chunk):
+        decoder.feed(stream[i:i + chunk])
+        for _ in decoder:
+            count += 1
+    return count
+
+
+def report(name, func, stream, chunk):
+    start = time.perf_counter()
+    count = func(stream, chunk)
+    elapsed = time.perf_counter() - start
+    mb = len(stream) / 1e6
+    print(f"{name:<20} chunk={chunk:>9}  {count:>8} msgs  {elapsed:8.3f} s  "
+          f"{mb / elapsed:8.1f} MB/s  {count / elapsed:10.0f} msgs/s")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--megabytes", default=8, type=float, help="Size of the synthetic replay")
+    parser.add_argument("--chunk", default=1024, type=int, help="Bytes per simulated recv()")
+    flags = parser.parse_args()
+
+    stream = mllp_stream(int(flags.megabytes * 1e6))
+    print(f"Replay: {len(stream) / 1e6:.1f} MB")
+    # A whole backlog burst in one buffer, then recv-sized chunks
+    for chunk in (len(stream), flags.chunk):
+        report("parse_mllp_stream", run_parse_mllp_stream, stream, chunk)
+        report("MLLPDecoder", run_decoder, stream, chunk)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+bench_pager.py
+
+Pager latency (p50/p99) of one requests.post per page, as ml.pager used to
+do, against ml.pager.PagerClient (keep-alive session).
+
+By default the simulator.py pager handler is served in-process. It answers
+with HTTP/1.0 and no Content-Length, so the server closes every connection
+and keep-alive cannot help; it is therefore also run as HTTP/1.1 with a
+Content-Length, like a production pager. --address benchmarks an already
+running pager instead.
+
+Usage:
+    python -m benchmarks.bench_pager --pages 2000
+    python -m benchmarks.bench_pager --address localhost:8441
+"""
+import argparse
+import contextlib
+import http.server
+import io
+import statistics
+import threading
+import time
+
+import requests
+
+import simulator
+from ml.pager import PagerClient, resolve_pager_url
+
+
+class KeepAlivePagerHandler(simulator.PagerRequestHandler):
+    """The simulator's pager, speaking HTTP/1.1 so connections are reused."""
+    protocol_version = "HTTP/1.1"
+    # Headers and body are separate writes: without TCP_NODELAY the body
+    # waits for the client's delayed ACK (~40 ms) on a reused connection
+    disable_nagle_algorithm = True
+
+    def send_response(self, code, message=None):
+        self._status = code
+        super().send_response(code, message)
+
+    def end_headers(self):
+        # The simulator writes b"ok\n" after a 200 and no body otherwise
+        self.send_header("Content-Length", "3" if self._status == 200 else "0")
+        super().end_headers()
+
+
+@contextlib.contextmanager
+def pager_server(handler):
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), lambda *args: handler(lambda: None, *args))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"127.0.0.1:{server.server_address[1]}"
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def measure(send, pages):
+    latencies = []
+    for i in range(pages):
+        start = time.perf_counter()
+        status = send(str(100000 + i), "20240101120000")
+        latencies.append(time.perf_counter() - start)
+        assert status == 200, status
+    return latencies
+
+
+def report(name, latencies):
+    cuts = statistics.quantiles(latencies, n=100)
+    print(f"{name:<32} p50 {1000 * cuts[49]:7.3f} ms  p99 {1000 * cuts[98]:7.3f} ms")
+
+
+def run(label, address, pages):
+    url = resolve_pager_url(address)
+    client = PagerClient(address)
+    with contextlib.redirect_stdout(io.StringIO()):  # the simulator prints every page
+        before = measure(lambda mrn, ts: requests.post(url, data=f"{mrn},{ts}", timeout=0.2).status_code, pages)
+        after = measure(client.send, pages)
+    client.close()
+    report(f"{label}: requests.post", before)
+    report(f"{label}: PagerClient", after)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", default=2000, type=int, help="Number of pages per variant")
+    parser.add_argument("--address", default=None, help="host:port of a running pager")
+    flags = parser.parse_args()
+
+    if flags.address:
+        run(flags.address, flags.address, flags.pages)
+        return
+    with pager_server(simulator.PagerRequestHandler) as address:
+        run("simulator (HTTP/1.0)", address, flags.pages)
+    with pager_server(KeepAlivePagerHandler) as address:
+        run("keep-alive (HTTP/1.1)", address, flags.pages)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""
+bench_parse_pool.py
+
+Messages per second of parsing.pool.ParserPool against the number of
+worker processes, with in-process parsing (0 workers) as the baseline.
+The synthetic messages all take the fast path, which the pool runs in
+process, so the default mode measures the pool's overhead on a stream
+without fallbacks; --parser hl7apy_mssg_parser sends every message to the
+workers, as the CPU-bound hl7apy path the pool is there for.
+
+Usage:
+    python -m benchmarks.bench_parse_pool --messages 20000 --workers 1 2 4
+    python -m benchmarks.bench_parse_pool --messages 2000 --parser hl7apy_mssg_parser
+"""
+import argparse
+import os
+import time
+
+from parsing import hl7
+from parsing.pool import ParserPool
+from benchmarks.synthetic import hl7_messages
+
+
+def report(name, count, elapsed):
+    print(f"{name:<12} {count / elapsed:10.0f} msgs/s")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", default=20000, type=int, help="Number of synthetic messages")
+    parser.add_argument("--workers", default=[1, 2, 4, 8], type=int, nargs="+", help="Pool sizes to measure")
+    parser.add_argument("--chunk-size", default=16, type=int, help="Frames per round trip to a worker")
+    parser.add_argument("--batch", default=256, type=int, help="Frames handed to the pool at once")
+    parser.add_argument("--parser", default="mssg_parser", choices=["mssg_parser", "hl7apy_mssg_parser"])
+    flags = parser.parse_args()
+    print(f"{os.cpu_count()} CPUs, {flags.parser}, chunks of {flags.chunk_size}, batches of {flags.batch}")
+
+    frames = list(hl7_messages(flags.messages))
+    batches = [frames[i:i + flags.batch] for i in range(0, len(frames), flags.batch)]
+
+    parse = getattr(hl7, flags.parser)
+    start = time.perf_counter()
+    for frame in frames:
+        parse(frame)
+    report("in-process", len(frames), time.perf_counter() - start)
+
+    for workers in flags.workers:
+        pool = ParserPool(workers, chunk_size=flags.chunk_size, parser=flags.parser)
+        pool.warm_up()
+        start = time.perf_counter()
+        for batch in batches:
+            pool.parse(batch)
+        report(f"{workers} workers", len(frames), time.perf_counter() - start)
+        pool.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""
+bench_pid_index.py
+
+The in-memory PID index (database_functionality/pid_index.py):
+
+  - memory per million PIDs: the sorted array('q') against a Python set of
+    the same PIDs (measured with tracemalloc), and the build time from a
+    Patient_Data table of --patients rows
+  - the cost of telling a new patient apart: PidIndex.may_exist against the
+    SELECT it replaces
+  - process_oru for --messages first-time patients, buffered in a
+    GroupCommitWriter (100 rows per commit, so the existence query is most
+    of what is left per message), without and with the index installed;
+    each on its own copy of the database, alternating over --repeat rounds;
+    the best round of each is reported
+
+PIDs are random 9-digit MRNs, as in the simulator's messages.
+
+Usage:
+    python -m benchmarks.bench_pid_index --patients 1000000 --messages 20000
+"""
+import argparse
+import contextlib
+import io
+import os
+import random
+import shutil
+import sqlite3
+import tempfile
+import time
+import tracemalloc
+from unittest.mock import patch
+
+from database_functionality import create_db, db_operations
+from database_functionality.db_operations import process_oru
+from database_functionality.group_commit import GroupCommitWriter
+from database_functionality.pid_index import PidIndex
+
+
+def allocated(build):
+    """(result of build(), bytes it allocated and still holds)."""
+    tracemalloc.start()
+    result = build()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, size
+
+
+def insert_new_patients(path, pids, index):
+    pool = db_operations.ConnectionPool(path)
+    with patch.object(db_operations, "connect_db", pool.connection), contextlib.redirect_stdout(io.StringIO()):
+        db_operations.enable_pid_index(index)
+        db_operations.enable_group_commit(GroupCommitWriter(pool.connection, max_rows=100, max_delay=60))
+        try:
+            start = time.perf_counter()
+            for pid in pids:
+                process_oru((pid, 100.0, "20240224120000"), lambda old: old)
+                if db_operations.writer.due():
+                    db_operations.writer.commit()
+            db_operations.writer.commit()
+            elapsed = time.perf_counter() - start
+        finally:
+            db_operations.enable_group_commit(None)
+            db_operations.enable_pid_index(None)
+    pool.discard()
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--patients", default=1000000, type=int, help="Patients in Patient_Data")
+    parser.add_argument("--messages", default=20000, type=int, help="ORU messages for first-time patients")
+    parser.add_argument("--repeat", default=3, type=int, help="Rounds of the handler comparison")
+    flags = parser.parse_args()
+
+    pids = random.sample(range(100000000, 1000000000), flags.patients + 2 * flags.repeat * flags.messages)
+    known, new = pids[:flags.patients], [str(pid) for pid in pids[flags.patients:]]
+    per_million = 1e6 / flags.patients / 2**20
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "patient_database.db")
+        with contextlib.redirect_stdout(io.StringIO()):
+            create_db.main(path)
+        conn = sqlite3.connect(path)
+        conn.executemany("INSERT INTO Patient_Data (PID, Admission_Status) VALUES (?, 'Pending')",
+                         ((pid,) for pid in known))
+        conn.commit()
+
+        start = time.perf_counter()
+        index, index_bytes = allocated(lambda: PidIndex.load(conn))
+        build = time.perf_counter() - start
+        _, set_bytes = allocated(lambda: set(known))
+        print(f"{flags.patients} PIDs, MB per million:  array('q') {index_bytes * per_million:6.1f}"
+              f"  (nbytes {index.nbytes() * per_million:.1f}, built in {build:.2f} s)"
+              f"   set {set_bytes * per_million:6.1f}")
+
+        probes = [str(pid) for pid in random.sample(known, 10000)] + new[:10000]
+        start = time.perf_counter()
+        for pid in probes:
+            index.may_exist(pid)
+        lookup = (time.perf_counter() - start) / len(probes)
+        start = time.perf_counter()
+        for pid in probes:
+            conn.execute("SELECT * FROM Patient_Data WHERE PID = ?", (pid,)).fetchone()
+        query = (time.perf_counter() - start) / len(probes)
+        conn.close()
+        print(f"existence check: may_exist {1e6 * lookup:5.1f} us   SELECT {1e6 * query:5.1f} us")
+
+        variants = {"without index": None, "with index": index}
+        for name in variants:
+            shutil.copy(path, os.path.join(directory, f"{name}.db"))
+        best = {}
+        batches = iter(range(0, len(new), flags.messages))
+        for _ in range(flags.repeat):
+            for name, pid_index in variants.items():
+                start = next(batches)
+                elapsed = insert_new_patients(os.path.join(directory, f"{name}.db"),
+                                              new[start:start + flags.messages], pid_index)
+                best[name] = min(best.get(name, elapsed), elapsed)
+        for name, elapsed in best.items():
+            print(f"process_oru, new patients, {name:<13} {flags.messages / elapsed:8.0f} msgs/s"
+                  f"  {1e6 * elapsed / flags.messages:6.1f} us/msg")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+"""
+bench_populate.py
+
+Time and peak RSS of loading a synthetic history.csv into a fresh
+database (what main.py does on first start):
+
+  - before: the whole file in one DataFrame, the latest result picked per
+            row with dataset.at, an intermediate CSV and DataFrame.to_sql
+  - after:  populate_db.load_history, chunks of HISTORY_CHUNK_CELLS cells,
+            argmax over the date columns, executemany in one transaction
+            with journal_mode = OFF
+
+Each variant runs in its own process, so the peak RSS is its own. The
+row-by-row 'before' loader is slow, so it runs on the first
+--before-patients rows only.
+
+--rss-rows loads the first N rows for each N given and prints the peak RSS
+of both loaders against N: it grows with the file for 'before' and stays
+flat for 'after'. A larger --max-tests makes every row wider.
+
+Usage:
+    python -m benchmarks.bench_populate --patients 1000000 --before-patients 100000
+    python -m benchmarks.bench_populate --patients 400000 --rss-rows 50000 100000 200000 400000
+    python -m benchmarks.bench_populate --patients 50000 --max-tests 200 --before-patients 0
+"""
+import argparse
+import contextlib
+import io
+import multiprocessing
+import os
+import tempfile
+import time
+
+from benchmarks.synthetic import write_history_csv
+
+
+def before(csv_path, db_path, directory):
+    import sqlite3
+    import pandas as pd
+    from database_functionality.populate_db import add_demographics, FEATURE_STORE_COLUMNS
+
+    dataset = pd.read_csv(csv_path)
+    date_cols = [col for col in dataset.columns if "creatinine_date" in col]
+    result_cols = [col.replace("date", "result") for col in date_cols]
+    dataset["creatinine_mean"] = dataset[result_cols].mean(axis=1)
+    dataset["creatinine_max"] = dataset[result_cols].max(axis=1)
+    dataset["creatinine_min"] = dataset[result_cols].min(axis=1)
+    dataset["creatinine_std"] = dataset[result_cols].std(axis=1, ddof=0)
+    dataset[date_cols] = dataset[date_cols].apply(pd.to_datetime, errors="coerce")
+    latest_date_idx = dataset[date_cols].idxmax(axis=1)
+    latest_result_column = latest_date_idx.apply(lambda x: x.replace("date_", "result_") if pd.notna(x) else None)
+    dataset["latest_test_value"] = [dataset.at[idx, col] if pd.notna(col) else None
+                                    for idx, col in zip(dataset.index, latest_result_column)]
+    dataset["latest_test_timestamp"] = [dataset.at[idx, col].strftime("%Y%m%d%H%M%S") if pd.notna(col) else None
+                                        for idx, col in zip(dataset.index, latest_date_idx)]
+    dataset["No_of_Samples"] = dataset[result_cols].notna().sum(axis=1)
+    dataset.drop(columns=date_cols + result_cols, inplace=True)
+    dataset = add_demographics(dataset, use_random=True)
+    dataset.to_csv(os.path.join(directory, "processed_creatinine_data.csv"), index=False)
+
+    conn = sqlite3.connect(db_path)
+    patient_data = dataset[["mrn", "DOB"]].drop_duplicates(subset=["mrn"]).rename(columns={"mrn": "PID"})
+    patient_data["Admission_Status"] = "Pending"
+    fs_dataset = dataset.copy().rename(columns={
+        "mrn": "PID", "creatinine_min": "Min", "creatinine_max": "Max", "creatinine_mean": "Mean",
+        "creatinine_std": "Standard_Deviation", "latest_test_value": "Last_Result_Value",
+        "latest_test_timestamp": "Latest_Result_Timestamp"})
+    fs_dataset[FEATURE_STORE_COLUMNS].to_sql("Feature_Store", conn, if_exists="append", index=False)
+    patient_data.to_sql("Patient_Data", conn, if_exists="append", index=False)
+    conn.commit()
+    conn.close()
+
+
+def after(csv_path, db_path, directory):
+    from database_functionality.populate_db import load_history
+    load_history(csv_path, db_path, use_random=True)
+
+
+def measure(variant, csv_path, directory):
+    """Runs in a child process: load into a new database, return (seconds, rows, peak RSS in MB)."""
+    import sqlite3
+    from database_functionality import create_db
+
+    db_path = os.path.join(directory, f"{variant}.db")
+    with contextlib.redirect_stdout(io.StringIO()):
+        create_db.main(db_path)
+    start = time.perf_counter()
+    globals()[variant](csv_path, db_path, directory)
+    elapsed = time.perf_counter() - start
+    rows = sqlite3.connect(db_path).execute("SELECT COUNT(*) FROM Feature_Store").fetchone()[0]
+    return elapsed, rows, peak_rss()
+
+
+def peak_rss():
+    """Peak RSS of this process in MB (VmHWM: unlike ru_maxrss it is not inherited across fork + exec)."""
+    with open("/proc/self/status") as status:
+        for line in status:
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1]) / 1024
+
+
+def run(variant, csv_path, directory, quiet=False):
+    with multiprocessing.get_context("spawn").Pool(1) as pool:
+        elapsed, rows, rss = pool.apply(measure, (variant, csv_path, directory))
+    os.remove(os.path.join(directory, f"{variant}.db"))
+    if not quiet:
+        print(f"{variant:<7} {rows:>9} rows {elapsed:8.2f} s {rows / elapsed:10.0f} rows/s  peak RSS {rss:7.0f} MB")
+    return rss
+
+
+def head(csv_path, rows, out_path):
+    with open(csv_path) as src, open(out_path, "w") as out:
+        for i, line in enumerate(src):
+            if i > rows:
+                break
+            out.write(line)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--patients", default=1000000, type=int, help="Rows of the synthetic history.csv")
+    parser.add_argument("--before-patients", default=100000, type=int,
+                        help="Rows loaded by the 'before' loader (0: skip it)")
+    parser.add_argument("--rss-rows", default=[], type=int, nargs="+",
+                        help="Print the peak RSS of both loaders for the first N rows, for each N")
+    parser.add_argument("--max-tests", default=10, type=int, help="Creatinine results per patient, at most")
+    parser.add_argument("--directory", default=None, help="Where to create the files (default: a temp dir)")
+    flags = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(dir=flags.directory) as directory:
+        csv_path = os.path.join(directory, "history.csv")
+        start = time.perf_counter()
+        write_history_csv(csv_path, flags.patients, max_tests=flags.max_tests)
+        print(f"history.csv: {flags.patients} patients, {os.path.getsize(csv_path) / 2**20:.0f} MB "
+              f"(generated in {time.perf_counter() - start:.1f} s)")
+
+        small_path = os.path.join(directory, "history-small.csv")
+        if flags.rss_rows:
+            print(f"{'rows':>9} {'before MB':>10} {'after MB':>10}")
+            for rows in flags.rss_rows:
+                head(csv_path, rows, small_path)
+                print(f"{rows:>9} {run('before', small_path, directory, quiet=True):10.0f} "
+                      f"{run('after', small_path, directory, quiet=True):10.0f}")
+            return
+
+        if flags.before_patients:
+            head(csv_path, flags.before_patients, small_path)
+            run("before", small_path, directory)
+            run("after", small_path, directory)
+        run("after", csv_path, directory)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+bench_schema.py
+
+Feature_Store lookup and update cost on the version 1 schema (TEXT PID,
+TEXT timestamps with LIKE checks, rowid tables) and on version 2
+(schema.py: INTEGER PID, epoch timestamps, WITHOUT ROWID), with the
+connection PRAGMAS of db_operations. PIDs are bound as str, as they come
+out of the HL7 parser ('v2 int' binds them as int). The version 2
+database is the version 1 one upgraded by migrate.upgrade, which is timed
+as well. The variants take turns --repeat times and the best time of each
+is printed (the first passes also pay for page cache and WAL warm-up).
+
+Usage:
+    python -m benchmarks.bench_schema --patients 200000 --operations 50000
+"""
+import argparse
+import contextlib
+import io
+import os
+import random
+import shutil
+import sqlite3
+import tempfile
+import time
+
+from database_functionality import migrate
+from database_functionality.db_operations import PRAGMAS, UPDATE_FEATURE_STORE_SQL
+from database_functionality.schema import to_epoch
+
+
+def populate_v1(path, patients):
+    conn = sqlite3.connect(path)
+    conn.executescript(migrate.V1_TABLES_SQL)
+    conn.executemany("INSERT INTO Patient_Data VALUES (?, 'Pending', '202401010000', '19700101')",
+                     ((pid,) for pid in range(1, patients + 1)))
+    conn.executemany("INSERT INTO Feature_Store VALUES (?, 1, 40, 60, 140, 100, 20, 120, '20240101120000', 5, 'No')",
+                     ((str(pid),) for pid in range(1, patients + 1)))
+    conn.commit()
+    conn.close()
+
+
+def run(path, pids, timestamp):
+    conn = sqlite3.connect(path)
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
+
+    start = time.perf_counter()
+    for pid in pids:
+        conn.execute("SELECT * FROM Feature_Store WHERE PID = ?", (pid,)).fetchone()
+    lookup = (time.perf_counter() - start) / len(pids)
+
+    start = time.perf_counter()
+    for pid in pids:
+        with conn:
+            conn.execute(UPDATE_FEATURE_STORE_SQL, (1, 40, 60, 140, 100, 20, 130, timestamp, 6, "No", pid))
+    update = (time.perf_counter() - start) / len(pids)
+    conn.close()
+    return lookup, update
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--patients", default=200000, type=int, help="Patients in the database")
+    parser.add_argument("--operations", default=50000, type=int, help="Lookups and updates timed, each")
+    parser.add_argument("--repeat", default=3, type=int, help="Runs of each variant, the best is kept")
+    flags = parser.parse_args()
+
+    pids = [str(random.randint(1, flags.patients)) for _ in range(flags.operations)]
+    with tempfile.TemporaryDirectory() as directory:
+        v1_path = os.path.join(directory, "v1.db")
+        v2_path = os.path.join(directory, "v2.db")
+        populate_v1(v1_path, flags.patients)
+        shutil.copy(v1_path, v2_path)
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            migrate.upgrade(v2_path)
+        print(f"{flags.patients} patients, upgraded to version 2 in {time.perf_counter() - start:.2f} s")
+
+        variants = (("v1", v1_path, pids, "20240102120000"),
+                    ("v2", v2_path, pids, to_epoch("20240102120000")),
+                    ("v2 int", v2_path, [int(pid) for pid in pids], to_epoch("20240102120000")))
+        best = {}
+        for _ in range(flags.repeat):
+            for name, path, keys, timestamp in variants:
+                lookup, update = run(path, keys, timestamp)
+                best[name] = tuple(map(min, zip(best.get(name, (lookup, update)), (lookup, update))))
+
+        for name, path, keys, timestamp in variants:
+            lookup, update = best[name]
+            print(f"{name:<7} lookup {1e6 * lookup:6.1f} us  update {1e6 * update:6.1f} us  "
+                  f"file {os.path.getsize(path) / 2**20:6.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+synthetic.py
+
+Helpers to generate synthetic HL7 traffic for the benchmarks, in the same
+shape as the messages replayed by simulator.py.
+"""
+import random
+from datetime import datetime, timedelta
+
+from utils import MLLP_START_OF_BLOCK, MLLP_END_OF_BLOCK, MLLP_CARRIAGE_RETURN
+
+START = datetime(2024, 1, 1)
+
+
+def adt_a01(mrn, when, rng):
+    dob = (when - timedelta(days=rng.randint(18 * 365, 90 * 365))).strftime("%Y%m%d")
+    return [
+        f"MSH|^~\\&|SIMULATION|SOUTH RIVERSIDE|||{when:%Y%m%d%H%M%S}||ADT^A01|||2.5",
+        f"PID|1||{mrn}||PATIENT {mrn}||{dob}|{rng.choice('MF')}",
+        "NK1|1|NEXT OF KIN|PARTNER",
+    ]
+
+
+def oru_r01(mrn, when, rng):
+    return [
+        f"MSH|^~\\&|SIMULATION|SOUTH RIVERSIDE|||{when:%Y%m%d%H%M%S}||ORU^R01|||2.5",
+        f"PID|1||{mrn}",
+        f"OBR|1||||||{when:%Y%m%d%H%M%S}",
+        f"OBX|1|SN|CREATININE||{rng.uniform(40, 400):.2f}",
+    ]
+
+
+def adt_a03(mrn, when, rng):
+    return [
+        f"MSH|^~\\&|SIMULATION|SOUTH RIVERSIDE|||{when:%Y%m%d%H%M%S}||ADT^A03|||2.5",
+        f"PID|1||{mrn}",
+    ]
+
+
+def hl7_messages(count, patients=1000, mix=(0.2, 0.7, 0.1), seed=0):
+    """
+    Yield 'count' raw HL7 messages (bytes, segments separated by \\r) for
+    'patients' distinct MRNs. 'mix' is the (ADT^A01, ORU^R01, ADT^A03) ratio.
+    """
+    rng = random.Random(seed)
+    mrns = [str(100000000 + rng.randrange(900000000)) for _ in range(patients)]
+    builders = (adt_a01, oru_r01, adt_a03)
+    when = START
+    for _ in range(count):
+        when += timedelta(minutes=rng.randint(1, 30))
+        builder = rng.choices(builders, weights=mix)[0]
+        segments = builder(rng.choice(mrns), when, rng)
+        yield ("\r".join(segments) + "\r").encode("ascii")
+
+
+def to_mllp(message):
+    """Wrap a raw HL7 message with MLLP framing."""
+    return bytes([MLLP_START_OF_BLOCK]) + message + bytes([MLLP_END_OF_BLOCK, MLLP_CARRIAGE_RETURN])
+
+
+def mllp_stream(size_bytes, **kwargs):
+    """Return an MLLP byte stream of at least 'size_bytes' bytes."""
+    frames = []
+    total = 0
+    seed = kwargs.pop("seed", 0)
+    while total < size_bytes:
+        for message in hl7_messages(1000, seed=seed, **kwargs):
+            frames.append(to_mllp(message))
+            total += len(frames[-1])
+            if total >= size_bytes:
+                break
+        seed += 1
+    return b"".join(frames)
+
+
+def write_history_csv(path, patients, max_tests=10, chunk_rows=100000, seed=0):
+    """
+    Write a history.csv with 'patients' rows: the MRN, then up to 'max_tests'
+    creatinine_date_i/creatinine_result_i pairs (at least one per patient).
+    """
+    import numpy as np
+    import pandas as pd
+
+    rng = np.random.default_rng(seed)
+    with open(path, "w", newline="") as out:
+        for first in range(0, patients, chunk_rows):
+            rows = min(chunk_rows, patients - first)
+            tests = rng.integers(1, max_tests + 1, rows)
+            columns = {"mrn": np.arange(100000000 + first, 100000000 + first + rows)}
+            when = np.datetime64(START, "s") + rng.integers(0, 3600, rows).astype("timedelta64[s]")
+            for i in range(max_tests):
+                when = when + rng.integers(3600, 30 * 86400, rows).astype("timedelta64[s]")
+                missing = i >= tests
+                dates = np.char.replace(np.datetime_as_string(when, unit="s"), "T", " ")
+                columns[f"creatinine_date_{i}"] = np.where(missing, "", dates)
+                columns[f"creatinine_result_{i}"] = np.where(missing, np.nan, rng.uniform(40, 400, rows).round(2))
+            pd.DataFrame(columns).to_csv(out, index=False, header=first == 0)
@@ -13,13 +13,15 @@ Date: 01/02/2025
 import sqlite3
 import os
 
-def main():
+from database_functionality import migrate
+from database_functionality.schema import create_tables
 
-    # Set the database path inside the persistent volume
-    db_path = os.path.join("/state", "patient_database.db")
+def main(db_path=os.path.join("/state", "patient_database.db")):
+    # db_path defaults to the database inside the persistent volume
 
     if os.path.exists(db_path):
         print(f"Database already exists at {db_path}, skipping creation.")
+        migrate.upgrade(db_path)  # apply the pending schema migrations, keeping the data
         return 1
     else:
         conn = sqlite3.connect(db_path)
@@ -28,32 +30,8 @@ def main():
         # Enable foreign keys (IMPORTANT)
         cursor.execute("PRAGMA foreign_keys = ON")
 
-        # Create a 'Patient_Data' table
-        cursor.execute("""
-        CREATE TABLE IF NOT EXISTS Patient_Data (
-            PID INTEGER PRIMARY KEY,
-            Admission_Status TEXT NOT NULL CHECK (Admission_Status IN ('Yes', 'No', 'Pending')),
-            Admission_Date TEXT NULL CHECK (Admission_Date LIKE '____________'),
-            DOB TEXT NULL CHECK (DOB LIKE '________'));
-        """)
-
-        # Create the 'Feature_Store' table
-        cursor.execute("""
-        CREATE TABLE IF NOT EXISTS Feature_Store (
-            PID TEXT PRIMARY KEY,  -- Foreign key from Patient_Data
-            Sex FLOAT CHECK (Sex IN (0, 1)),  -- 0: Male, 1: Female. NULL if receive LIMS before PAS
-            Age INTEGER CHECK (Age > 0), -- NULL if receive LIMS before PAS. Need to be computed from DOB in Patient Data
-            Min FLOAT,
-            Max FLOAT,
-            Mean FLOAT,
-            Standard_Deviation FLOAT,
-            Last_Result_Value FLOAT,
-            Latest_Result_Timestamp TEXT CHECK (Latest_Result_Timestamp LIKE '______________'),
-            No_of_Samples INTEGER ,
-            Ready_for_Inference TEXT NOT NULL CHECK (Ready_for_Inference IN ('Yes', 'No')),
-            FOREIGN KEY (PID) REFERENCES Patient_Data (PID) ON DELETE CASCADE
-        );
-        """)
+        # Create the 'Patient_Data' and 'Feature_Store' tables (see schema.py)
+        create_tables(conn)
 
         # # Create the 'Outbox' table
         # cursor.execute("""
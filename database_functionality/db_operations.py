@@ -1,16 +1,140 @@
 import sqlite3
 import os
-from monitoring.metrics import record_error, monitor_db_operation
+import threading
+import time
+from database_functionality.schema import decode_feature, to_epoch
+from monitoring.metrics import record_error, monitor_db_operation, DB_RECONNECTS
 
 # Get database path
 db_path = os.path.join("/state", "patient_database.db")
 
+# Connection tuning, applied once per connection
+PRAGMAS = (
+    "PRAGMA journal_mode = WAL",      # readers don't block the writer, one fsync per checkpoint
+    "PRAGMA synchronous = NORMAL",    # durable in WAL mode, no fsync on every commit
+    "PRAGMA cache_size = -16000",     # 16 MB page cache
+    "PRAGMA mmap_size = 67108864",    # 64 MB memory-mapped reads
+    "PRAGMA temp_store = MEMORY",
+)
+STATEMENT_CACHE_SIZE = 256
+HEALTH_CHECK_INTERVAL = 30  # seconds
+
+
+class ConnectionPool:
+    """
+    Long-lived SQLite connections, one per thread, opened on first use with
+    PRAGMAS applied and a prepared-statement cache.
+
+    A connection is health checked (SELECT 1) at most every
+    HEALTH_CHECK_INTERVAL seconds and reopened if the check fails or if an
+    operation on it raised a non-integrity database error (see discard).
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+
+    def _open(self):
+        conn = sqlite3.connect(self.path, cached_statements=STATEMENT_CACHE_SIZE)
+        for pragma in PRAGMAS:
+            conn.execute(pragma)
+        self._local.conn = conn
+        self._local.checked_at = time.monotonic()
+        return conn
+
+    def connection(self):
+        """Return this thread's connection, (re)opening it if needed."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            return self._open()
+        if time.monotonic() - self._local.checked_at > HEALTH_CHECK_INTERVAL:
+            try:
+                conn.execute("SELECT 1").fetchone()
+                self._local.checked_at = time.monotonic()
+            except sqlite3.Error as e:
+                print(f"[db] Health check failed: {e}, reopening connection")
+                self.discard()
+                return self._open()
+        return conn
+
+    def discard(self, error=None):
+        """
+        Close this thread's connection so the next call reopens it. If an
+        error is given, only do so for errors that may leave the connection
+        unusable (integrity errors are a problem with the data, not the
+        connection).
+        """
+        if error is not None and (isinstance(error, sqlite3.IntegrityError)
+                                  or not isinstance(error, sqlite3.DatabaseError)):
+            return
+        conn = getattr(self._local, "conn", None)
+        self._local.conn = None
+        if conn is not None:
+            DB_RECONNECTS.inc()
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+
+
+pool = ConnectionPool(db_path)
+
+# Optional in-memory write-back cache (see feature_cache.py), installed by enable_feature_cache
+cache = None
+
+
+def enable_feature_cache(feature_cache):
+    """Serve the handlers below from 'feature_cache' (or from SQLite again if None)."""
+    global cache
+    cache = feature_cache
+
+# Optional group commit of ORU writes (see group_commit.py), installed by enable_group_commit
+writer = None
+
+
+def enable_group_commit(group_writer):
+    """Buffer process_oru writes in 'group_writer' (or commit per message again if None)."""
+    global writer
+    writer = group_writer
+
+
+# Optional index of the known PIDs (see pid_index.py), installed by enable_pid_index
+pids = None
+
+
+def enable_pid_index(pid_index):
+    """Skip the existence queries for PIDs that 'pid_index' knows to be new (or always query again if None)."""
+    global pids
+    pids = pid_index
+
+
+def is_new_patient(patient_id):
+    """True if the PID index knows 'patient_id' is not in the database yet."""
+    return pids is not None and not pids.may_exist(patient_id)
+
+
+def remember_patient(patient_id):
+    """Add a patient just inserted into Patient_Data to the PID index."""
+    if pids is not None:
+        pids.add(patient_id)
+
+
+def fetch_feature(cursor, patient_id):
+    """The Feature_Store record of 'patient_id' as a dict, or None (without a query for a new patient)."""
+    if is_new_patient(patient_id):
+        return None
+    cursor.execute("SELECT * FROM Feature_Store WHERE PID = ?", (patient_id,))
+    record = cursor.fetchone()
+    if record is None:
+        return None
+    columns = [desc[0] for desc in cursor.description]
+    return decode_feature(columns, record)
 
 
 def connect_db():
-    """Establish a connection to SQLite database."""
+    """Return the persistent connection to SQLite database for this thread."""
     try:
-        return sqlite3.connect(db_path)
+        return pool.connection()
     except Exception as e:
         print(f"[db] Exception: {e}")
 
@@ -24,10 +148,18 @@ def handle_adt_a01(data):
         sex = sex_mapping.get(sex_key)  # Safe mapping; returns None if key not found
         print("Handling ADT")
 
+        if cache is not None:
+            return cache.handle_adt_a01(data)
+        if writer is not None:
+            writer.commit()  # ADT writes go straight to SQLite, after the buffered ORU writes
+
         with connect_db() as conn:
             cursor = conn.cursor()
-            cursor.execute("SELECT * FROM Patient_Data WHERE PID = ?", (patient_id,))
-            record = cursor.fetchone()
+            if is_new_patient(patient_id):
+                record = None
+            else:
+                cursor.execute("SELECT * FROM Patient_Data WHERE PID = ?", (patient_id,))
+                record = cursor.fetchone()
 
             # If the record exists, prepare to update it
             if record:
@@ -38,8 +170,8 @@ def handle_adt_a01(data):
                 if sex is None and age is None:
                     return None
 
-                # Update Admission_Status in Patient_Data
-                cursor.execute("UPDATE Patient_Data SET Admission_Status = ?", ('Yes',))
+                # Update Admission_Status in Patient_Data (this patient's row only)
+                cursor.execute("UPDATE Patient_Data SET Admission_Status = ? WHERE PID = ?", ('Yes', patient_id))
 
                 # Update Feature_Store based on the provided values
                 if sex is not None and age is not None:
@@ -57,7 +189,7 @@ def handle_adt_a01(data):
                 cursor.execute("SELECT * FROM Feature_Store WHERE PID = ?", (patient_id,))
                 updated_record = cursor.fetchone()
                 columns = [desc[0] for desc in cursor.description]
-                return dict(zip(columns, updated_record))
+                return decode_feature(columns, updated_record)
 
             # If no record exists, admit the patient for the first time.
             else:
@@ -72,10 +204,34 @@ def handle_adt_a01(data):
                     VALUES (?, ?, ?, NULL, NULL, NULL, NULL, NULL, NULL, 0, 'No');
                 """, (patient_id, sex, age))
                 conn.commit()
+                remember_patient(patient_id)
                 return None
     
     except Exception as e:
         print(f"[db] Exception: {e}")
+        pool.discard(e)
+
+@monitor_db_operation("handle_adt_a03")
+def handle_adt_a03(data):
+    """
+    Handles ADT^A03 signal - Patient Discharge. The patient's history is
+    kept (it is needed again on readmission); only Admission_Status is set
+    to 'No', which takes them out of the admitted census.
+    """
+    try:
+        patient_id, = data
+        print("Handling discharge")
+
+        if cache is not None:
+            return cache.handle_adt_a03(data)
+        if writer is not None:
+            writer.commit()  # ADT writes go straight to SQLite, after the buffered ORU writes
+
+        with connect_db() as conn:
+            conn.execute("UPDATE Patient_Data SET Admission_Status = 'No' WHERE PID = ?", (patient_id,))
+    except Exception as e:
+        print(f"[db] Exception: {e}")
+        pool.discard(e)
 
 # def handle_adt_a01(data):
 #     """Handles ADT^A01 signal - Patient Admission."""
@@ -103,6 +259,24 @@ def handle_adt_a01(data):
 #         conn.commit()
 
 
+def insert_oru_patient(cursor, data):
+    """Insert a patient first seen in an ORU message into Patient_Data and Feature_Store."""
+    patient_id, latest_result, latest_result_test_date = data
+
+    # Insert patient into Patient_Data (if missing)
+    cursor.execute("""
+        INSERT INTO Patient_Data (PID, Admission_Status, DOB, Admission_Date)
+        VALUES (?, 'Pending', NULL, NULL);
+    """, (patient_id,))
+
+    # Insert new record into Feature_Store
+    cursor.execute("""
+        INSERT INTO Feature_Store (PID, Sex, Age, Min, Max, Mean, Standard_Deviation,
+                                Last_Result_Value, Latest_Result_Timestamp, No_of_Samples, Ready_for_Inference)
+        VALUES (?, NULL, NULL, NULL, NULL, NULL, NULL, ?, ?, 1, 'No');
+    """, (patient_id, latest_result, to_epoch(latest_result_test_date)))
+    remember_patient(patient_id)  # if the transaction is rolled back, the index only costs a query
+
 @monitor_db_operation("handle_oru_a01")
 def handle_oru_a01(data):
     """Handles ORU^A01 signal - Lab Result Update and returns existing record for feature reconstruction."""
@@ -111,35 +285,47 @@ def handle_oru_a01(data):
 
         print("Handling ORU")
 
+        if cache is not None:
+            return cache.handle_oru_a01(data)
+
         with connect_db() as conn:
             cursor = conn.cursor()
 
             # Check if patient exists in Feature_Store
-            cursor.execute("SELECT * FROM Feature_Store WHERE PID = ?", (patient_id,))
-            record = cursor.fetchone()
+            record = fetch_feature(cursor, patient_id)
 
             if record:
-                # Get column names from cursor description
-                columns = [desc[0] for desc in cursor.description]
-                return dict(zip(columns, record))  # Return as dictionary for feature reconstruction
+                return record  # Return as dictionary for feature reconstruction
             else:
-                # Insert patient into Patient_Data (if missing)
-                cursor.execute("""
-                    INSERT INTO Patient_Data (PID, Admission_Status, DOB, Admission_Date)
-                    VALUES (?, 'Pending', NULL, NULL);
-                """, (patient_id,))
-
-                # Insert new record into Feature_Store
-                cursor.execute("""
-                    INSERT INTO Feature_Store (PID, Sex, Age, Min, Max, Mean, Standard_Deviation,
-                                            Last_Result_Value, Latest_Result_Timestamp, No_of_Samples, Ready_for_Inference)
-                    VALUES (?, NULL, NULL, NULL, NULL, NULL, NULL, ?, ?, 1, 'No');
-                """, (patient_id, latest_result, latest_result_test_date))
-
+                insert_oru_patient(cursor, data)
                 conn.commit()
                 return None  # Return None when patient was missing and newly added
     except Exception as e:
         print(f"[db] Exception: {e}")
+        pool.discard(e)
+
+UPDATE_FEATURE_STORE_SQL = """
+    UPDATE Feature_Store
+    SET Sex = ?, Age = ?, Min = ?, Max = ?, Mean = ?, Standard_Deviation = ?,
+        Last_Result_Value = ?, Latest_Result_Timestamp = ?, No_of_Samples = ?, Ready_for_Inference = ?
+    WHERE PID = ?;
+"""
+
+def feature_store_row(pid, new_feature):
+    """Parameters of UPDATE_FEATURE_STORE_SQL for a feature dict."""
+    return (
+        new_feature.get("Sex"),
+        new_feature.get("Age"),
+        new_feature.get("Min"),
+        new_feature.get("Max"),
+        new_feature.get("Mean"),
+        new_feature.get("Standard_Deviation"),
+        new_feature.get("Last_Result_Value"),
+        to_epoch(new_feature.get("Latest_Result_Timestamp")),
+        new_feature.get("No_of_Samples"),
+        new_feature.get("Ready_for_Inference"),
+        pid
+    )
 
 @monitor_db_operation("update_feature_store")
 def update_feature_store(pid, new_feature):
@@ -147,26 +333,73 @@ def update_feature_store(pid, new_feature):
     Update the Feature_Store table with the latest feature values for a given patient ID.
     """
     try:
+        if cache is not None:
+            return cache.put(pid, new_feature)
+
         with connect_db() as conn:
             cursor = conn.cursor()
-            cursor.execute("""
-                UPDATE Feature_Store
-                SET Sex = ?, Age = ?, Min = ?, Max = ?, Mean = ?, Standard_Deviation = ?,
-                    Last_Result_Value = ?, Latest_Result_Timestamp = ?, No_of_Samples = ?, Ready_for_Inference = ?
-                WHERE PID = ?;
-            """, (
-                new_feature.get("Sex"),
-                new_feature.get("Age"),
-                new_feature.get("Min"),
-                new_feature.get("Max"),
-                new_feature.get("Mean"),
-                new_feature.get("Standard_Deviation"),
-                new_feature.get("Last_Result_Value"),
-                new_feature.get("Latest_Result_Timestamp"),
-                new_feature.get("No_of_Samples"),
-                new_feature.get("Ready_for_Inference"),
-                pid
-            ))
+            cursor.execute(UPDATE_FEATURE_STORE_SQL, feature_store_row(pid, new_feature))
             conn.commit()
     except Exception as e:
         print(f"[db] Exception: {e}")
+        pool.discard(e)
+
+@monitor_db_operation("process_oru")
+def process_oru(data, update_feature):
+    """
+    Handles ORU^R01 signal as one read-modify-write transaction on one connection:
+    looks up the patient's Feature_Store record, passes it to
+    update_feature(old_feature) -> new_feature and stores the result.
+
+    A patient seen for the first time is inserted as in handle_oru_a01 and
+    update_feature is not called. update_feature runs inside the
+    transaction, holding the write lock, so it should only compute the new
+    row: inference and paging belong after process_oru returns. If it
+    raises, the transaction is rolled back and the exception propagates.
+    A database error also propagates, after the connection is discarded,
+    so the message is not ACKed and is redelivered.
+
+    Returns the stored feature dict, or None for a new patient.
+    """
+    try:
+        patient_id, latest_result, latest_result_test_date = data
+
+        print("Handling ORU")
+
+        if cache is not None:
+            return cache.process_oru(data, update_feature)
+        if writer is not None:
+            return process_oru_buffered(data, update_feature)
+
+        conn = connect_db()
+        conn.execute("BEGIN IMMEDIATE")  # take the write lock before reading
+        with conn:
+            cursor = conn.cursor()
+            record = fetch_feature(cursor, patient_id)
+
+            if record is None:
+                insert_oru_patient(cursor, data)
+                return None
+
+            new_feature = update_feature(record)
+            cursor.execute(UPDATE_FEATURE_STORE_SQL, feature_store_row(patient_id, new_feature))
+            return new_feature  # committed on leaving the with block
+    except sqlite3.Error as e:
+        print(f"[db] Exception: {e}")
+        pool.discard(e)
+        raise  # nothing was written: the message must not be ACKed
+
+def process_oru_buffered(data, update_feature):
+    """process_oru with the write buffered in the group-commit writer."""
+    patient_id = data[0]
+    record = fetch_feature(connect_db().cursor(), patient_id)
+
+    old_feature = writer.merge(patient_id, record)
+    if old_feature is None:
+        writer.insert(data)
+        remember_patient(patient_id)
+        return None
+
+    new_feature = update_feature(old_feature)
+    writer.update(patient_id, new_feature)
+    return new_feature
@@ -0,0 +1,331 @@
+"""
+feature_cache.py
+
+In-process write-back cache of the Feature_Store and Patient_Data tables.
+
+Lookups by PID are served from memory. Every write is first appended to a
+write-ahead journal file (one JSON line per write, fsync'ed), then applied
+in memory and flushed to SQLite in batches: after 'flush_rows' dirty
+patients, or once the oldest unflushed write is 'max_staleness' seconds
+old. After a successful flush the journal is truncated; on startup any
+journal left behind by a crash is replayed into SQLite before the cache is
+warmed, so no acknowledged write is lost.
+
+The cache holds the ward census rather than all of history: the admitted
+patients are warmed at startup (through the Patient_Data_Admitted partial
+index), other patients are read through from SQLite on first use, and
+patients that are not admitted - discharged, or only seen in ORU
+messages - are evicted once their writes have been flushed.
+
+The handlers in db_operations route through the cache once it has been
+installed with db_operations.enable_feature_cache.
+"""
+import json
+import os
+import threading
+import time
+
+from database_functionality.schema import ADMITTED_PIDS_SQL, FEATURE_COLUMNS, from_epoch, to_epoch
+from monitoring.metrics import (monitor_db_operation, FEATURE_CACHE_PATIENTS, FEATURE_CACHE_DIRTY,
+                                FEATURE_CACHE_EVICTIONS, FEATURE_CACHE_MISSES)
+
+SELECT_FEATURE_SQL = f"SELECT {', '.join(FEATURE_COLUMNS)} FROM Feature_Store WHERE PID = ?"
+SELECT_ADMITTED_FEATURES_SQL = f"SELECT {', '.join(FEATURE_COLUMNS)} FROM Feature_Store WHERE PID IN ({ADMITTED_PIDS_SQL})"
+
+PATIENT_UPSERT_SQL = """
+    INSERT INTO Patient_Data (PID, Admission_Status) VALUES (?, ?)
+    ON CONFLICT(PID) DO UPDATE SET Admission_Status = excluded.Admission_Status;
+"""
+
+FEATURE_UPSERT_SQL = """
+    INSERT INTO Feature_Store ({columns}) VALUES ({placeholders})
+    ON CONFLICT(PID) DO UPDATE SET {updates};
+""".format(
+    columns=", ".join(FEATURE_COLUMNS),
+    placeholders=", ".join("?" * len(FEATURE_COLUMNS)),
+    updates=", ".join(f"{col} = excluded.{col}" for col in FEATURE_COLUMNS[1:]),
+)
+
+# Stored as epoch seconds, kept in memory (and in the journal) as 'YYYYMMDDHHMMSS'
+TIMESTAMP_INDEX = FEATURE_COLUMNS.index("Latest_Result_Timestamp")
+
+SEX_MAPPING = {"M": 0, "F": 1}
+
+
+def cached_row(stored):
+    """Feature_Store row as fetched -> as cached (PID as str, timestamp as 'YYYYMMDDHHMMSS')."""
+    row = list(stored)
+    row[0] = str(row[0])
+    row[TIMESTAMP_INDEX] = from_epoch(row[TIMESTAMP_INDEX])
+    return tuple(row)
+
+
+def stored_row(cached):
+    """Cached (or journaled) row -> parameters of FEATURE_UPSERT_SQL."""
+    row = list(cached)
+    row[TIMESTAMP_INDEX] = to_epoch(row[TIMESTAMP_INDEX])
+    return row
+
+
+class FeatureCache:
+    """
+    Write-back cache keyed by PID (as str). Feature_Store rows are kept as
+    tuples in FEATURE_COLUMNS order and handed out as fresh dicts.
+    """
+
+    def __init__(self, connect, journal_path, flush_rows=500, max_staleness=1.0, fsync=True, pids=None):
+        self.connect = connect              # returns a sqlite3 connection for the calling thread
+        self.pids = pids                    # optional pid_index.PidIndex: no read-through for new patients
+        self.journal_path = journal_path
+        self.flush_rows = flush_rows
+        self.max_staleness = max_staleness  # seconds
+        self.fsync = fsync
+
+        self._features = {}   # PID -> Feature_Store row tuple
+        self._status = {}     # PID -> Admission_Status
+        self._dirty = set()   # PIDs written since the last flush
+        self._cold = set()    # PIDs read through since the last flush, evicted unless admitted
+        self._oldest_dirty = None
+        self._lock = threading.RLock()
+        self._stop = threading.Event()
+        self._flusher = None
+        self._journal = None
+
+    # ------------------------------------------------------------------
+    # Startup and shutdown
+    # ------------------------------------------------------------------
+
+    def open(self):
+        """Replay a leftover journal, warm the cache and open a fresh journal."""
+        replayed = self.recover()
+        if replayed:
+            print(f"[feature_cache] Replayed {replayed} journal entries")
+        self.warm()
+        self._journal = open(self.journal_path, "a", encoding="utf-8")
+        return self
+
+    def recover(self):
+        """Apply the writes of an existing journal to SQLite. Returns the number applied."""
+        if not os.path.exists(self.journal_path):
+            return 0
+        entries = {}
+        with open(self.journal_path, encoding="utf-8") as journal:
+            for line in journal:
+                try:
+                    pid, status, row = json.loads(line)
+                except ValueError:
+                    break  # torn last write: it was never acknowledged
+                entries[pid] = (status, row)  # later writes supersede earlier ones
+        if entries:
+            self._write(entries)
+        os.truncate(self.journal_path, 0)
+        return len(entries)
+
+    def warm(self):
+        """Load the admitted patients' Patient_Data and Feature_Store rows into memory."""
+        conn = self.connect()
+        with self._lock:
+            self._status = {str(pid): "Yes" for (pid,) in conn.execute(ADMITTED_PIDS_SQL)}
+            self._features = {str(row[0]): cached_row(row) for row in conn.execute(SELECT_ADMITTED_FEATURES_SQL)}
+            FEATURE_CACHE_PATIENTS.set(len(self._features))
+
+    def start_flusher(self):
+        """Flush from a background thread so staleness stays bounded when traffic stops."""
+        self._flusher = threading.Thread(target=self._run_flusher, name="feature-cache-flusher", daemon=True)
+        self._flusher.start()
+
+    def _run_flusher(self):
+        while not self._stop.wait(self.max_staleness / 2):
+            try:
+                self.flush_if_due()
+            except Exception as e:
+                print(f"[feature_cache] Flush error: {e}")
+
+    def close(self):
+        """Stop the flusher and write everything back to SQLite."""
+        self._stop.set()
+        if self._flusher is not None:
+            self._flusher.join()
+        self.flush()
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+
+    # ------------------------------------------------------------------
+    # Reads
+    # ------------------------------------------------------------------
+
+    def get(self, pid):
+        """Return the Feature_Store record of 'pid' as a dict, or None."""
+        pid = str(pid)
+        with self._lock:
+            self._load(pid)
+            row = self._features.get(pid)
+        return None if row is None else dict(zip(FEATURE_COLUMNS, row))
+
+    def _load(self, pid):
+        """Read a patient that is not cached through from SQLite (a no-op for a new patient)."""
+        if pid in self._status or pid in self._features:
+            return
+        if self.pids is not None and not self.pids.may_exist(pid):
+            return
+        FEATURE_CACHE_MISSES.inc()
+        conn = self.connect()
+        status = conn.execute("SELECT Admission_Status FROM Patient_Data WHERE PID = ?", (pid,)).fetchone()
+        row = conn.execute(SELECT_FEATURE_SQL, (pid,)).fetchone()
+        if status is not None:
+            self._status[pid] = status[0]
+        if row is not None:
+            self._features[pid] = cached_row(row)
+        if status is not None or row is not None:
+            self._cold.add(pid)
+            FEATURE_CACHE_PATIENTS.set(len(self._features))
+
+    def __contains__(self, pid):
+        return str(pid) in self._status or str(pid) in self._features
+
+    def __len__(self):
+        return len(self._features)
+
+    # ------------------------------------------------------------------
+    # Message handlers (same results as the SQL versions in db_operations)
+    # ------------------------------------------------------------------
+
+    def handle_adt_a01(self, data):
+        """ADT^A01 - Patient Admission. Returns the updated record for a known patient."""
+        patient_id, age, sex_key = data
+        pid = str(patient_id)
+        sex = SEX_MAPPING.get(sex_key)
+        with self._lock:
+            self._load(pid)
+            if pid in self:
+                if sex is None and age is None:
+                    return None
+                feature = self.get(pid)
+                if feature is not None:
+                    if sex is not None:
+                        feature["Sex"] = sex
+                    if age is not None:
+                        feature["Age"] = age
+                self.put(pid, feature, status="Yes")
+                return feature
+
+            feature = dict.fromkeys(FEATURE_COLUMNS)
+            feature.update(PID=pid, Sex=sex, Age=age, No_of_Samples=0, Ready_for_Inference="No")
+            self.put(pid, feature, status="Yes")
+            return None
+
+    def handle_adt_a03(self, data):
+        """ADT^A03 - Patient Discharge. The patient is evicted once the new status is flushed."""
+        pid = str(data[0])
+        with self._lock:
+            self._load(pid)
+            if pid in self:
+                self.put(pid, None, status="No")
+
+    def handle_oru_a01(self, data):
+        """ORU^R01 - returns the existing record, or inserts a new patient and returns None."""
+        patient_id, latest_result, latest_result_test_date = data
+        pid = str(patient_id)
+        with self._lock:
+            feature = self.get(pid)
+            if feature is None:
+                feature = dict.fromkeys(FEATURE_COLUMNS)
+                feature.update(PID=pid, Last_Result_Value=latest_result,
+                               Latest_Result_Timestamp=latest_result_test_date,
+                               No_of_Samples=1, Ready_for_Inference="No")
+                self.put(pid, feature, status=self._status.get(pid, "Pending"))
+                return None
+            return feature
+
+    def process_oru(self, data, update_feature):
+        """
+        ORU^R01 read-modify-write, see db_operations.process_oru. The cache
+        lock is held while update_feature computes the new row, so it must
+        not call the model or the pager: the caller does that once this
+        returns, and flushes and other patients do not wait behind it.
+        """
+        with self._lock:
+            old_feature = self.handle_oru_a01(data)
+            if old_feature is None:
+                return None
+            new_feature = update_feature(old_feature)
+            self.put(data[0], new_feature)
+            return new_feature
+
+    # ------------------------------------------------------------------
+    # Writes
+    # ------------------------------------------------------------------
+
+    def put(self, pid, feature, status=None):
+        """
+        Journal and apply a write for 'pid': its Feature_Store record (dict,
+        or None to leave it unchanged) and optionally its Admission_Status.
+        """
+        pid = str(pid)
+        with self._lock:
+            status = status or self._status.get(pid)
+            row = None if feature is None else (pid,) + tuple(feature.get(col) for col in FEATURE_COLUMNS[1:])
+            if row is None:
+                row = self._features.get(pid)
+
+            self._journal.write(json.dumps([pid, status, row]) + "\n")
+            self._journal.flush()
+            if self.fsync:
+                os.fsync(self._journal.fileno())
+
+            if status is not None:
+                self._status[pid] = status
+                if self.pids is not None:
+                    self.pids.add(pid)  # its Patient_Data row is written by the next flush
+            if row is not None:
+                self._features[pid] = row
+            if not self._dirty:
+                self._oldest_dirty = time.monotonic()
+            self._dirty.add(pid)
+            FEATURE_CACHE_PATIENTS.set(len(self._features))
+            FEATURE_CACHE_DIRTY.set(len(self._dirty))
+
+            if len(self._dirty) >= self.flush_rows:
+                self.flush()
+
+    def flush_if_due(self):
+        """Flush if the oldest unflushed write is older than max_staleness."""
+        with self._lock:
+            if self._dirty and time.monotonic() - self._oldest_dirty >= self.max_staleness:
+                self.flush()
+
+    def flush(self):
+        """Write all dirty patients to SQLite in one transaction and truncate the journal."""
+        with self._lock:
+            if not self._dirty:
+                return 0
+            entries = {pid: (self._status.get(pid), self._features.get(pid)) for pid in self._dirty}
+            self._write(entries)
+            self._journal.truncate(0)
+            self._journal.seek(0)
+            self._dirty.clear()
+            FEATURE_CACHE_DIRTY.set(0)
+            self._evict(self._cold.union(entries))
+            self._cold.clear()
+            return len(entries)
+
+    def _evict(self, pids):
+        """Drop the clean patients among 'pids' that are not admitted."""
+        evicted = [pid for pid in pids if pid not in self._dirty and self._status.get(pid) != "Yes"]
+        for pid in evicted:
+            self._features.pop(pid, None)
+            self._status.pop(pid, None)
+        FEATURE_CACHE_EVICTIONS.inc(len(evicted))
+        FEATURE_CACHE_PATIENTS.set(len(self._features))
+
+    @monitor_db_operation("feature_cache_flush")
+    def _write(self, entries):
+        conn = self.connect()
+        with conn:
+            conn.executemany(PATIENT_UPSERT_SQL, [
+                (pid, status) for pid, (status, row) in entries.items() if status is not None
+            ])
+            conn.executemany(FEATURE_UPSERT_SQL, [
+                stored_row(row) for status, row in entries.values() if row is not None
+            ])
@@ -0,0 +1,125 @@
+"""
+group_commit.py
+
+Group commit of Feature_Store writes.
+
+ORU messages only change the result columns of a patient's Feature_Store
+row (and insert a row for a patient seen for the first time). Instead of
+one transaction per message, GroupCommitWriter buffers those writes and
+applies them with executemany in a single transaction once 'max_rows'
+patients are pending or the oldest pending write is 'max_delay' seconds
+old. Lookups overlay the buffered writes on the stored row, so later
+messages in the same batch see earlier ones.
+
+A message counts as durable only after commit() returns; main.py holds its
+MLLP ACK until then.
+"""
+import time
+
+from database_functionality.schema import to_epoch
+from monitoring.metrics import monitor_db_operation, GROUP_COMMIT_BATCH_ROWS
+
+# Columns written by an ORU message (Sex/Age belong to ADT^A01)
+RESULT_COLUMNS = ("Min", "Max", "Mean", "Standard_Deviation", "Last_Result_Value",
+                  "Latest_Result_Timestamp", "No_of_Samples", "Ready_for_Inference")
+
+UPDATE_RESULTS_SQL = "UPDATE Feature_Store SET {} WHERE PID = ?;".format(
+    ", ".join(f"{col} = ?" for col in RESULT_COLUMNS))
+
+INSERT_PATIENT_SQL = """
+    INSERT OR IGNORE INTO Patient_Data (PID, Admission_Status, DOB, Admission_Date)
+    VALUES (?, 'Pending', NULL, NULL);
+"""
+
+INSERT_FEATURE_SQL = """
+    INSERT INTO Feature_Store (PID, Sex, Age, Min, Max, Mean, Standard_Deviation,
+                               Last_Result_Value, Latest_Result_Timestamp, No_of_Samples, Ready_for_Inference)
+    VALUES (?, NULL, NULL, ?, ?, ?, ?, ?, ?, ?, ?);
+"""
+
+
+class GroupCommitWriter:
+    """Buffers ORU writes to Feature_Store and commits them in batches."""
+
+    def __init__(self, connect, max_rows=100, max_delay=0.01):
+        self.connect = connect      # returns a sqlite3 connection
+        self.max_rows = max_rows
+        self.max_delay = max_delay  # seconds
+        self._new = {}              # PID -> result columns of a patient not yet in Feature_Store
+        self._updates = {}          # PID -> result columns of an existing patient
+        self._oldest = None
+
+    def __len__(self):
+        return len(self._new) + len(self._updates)
+
+    def merge(self, pid, stored):
+        """
+        Return the Feature_Store record of 'pid' as it will be after the
+        pending writes: 'stored' (dict or None) with buffered results applied.
+        """
+        if pid in self._new:
+            stored = dict.fromkeys(("Sex", "Age"))
+            stored["PID"] = pid
+            stored.update(self._new[pid])
+        elif stored is not None and pid in self._updates:
+            stored = dict(stored, **self._updates[pid])
+        return stored
+
+    def insert(self, data):
+        """Buffer the insertion of a patient first seen in an ORU message."""
+        patient_id, latest_result, latest_result_test_date = data
+        results = dict.fromkeys(RESULT_COLUMNS)
+        results.update(Last_Result_Value=latest_result, Latest_Result_Timestamp=latest_result_test_date,
+                       No_of_Samples=1, Ready_for_Inference="No")
+        self._add(self._new, patient_id, results)
+
+    def update(self, pid, new_feature):
+        """Buffer the new result columns of 'pid'."""
+        results = {col: new_feature.get(col) for col in RESULT_COLUMNS}
+        self._add(self._new if pid in self._new else self._updates, pid, results)
+
+    def _add(self, pending, pid, results):
+        if not len(self):
+            self._oldest = time.monotonic()
+        pending[pid] = results
+
+    def time_left(self):
+        """Seconds until the pending batch is due, or None if nothing is pending."""
+        if not len(self):
+            return None
+        return max(0.0, self.max_delay - (time.monotonic() - self._oldest))
+
+    def due(self):
+        return len(self) >= self.max_rows or self.time_left() == 0.0
+
+    def rollback(self):
+        """Drop the pending writes (their messages were not acknowledged)."""
+        self._new.clear()
+        self._updates.clear()
+
+    def commit(self):
+        """Write every pending row in one transaction. Returns the number of rows."""
+        rows = len(self)
+        if rows:
+            self._write()
+            GROUP_COMMIT_BATCH_ROWS.observe(rows)
+            self.rollback()
+        return rows
+
+    @monitor_db_operation("group_commit")
+    def _write(self):
+        conn = self.connect()
+        with conn:
+            conn.executemany(INSERT_PATIENT_SQL, [(pid,) for pid in self._new])
+            conn.executemany(INSERT_FEATURE_SQL, [
+                (pid,) + stored_results(results) for pid, results in self._new.items()
+            ])
+            conn.executemany(UPDATE_RESULTS_SQL, [
+                stored_results(results) + (pid,) for pid, results in self._updates.items()
+            ])
+
+
+def stored_results(results):
+    """Values of RESULT_COLUMNS as stored, the timestamp as epoch seconds."""
+    return tuple(to_epoch(results[col]) if col == "Latest_Result_Timestamp" else results[col]
+                 for col in RESULT_COLUMNS)
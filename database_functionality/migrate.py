@@ -0,0 +1,279 @@
+"""
+migrate.py
+
+Versioned migrations of the patient database, tracked in PRAGMA
+user_version. create_db.main runs the pending ones on every start, so a
+schema or index change ships without wiping /state. By hand:
+
+    python -m database_functionality.migrate /state/patient_database.db
+    python -m database_functionality.migrate --dry-run /state/patient_database.db
+
+A migration is a function registered with @migration(version,
+description) that brings the database from version - 1 to 'version'.
+Migrations are applied in order, each one completed by setting
+user_version in its last transaction, so an interrupted upgrade resumes
+at the step that was interrupted. A step must therefore be safe to run
+again after a partial run (CREATE ... IF NOT EXISTS, INSERT OR REPLACE).
+
+The connection is in autocommit mode: a step runs its own transactions,
+and returns with the transaction of its last changes still open. Large
+tables are rewritten into new tables in batches of 'batch_rows' rows, one
+transaction each, so the write lock is never held for long, and swapped in
+at the end; until then the old tables stay consistent and in use.
+
+--dry-run applies the pending migrations to a copy of the database and
+reports how long each step took; the database itself is not changed.
+Unversioned databases with tables are version 1 (the original create_db
+schema); new databases are created at the latest version by
+schema.create_tables.
+"""
+import argparse
+import os
+import sqlite3
+import tempfile
+import time
+
+from database_functionality.schema import SCHEMA_VERSION, CREATE_ADMITTED_INDEX_SQL, to_epoch
+
+# Rows copied per transaction when a table is rewritten
+MIGRATION_BATCH_ROWS = 10000
+
+# (version, description, function), in version order
+MIGRATIONS = []
+
+
+def migration(version, description):
+    """Register the decorated function as the migration to 'version'."""
+    def register(step):
+        assert version == len(MIGRATIONS) + 2, "migrations must be registered in order, from version 2"
+        MIGRATIONS.append((version, description, step))
+        return step
+    return register
+
+
+def schema_version(conn):
+    """Schema version of an existing database (1 for the unversioned original schema)."""
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    if version == 0 and conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'Feature_Store'").fetchone():
+        return 1
+    return version
+
+
+def pending(conn):
+    """The migrations not yet applied to the database of 'conn'."""
+    version = schema_version(conn)
+    if version == 0:
+        return []  # no tables: nothing to migrate
+    if version > SCHEMA_VERSION:
+        raise ValueError(f"Database schema version {version} is newer than this code ({SCHEMA_VERSION})")
+    return [step for step in MIGRATIONS if step[0] > version]
+
+
+def apply(conn, batch_rows=MIGRATION_BATCH_ROWS, verbose=True):
+    """Apply the pending migrations. Returns [(version, description, seconds)] of those applied."""
+    report = []
+    for version, description, step in pending(conn):
+        start = time.perf_counter()
+        try:
+            step(conn, batch_rows)
+            if not conn.in_transaction:
+                conn.execute("BEGIN IMMEDIATE")
+            conn.execute(f"PRAGMA user_version = {version}")
+            conn.execute("COMMIT")
+        except Exception:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        report.append((version, description, time.perf_counter() - start))
+        if verbose:
+            print(f"[migrate] Version {version} ({description}) applied in {report[-1][2]:.2f} s")
+    return report
+
+
+def upgrade(db_path, batch_rows=MIGRATION_BATCH_ROWS):
+    """
+    Bring the database at 'db_path' to SCHEMA_VERSION. Returns the report of
+    apply(), empty if it already was current (or is empty).
+    """
+    conn = sqlite3.connect(db_path, isolation_level=None)  # transactions handled by the steps
+    try:
+        return apply(conn, batch_rows)
+    finally:
+        conn.close()
+
+
+def dry_run(db_path, batch_rows=MIGRATION_BATCH_ROWS, directory=None):
+    """Time the pending migrations on a copy of the database at 'db_path', which is left unchanged."""
+    with tempfile.TemporaryDirectory(dir=directory) as tmp:
+        copy = sqlite3.connect(os.path.join(tmp, "dry-run.db"), isolation_level=None)
+        try:
+            source = sqlite3.connect(db_path)
+            source.backup(copy)
+            source.close()
+            return apply(copy, batch_rows, verbose=False)
+        finally:
+            copy.close()
+
+
+def copy_in_batches(conn, source, insert_sql, batch_rows):
+    """
+    Run 'insert_sql' (INSERT ... SELECT ... FROM 'source' WHERE rowid > ?
+    ORDER BY rowid LIMIT ?) over 'source' in rowid order, 'batch_rows' rows
+    per transaction. Returns the number of rows read.
+    """
+    last = -1 << 63
+    rows = 0
+    while True:
+        conn.execute("BEGIN IMMEDIATE")
+        conn.execute(insert_sql, (last, batch_rows))
+        count, last_in_batch = conn.execute(
+            f"SELECT COUNT(*), MAX(rowid) FROM (SELECT rowid FROM {source} WHERE rowid > ? ORDER BY rowid LIMIT ?)",
+            (last, batch_rows)).fetchone()
+        conn.execute("COMMIT")
+        rows += count
+        if count < batch_rows:
+            return rows
+        last = last_in_batch
+
+
+# ----------------------------------------------------------------------
+# Version 1: the original create_db schema
+# ----------------------------------------------------------------------
+
+V1_TABLES_SQL = """
+    CREATE TABLE Patient_Data (
+        PID INTEGER PRIMARY KEY,
+        Admission_Status TEXT NOT NULL CHECK (Admission_Status IN ('Yes', 'No', 'Pending')),
+        Admission_Date TEXT NULL CHECK (Admission_Date LIKE '____________'),
+        DOB TEXT NULL CHECK (DOB LIKE '________'));
+    CREATE TABLE Feature_Store (
+        PID TEXT PRIMARY KEY,
+        Sex FLOAT CHECK (Sex IN (0, 1)),
+        Age INTEGER CHECK (Age > 0),
+        Min FLOAT,
+        Max FLOAT,
+        Mean FLOAT,
+        Standard_Deviation FLOAT,
+        Last_Result_Value FLOAT,
+        Latest_Result_Timestamp TEXT CHECK (Latest_Result_Timestamp LIKE '______________'),
+        No_of_Samples INTEGER,
+        Ready_for_Inference TEXT NOT NULL CHECK (Ready_for_Inference IN ('Yes', 'No')),
+        FOREIGN KEY (PID) REFERENCES Patient_Data (PID) ON DELETE CASCADE);
+"""
+
+# ----------------------------------------------------------------------
+# Version 2: integer PIDs, epoch timestamps, WITHOUT ROWID
+# ----------------------------------------------------------------------
+
+# The version 2 tables as first released, created as <table>_v2 and renamed
+# once filled (the foreign key names the final table)
+V2_TABLES_SQL = """
+    CREATE TABLE IF NOT EXISTS Patient_Data_v2 (
+        PID INTEGER PRIMARY KEY,
+        Admission_Status TEXT NOT NULL CHECK (Admission_Status IN ('Yes', 'No', 'Pending')),
+        Admission_Date INTEGER NULL,
+        DOB INTEGER NULL
+    ) WITHOUT ROWID;
+    CREATE TABLE IF NOT EXISTS Feature_Store_v2 (
+        PID INTEGER PRIMARY KEY,
+        Sex INTEGER CHECK (Sex IN (0, 1)),
+        Age INTEGER CHECK (Age > 0),
+        Min REAL,
+        Max REAL,
+        Mean REAL,
+        Standard_Deviation REAL,
+        Last_Result_Value REAL,
+        Latest_Result_Timestamp INTEGER,
+        No_of_Samples INTEGER,
+        Ready_for_Inference TEXT NOT NULL CHECK (Ready_for_Inference IN ('Yes', 'No')),
+        FOREIGN KEY (PID) REFERENCES Patient_Data (PID) ON DELETE CASCADE
+    ) WITHOUT ROWID;
+"""
+
+
+@migration(2, "integer PIDs, epoch timestamps, WITHOUT ROWID")
+def upgrade_v1(conn, batch_rows):
+    """
+    Rewrite the version 1 tables as version 2, converting PIDs and
+    timestamps. Refused, before anything changes, if a Feature_Store PID is
+    not an integer or two of them are the same integer.
+    """
+    invalid = conn.execute("SELECT COUNT(*) FROM Feature_Store WHERE PID GLOB '*[^0-9]*' OR PID = ''").fetchone()[0]
+    if invalid:
+        raise ValueError(f"{invalid} Feature_Store PIDs are not integers, cannot upgrade")
+    # '0123' and '123' would be one integer PID: INSERT OR REPLACE would keep one row and drop the other
+    collisions = conn.execute("""
+        SELECT COUNT(*) FROM (SELECT CAST(PID AS INTEGER) FROM Feature_Store GROUP BY 1 HAVING COUNT(*) > 1)
+    """).fetchone()[0]
+    if collisions:
+        raise ValueError(f"{collisions} Feature_Store PIDs are stored under several MRNs "
+                         f"(e.g. with leading zeros), cannot upgrade")
+
+    conn.create_function("to_epoch", 1, to_epoch, deterministic=True)
+    conn.executescript(V2_TABLES_SQL)
+    copy_in_batches(conn, "Patient_Data", """
+        INSERT OR REPLACE INTO Patient_Data_v2 (PID, Admission_Status, Admission_Date, DOB)
+        SELECT PID, Admission_Status, to_epoch(Admission_Date), to_epoch(DOB) FROM Patient_Data
+        WHERE rowid > ? ORDER BY rowid LIMIT ?
+    """, batch_rows)
+    copy_in_batches(conn, "Feature_Store", """
+        INSERT OR REPLACE INTO Feature_Store_v2 (PID, Sex, Age, Min, Max, Mean, Standard_Deviation,
+                                                 Last_Result_Value, Latest_Result_Timestamp, No_of_Samples,
+                                                 Ready_for_Inference)
+        SELECT CAST(PID AS INTEGER), CAST(Sex AS INTEGER), Age, Min, Max, Mean, Standard_Deviation,
+               Last_Result_Value, to_epoch(Latest_Result_Timestamp), No_of_Samples, Ready_for_Inference
+        FROM Feature_Store WHERE rowid > ? ORDER BY rowid LIMIT ?
+    """, batch_rows)
+
+    # Swap the tables in (a short transaction, completed by apply)
+    conn.execute("BEGIN IMMEDIATE")
+    conn.execute("DROP TABLE Feature_Store")
+    conn.execute("DROP TABLE Patient_Data")
+    conn.execute("ALTER TABLE Patient_Data_v2 RENAME TO Patient_Data")
+    conn.execute("ALTER TABLE Feature_Store_v2 RENAME TO Feature_Store")
+
+
+# ----------------------------------------------------------------------
+# Version 3: partial index of the admitted patients
+# ----------------------------------------------------------------------
+
+@migration(3, "partial index on admitted patients")
+def add_admitted_index(conn, batch_rows):
+    """Index the patients with Admission_Status = 'Yes': one scan of Patient_Data, the index holds only them."""
+    conn.execute("BEGIN IMMEDIATE")
+    conn.execute(CREATE_ADMITTED_INDEX_SQL)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Apply the pending schema migrations to a patient database")
+    parser.add_argument("db_path", nargs="?", default="/state/patient_database.db", help="Database to upgrade")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="Time the migrations on a copy of the database, leaving it unchanged")
+    parser.add_argument("--batch-rows", default=MIGRATION_BATCH_ROWS, type=int,
+                        help="Rows copied per transaction when a table is rewritten")
+    parser.add_argument("--vacuum", action="store_true",
+                        help="VACUUM afterwards to give back the space of rewritten tables (locks the database)")
+    flags = parser.parse_args()
+
+    conn = sqlite3.connect(flags.db_path, isolation_level=None)
+    version = schema_version(conn)
+    conn.close()
+    print(f"{flags.db_path}: schema version {version}, latest {SCHEMA_VERSION}")
+
+    if flags.dry_run:
+        report = dry_run(flags.db_path, flags.batch_rows, os.path.dirname(os.path.abspath(flags.db_path)))
+        for step_version, description, seconds in report:
+            print(f"  version {step_version:<3} {seconds:8.2f} s  {description}")
+        print(f"  total       {sum(seconds for _, _, seconds in report):8.2f} s  (dry run, database unchanged)")
+        return
+
+    upgrade(flags.db_path, flags.batch_rows)
+    if flags.vacuum:
+        conn = sqlite3.connect(flags.db_path, isolation_level=None)
+        conn.execute("VACUUM")
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+pid_index.py
+
+In-memory index of the PIDs in Patient_Data, so the message handlers can
+tell a first-time patient apart without a query: a new patient goes
+straight to the inserts, a known one straight to the keyed fetch.
+
+The PIDs loaded at startup are kept in a sorted array('q') - 8 bytes each,
+searched with bisect - and the PIDs added since in a set, merged into the
+array once it holds an eighth as many (so merging costs O(1) per PID,
+amortized). The index is exact for integer PIDs. PIDs that cannot be
+stored as an int64 are never indexed and are always reported as possibly
+known, so the handlers fall back to the query for them.
+"""
+import heapq
+import sys
+import threading
+from array import array
+from bisect import bisect_left
+
+# PIDs added before the set is merged into the sorted array, at least
+MIN_MERGE_SIZE = 4096
+
+_INT64_MAX = (1 << 63) - 1
+
+
+def pid_key(pid):
+    """'pid' (int or decimal str, as in the HL7 messages) as an int64, or None."""
+    if isinstance(pid, str):
+        if not (pid.isascii() and pid.isdigit()):
+            return None
+        pid = int(pid)
+    elif not isinstance(pid, int):
+        return None
+    return pid if 0 <= pid <= _INT64_MAX else None
+
+
+class PidIndex:
+    """Set of the PIDs in Patient_Data (see the module docstring)."""
+
+    def __init__(self, pids=()):
+        self._sorted = array("q", sorted(pids))
+        self._added = set()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, conn, batch_rows=100000):
+        """Build the index from the Patient_Data table of 'conn'."""
+        index = cls()
+        # Patient_Data is keyed by PID, so this reads the primary key in order
+        cursor = conn.execute("SELECT PID FROM Patient_Data WHERE typeof(PID) = 'integer' ORDER BY PID")
+        while True:
+            rows = cursor.fetchmany(batch_rows)
+            if not rows:
+                break
+            index._sorted.extend(pid for (pid,) in rows)
+        return index
+
+    def may_exist(self, pid):
+        """False only if 'pid' is certainly not in Patient_Data."""
+        key = pid_key(pid)
+        if key is None:
+            return True
+        # The set first: a concurrent merge replaces the array before emptying the set
+        if key in self._added:
+            return True
+        pids = self._sorted
+        i = bisect_left(pids, key)
+        return i < len(pids) and pids[i] == key
+
+    def add(self, pid):
+        """Record that 'pid' has been inserted into Patient_Data."""
+        key = pid_key(pid)
+        if key is None or self.may_exist(key):
+            return
+        with self._lock:
+            self._added.add(key)
+            if len(self._added) >= max(MIN_MERGE_SIZE, len(self._sorted) // 8):
+                # Streamed into the new array: no list of the whole index is built
+                self._sorted = array("q", heapq.merge(self._sorted, sorted(self._added)))
+                self._added = set()
+
+    def __len__(self):
+        return len(self._sorted) + len(self._added)
+
+    def nbytes(self):
+        """Memory held by the index, in bytes (the set counted with its int objects)."""
+        return (sys.getsizeof(self._sorted) + sys.getsizeof(self._added)
+                + sum(sys.getsizeof(key) for key in list(self._added)))
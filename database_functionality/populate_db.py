@@ -1,8 +1,35 @@
-import pandas as pd
 import sqlite3
 import os
-import random
-from datetime import datetime, timedelta
+from datetime import datetime
+
+import numpy as np
+
+from database_functionality.schema import to_epoch
+
+# history.csv cells (rows x columns) loaded, processed and inserted at a time. Sized in
+# cells rather than rows as the number of result columns grows with the history;
+# about 100 bytes per cell while a chunk is processed
+HISTORY_CHUNK_CELLS = 250000
+
+FEATURE_STORE_COLUMNS = ["PID", "Sex", "Age", "Min", "Max", "Mean", "Standard_Deviation",
+                         "Last_Result_Value", "Latest_Result_Timestamp", "No_of_Samples", "Ready_for_Inference"]
+PATIENT_DATA_COLUMNS = ["PID", "DOB", "Admission_Status", "Admission_Date"]
+
+FEATURE_STORE_INSERT_SQL = "INSERT INTO Feature_Store ({}) VALUES ({})".format(
+    ", ".join(FEATURE_STORE_COLUMNS), ", ".join("?" * len(FEATURE_STORE_COLUMNS)))
+# First row of a PID wins, as drop_duplicates did
+PATIENT_DATA_INSERT_SQL = "INSERT OR IGNORE INTO Patient_Data ({}) VALUES ({})".format(
+    ", ".join(PATIENT_DATA_COLUMNS), ", ".join("?" * len(PATIENT_DATA_COLUMNS)))
+
+def epoch_seconds(values):
+    """
+    Seconds since the epoch (as stored by schema v2) of a datetime64 array,
+    as an object array of ints without a Python-level loop. NaT becomes None.
+    """
+    seconds = values.astype("datetime64[s]").astype(np.int64).astype(object)
+    seconds[np.isnat(values)] = None
+    return seconds
+
 
 def process_creatinine_data(file_path):
     """
@@ -10,47 +37,80 @@ def process_creatinine_data(file_path):
     extracts the latest creatinine test result and timestamp,
     counts the number of valid samples and drops the unneeded columns.
     """
-    dataset = pd.read_csv(file_path)
-    
+    import pandas as pd  # imported lazily, only needed when the DB is first populated
+
+    # Chunk by chunk: only the reduced columns of the whole file are held at once
+    return pd.concat((process_creatinine_chunk(chunk) for chunk in read_history(file_path)), ignore_index=True)
+
+
+def read_history(file_path, chunk_rows=None):
+    """
+    Yield history.csv as DataFrames of 'chunk_rows' rows (default: as many
+    as fit in HISTORY_CHUNK_CELLS cells).
+    """
+    import pandas as pd
+
+    columns = pd.read_csv(file_path, nrows=0).columns
+    if chunk_rows is None:
+        chunk_rows = max(1, HISTORY_CHUNK_CELLS // len(columns))
+    # Fixed types: a sparse late column could otherwise be typed differently from chunk to chunk
+    dtype = {col: str if "creatinine_date" in col else float for col in columns if "creatinine_" in col}
+    yield from pd.read_csv(file_path, chunksize=chunk_rows, dtype=dtype)
+
+
+def parse_dates(values):
+    """
+    Parse an object array of date strings to datetime64[ns], NaT where
+    missing or invalid. ISO 8601 (as in history.csv) is parsed directly;
+    pandas' format inference, which fails on some valid timestamps and then
+    parses each value with dateutil, is only used for other formats.
+    """
+    import pandas as pd
+
+    missing = pd.isna(values)
+    if missing.all():
+        return np.full(len(values), np.datetime64("NaT"), dtype="datetime64[ns]")
+    dates = pd.to_datetime(values, errors='coerce', format='ISO8601')
+    if dates.isna().sum() > missing.sum():
+        dates = pd.to_datetime(values, errors='coerce')
+    return dates.to_numpy(dtype="datetime64[ns]")
+
+
+def process_creatinine_chunk(dataset):
+    """process_creatinine_data for rows already loaded (one chunk of history.csv)."""
+    import pandas as pd
+
     # Identify creatinine date and corresponding result columns
     creatinine_date_cols = [col for col in dataset.columns if "creatinine_date" in col]
     creatinine_results_cols = [col.replace("date", "result") for col in creatinine_date_cols]
-    
+    results = dataset[creatinine_results_cols].to_numpy(dtype=float)
+
+    # Keep the other columns; the original creatinine date/result columns are dropped
+    processed = dataset.drop(columns=creatinine_date_cols + creatinine_results_cols, errors='ignore')
+
     # Create aggregated creatinine features if applicable
     if creatinine_results_cols:
-        dataset['creatinine_mean'] = dataset[creatinine_results_cols].mean(axis=1)
-        dataset['creatinine_max'] = dataset[creatinine_results_cols].max(axis=1)
-        dataset['creatinine_min'] = dataset[creatinine_results_cols].min(axis=1)
-        dataset['creatinine_std'] = dataset[creatinine_results_cols].std(axis=1, ddof=0)
-    
+        processed['creatinine_mean'] = dataset[creatinine_results_cols].mean(axis=1)
+        processed['creatinine_max'] = dataset[creatinine_results_cols].max(axis=1)
+        processed['creatinine_min'] = dataset[creatinine_results_cols].min(axis=1)
+        processed['creatinine_std'] = dataset[creatinine_results_cols].std(axis=1, ddof=0)
+
     # Identify and store the latest creatinine test value and timestamp
     if creatinine_date_cols:
-        # Convert date columns to datetime
-        dataset[creatinine_date_cols] = dataset[creatinine_date_cols].apply(pd.to_datetime, errors='coerce')
-        # Find the column with the maximum date per row
-        latest_date_idx = dataset[creatinine_date_cols].idxmax(axis=1)
-        # Determine corresponding result column (assumes naming like date_X and result_X)
-        latest_result_column = latest_date_idx.apply(
-            lambda x: x.replace('date_', 'result_') if pd.notna(x) else None
-        )
-        # Safely retrieve the latest test result and timestamp
-        dataset['latest_test_value'] = [
-            dataset.at[idx, col] if pd.notna(col) else None
-            for idx, col in zip(dataset.index, latest_result_column)
-        ]
-        dataset['latest_test_timestamp'] = [
-            dataset.at[idx, col].strftime("%Y%m%d%H%M%S") if pd.notna(col) else None
-            for idx, col in zip(dataset.index, latest_date_idx)
-        ]
-    
+        # Dates as int64 nanoseconds; NaT is the smallest int64, so argmax skips it
+        # (parsed in one call for the whole chunk)
+        dates = parse_dates(dataset[creatinine_date_cols].to_numpy(dtype=object).ravel())
+        dates = dates.view(np.int64).reshape(len(dataset), len(creatinine_date_cols))
+        rows = np.arange(len(dataset))
+        latest_idx = dates.argmax(axis=1)
+        latest = dates[rows, latest_idx].view("datetime64[ns]")
+        processed['latest_test_value'] = np.where(np.isnat(latest), np.nan, results[rows, latest_idx])
+        processed['latest_test_timestamp'] = epoch_seconds(latest)
+
     # Compute number of valid creatinine samples
-    dataset["No_of_Samples"] = dataset[creatinine_results_cols].notna().sum(axis=1)
-    
-    # Drop the original creatinine date/result columns
-    dataset.drop(columns=creatinine_date_cols, inplace=True, errors='ignore')
-    dataset.drop(columns=creatinine_results_cols, inplace=True, errors='ignore')
-    
-    return dataset
+    processed["No_of_Samples"] = np.count_nonzero(~np.isnan(results), axis=1)
+
+    return processed
 
 def add_demographics(dataset, use_random=True):
     """
@@ -65,16 +125,15 @@ def add_demographics(dataset, use_random=True):
     """
     if use_random:
         # Generate random date of birth between 18 and 90 years ago
-        dataset["DOB"] = [
-            (datetime.now() - timedelta(days=random.randint(18 * 365, 90 * 365))).strftime("%Y%m%d")
-            for _ in range(len(dataset))
-        ]
+        today = np.datetime64(datetime.now(), "D")
+        dob = today - np.random.randint(18 * 365, 90 * 365 + 1, len(dataset))
+        dataset["DOB"] = epoch_seconds(dob)  # midnight
         # Convert DOB to Age
         current_year = datetime.now().year
-        dataset["Age"] = dataset["DOB"].apply(lambda x: current_year - int(x[:4]))
+        dataset["Age"] = current_year - (dob.astype("datetime64[Y]").astype(np.int64) + 1970)
         # Randomly assign Sex (0 or 1) and Ready_for_Inference ("Yes" or "No")
-        dataset["Sex"] = [random.choice([0, 1]) for _ in range(len(dataset))]
-        dataset["Ready_for_Inference"] = [random.choice(["Yes", "No"]) for _ in range(len(dataset))]
+        dataset["Sex"] = np.random.randint(0, 2, len(dataset))
+        dataset["Ready_for_Inference"] = np.where(np.random.randint(0, 2, len(dataset)) == 1, "Yes", "No")
     else:
         # Do not generate demographic data: set these columns to None
         dataset["DOB"] = None
@@ -83,6 +142,47 @@ def add_demographics(dataset, use_random=True):
         dataset["Ready_for_Inference"] = "No"
     return dataset
 
+# Column of a processed dataset for each Feature_Store column
+FEATURE_STORE_SOURCES = {
+    "PID": "mrn",
+    "Min": "creatinine_min",
+    "Max": "creatinine_max",
+    "Mean": "creatinine_mean",
+    "Standard_Deviation": "creatinine_std",
+    "Last_Result_Value": "latest_test_value",
+    "Latest_Result_Timestamp": "latest_test_timestamp",
+}
+
+
+def feature_store_rows(dataset):
+    """
+    Feature_Store rows (tuples in FEATURE_STORE_COLUMNS order) of a processed
+    chunk, read column by column without copying the dataset. NaN needs no
+    conversion: SQLite stores it as NULL.
+    """
+    columns = []
+    for col in FEATURE_STORE_COLUMNS:
+        source = FEATURE_STORE_SOURCES.get(col, col)
+        columns.append(dataset[source].tolist() if source in dataset else [None] * len(dataset))
+    return zip(*columns)
+
+
+def patient_data_rows(dataset, use_random=True):
+    """
+    Patient_Data rows of a processed chunk. If use_random is True the DOB
+    generated by add_demographics is kept, otherwise only the PID is set.
+    """
+    admission_date = to_epoch(datetime.now().strftime("%Y%m%d%H%M")) if use_random else None
+    dobs = dataset["DOB"] if use_random else [None] * len(dataset)
+    return ((pid, dob, "Pending", admission_date) for pid, dob in zip(dataset["mrn"].tolist(), dobs))
+
+
+def insert_rows(cursor, dataset, use_random=True):
+    """Insert a processed chunk into Feature_Store and Patient_Data with executemany."""
+    cursor.executemany(FEATURE_STORE_INSERT_SQL, feature_store_rows(dataset))
+    cursor.executemany(PATIENT_DATA_INSERT_SQL, patient_data_rows(dataset, use_random))
+
+
 def insert_into_database(dataset, db_path, use_random=True):
     """
     Inserts data into the SQLite database.
@@ -100,72 +200,60 @@ def insert_into_database(dataset, db_path, use_random=True):
     # Clear existing data
     cursor.execute("DELETE FROM Feature_Store")
     cursor.execute("DELETE FROM Patient_Data")
-    conn.commit()
-    
-    # --- Prepare Patient_Data insertion BEFORE renaming for Feature_Store ---
-    if use_random:
-        # Use the original 'mrn' column and DOB (generated above)
-        patient_data = dataset[['mrn', 'DOB']].drop_duplicates(subset=['mrn']).copy()
-        patient_data.rename(columns={'mrn': 'PID'}, inplace=True)
-        patient_data["Admission_Status"] = "Pending"
-        patient_data["Admission_Date"] = datetime.now().strftime("%Y%m%d%H%M")
-    else:
-        # Non-random mode: for every PID in Feature_Store, add a row with other fields null.
-        pids = dataset['mrn'].drop_duplicates()
-        patient_data = pd.DataFrame({'PID': pids})
-        patient_data["DOB"] = None
-        patient_data["Admission_Status"] = "Pending"
-        patient_data["Admission_Date"] = None
-
-    # --- Insert into Feature_Store ---
-    # Create a copy so that we can rename columns without affecting the patient_data extraction above.
-    fs_dataset = dataset.copy()
-    fs_dataset.rename(columns={
-        "mrn": "PID",
-        "creatinine_min": "Min",
-        "creatinine_max": "Max",
-        "creatinine_mean": "Mean",
-        "creatinine_std": "Standard_Deviation",
-        "latest_test_value": "Last_Result_Value",
-        "latest_test_timestamp": "Latest_Result_Timestamp"
-    }, inplace=True)
-    
-    # Order the columns as required by Feature_Store
-    feature_store_cols = ["PID", "Sex", "Age", "Min", "Max", "Mean", "Standard_Deviation",
-                            "Last_Result_Value", "Latest_Result_Timestamp", "No_of_Samples", "Ready_for_Inference"]
-    fs_dataset = fs_dataset[feature_store_cols]
-    
-    fs_dataset.to_sql("Feature_Store", conn, if_exists="append", index=False)
-    
-    # --- Insert into Patient_Data ---
-    patient_data.to_sql("Patient_Data", conn, if_exists="append", index=False)
-    
+
+    insert_rows(cursor, dataset, use_random)
+
     conn.commit()
     conn.close()
 
-def main(use_random=True):
-    # File paths
+
+def load_history(file_path, db_path, use_random=True, chunk_rows=None):
+    """
+    Stream history.csv into a freshly created database one chunk at a time
+    (read_history, process_creatinine_chunk, add_demographics, insert_rows),
+    so memory stays bounded by the chunk size rather than the file size.
+
+    Everything is inserted in one transaction with journal_mode = OFF and
+    synchronous = OFF, as nothing else uses the database yet; the previous
+    journal mode is restored afterwards. Without a journal a failed load
+    cannot be rolled back, so the tables are emptied instead and the error
+    is raised. Returns the number of history rows loaded.
+    """
+    conn = sqlite3.connect(db_path, isolation_level=None)  # transactions handled explicitly
+    journal_mode = conn.execute("PRAGMA journal_mode").fetchone()[0]
+    conn.execute("PRAGMA journal_mode = OFF")
+    conn.execute("PRAGMA synchronous = OFF")
+    rows = 0
+    try:
+        cursor = conn.cursor()
+        cursor.execute("BEGIN")
+        cursor.execute("DELETE FROM Feature_Store")
+        cursor.execute("DELETE FROM Patient_Data")
+        for chunk in read_history(file_path, chunk_rows):
+            dataset = add_demographics(process_creatinine_chunk(chunk), use_random=use_random)
+            insert_rows(cursor, dataset, use_random)
+            rows += len(dataset)
+            del chunk, dataset  # before the next chunk is read
+        cursor.execute("COMMIT")
+    except Exception:
+        if conn.in_transaction:
+            conn.execute("COMMIT")
+        conn.execute("DELETE FROM Feature_Store")
+        conn.execute("DELETE FROM Patient_Data")
+        raise
+    finally:
+        conn.execute(f"PRAGMA journal_mode = {journal_mode}")
+        conn.close()
+    return rows
+
+
+def main(use_random=True, file_path="/data/history.csv", db_path=os.path.join("/state", "patient_database.db")):
     #file_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data/history.csv")
-    file_path = "/data/history.csv"
-    output_file_path = "processed_creatinine_data.csv"
-    
-    # Process the CSV to compute creatinine features
-    dataset = process_creatinine_data(file_path)
-    
-    # Add demographic information according to the flag
-    dataset = add_demographics(dataset, use_random=use_random)
-    
-    # Save the processed dataset to CSV
-    dataset.to_csv(output_file_path, index=False)
-    
-    # Determine the SQLite database path (relative to this script)
-    db_path = os.path.join("/state", "patient_database.db")
 
-    
-    # Insert the processed data into the database
-    insert_into_database(dataset, db_path, use_random=use_random)
-    
-    print(f"Processed dataset saved to {output_file_path} and inserted into SQLite database {db_path}.")
+    # Process history.csv chunk by chunk and insert it into the database
+    rows = load_history(file_path, db_path, use_random=use_random)
+
+    print(f"Processed {rows} history rows from {file_path} and inserted them into SQLite database {db_path}.")
 
 if __name__ == "__main__":
     # Set use_random to True to generate Sex, Age, Ready_for_Inference randomly.
@@ -0,0 +1,95 @@
+"""
+schema.py
+
+Database schema (version 2) and the conversions between stored and
+in-memory values.
+
+Both tables are keyed by the integer PID and stored WITHOUT ROWID, so a
+lookup is a single B-tree search on the primary key. MRNs lose their
+leading zeros in an INTEGER column, so the parser normalizes them first
+(parsing.hl7.canonical_mrn). Timestamps are stored
+as integer seconds since the epoch (the HL7 timestamps have no time zone
+and are taken as UTC), so they need no CHECK on their format; the rest of
+the code keeps handling them as 'YYYYMMDDHHMMSS' strings, converted by
+to_epoch/from_epoch when rows are written and read.
+
+Version 3 adds a partial index of the patients currently admitted, so the
+ward census (e.g. the patients warmed into the feature cache) is read
+without scanning all of history.
+
+PRAGMA user_version holds the schema version; older databases are
+upgraded by migrate.py.
+"""
+import calendar
+import time
+
+SCHEMA_VERSION = 3
+
+CREATE_PATIENT_DATA_SQL = """
+    CREATE TABLE IF NOT EXISTS Patient_Data (
+        PID INTEGER PRIMARY KEY,
+        Admission_Status TEXT NOT NULL CHECK (Admission_Status IN ('Yes', 'No', 'Pending')),
+        Admission_Date INTEGER NULL,  -- epoch seconds
+        DOB INTEGER NULL              -- epoch seconds (midnight)
+    ) WITHOUT ROWID;
+"""
+
+CREATE_FEATURE_STORE_SQL = """
+    CREATE TABLE IF NOT EXISTS Feature_Store (
+        PID INTEGER PRIMARY KEY,  -- Foreign key from Patient_Data
+        Sex INTEGER CHECK (Sex IN (0, 1)),  -- 0: Male, 1: Female. NULL if receive LIMS before PAS
+        Age INTEGER CHECK (Age > 0), -- NULL if receive LIMS before PAS
+        Min REAL,
+        Max REAL,
+        Mean REAL,
+        Standard_Deviation REAL,
+        Last_Result_Value REAL,
+        Latest_Result_Timestamp INTEGER,  -- epoch seconds
+        No_of_Samples INTEGER,
+        Ready_for_Inference TEXT NOT NULL CHECK (Ready_for_Inference IN ('Yes', 'No')),
+        FOREIGN KEY (PID) REFERENCES Patient_Data (PID) ON DELETE CASCADE
+    ) WITHOUT ROWID;
+"""
+
+# Feature_Store columns in table order, the layout of the feature rows
+# shared by the feature cache and ml.feature_construct
+FEATURE_COLUMNS = ("PID", "Sex", "Age", "Min", "Max", "Mean", "Standard_Deviation",
+                   "Last_Result_Value", "Latest_Result_Timestamp", "No_of_Samples", "Ready_for_Inference")
+
+CREATE_ADMITTED_INDEX_SQL = """
+    CREATE INDEX IF NOT EXISTS Patient_Data_Admitted ON Patient_Data (PID) WHERE Admission_Status = 'Yes';
+"""
+
+# The census query, answered from Patient_Data_Admitted
+ADMITTED_PIDS_SQL = "SELECT PID FROM Patient_Data WHERE Admission_Status = 'Yes'"
+
+
+def create_tables(conn):
+    """Create the current schema on an empty database."""
+    conn.execute(CREATE_PATIENT_DATA_SQL)
+    conn.execute(CREATE_FEATURE_STORE_SQL)
+    conn.execute(CREATE_ADMITTED_INDEX_SQL)
+    conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+
+def to_epoch(timestamp):
+    """'YYYYMMDD[HHMM[SS]]' (str) -> epoch seconds; None (or '') stays None."""
+    if not timestamp:
+        return None
+    timestamp = str(timestamp)
+    return calendar.timegm((int(timestamp[0:4]), int(timestamp[4:6]), int(timestamp[6:8]),
+                            int(timestamp[8:10] or 0), int(timestamp[10:12] or 0), int(timestamp[12:14] or 0)))
+
+
+def from_epoch(seconds, fmt="%Y%m%d%H%M%S"):
+    """Epoch seconds -> 'YYYYMMDDHHMMSS' (or 'fmt'); None stays None."""
+    if seconds is None:
+        return None
+    return time.strftime(fmt, time.gmtime(seconds))
+
+
+def decode_feature(columns, record):
+    """Feature_Store record as fetched ('columns' from cursor.description) -> dict, timestamp as str."""
+    feature = dict(zip(columns, record))
+    feature["Latest_Result_Timestamp"] = from_epoch(feature.get("Latest_Result_Timestamp"))
+    return feature
@@ -1,8 +1,11 @@
 import unittest
 import sqlite3
-from unittest.mock import patch
+import os
+import tempfile
+from unittest.mock import patch, MagicMock
 from datetime import datetime
-from database_functionality.db_operations import handle_adt_a01, handle_oru_a01, update_feature_store, connect_db  # Adjust the import as per your file structure
+from database_functionality.db_operations import handle_adt_a01, handle_adt_a03, handle_oru_a01, update_feature_store, connect_db  # Adjust the import as per your file structure
+from database_functionality.db_operations import ConnectionPool, process_oru
 
 class TestDatabaseHandlers(unittest.TestCase):
 
@@ -33,7 +36,7 @@ class TestDatabaseHandlers(unittest.TestCase):
             Mean FLOAT,
             Standard_Deviation FLOAT,
             Last_Result_Value FLOAT,
-            Latest_Result_Timestamp TEXT,
+            Latest_Result_Timestamp INTEGER,
             No_of_Samples INTEGER,
             Ready_for_Inference TEXT,
             FOREIGN KEY (PID) REFERENCES Patient_Data (PID) ON DELETE CASCADE
@@ -88,7 +91,7 @@ class TestDatabaseHandlers(unittest.TestCase):
         """)
         self.cursor.execute("""
         INSERT INTO Feature_Store (PID, Last_Result_Value, Latest_Result_Timestamp)
-        VALUES (1, 420, '20240223120000');
+        VALUES (1, 420, 1708689600);
         """)
         self.conn.commit()
 
@@ -125,7 +128,7 @@ class TestDatabaseHandlers(unittest.TestCase):
         # Insert initial data into Feature_Store
         self.cursor.execute("""
         INSERT INTO Feature_Store (PID, Age, Sex, Min, Max, Mean, Standard_Deviation, Last_Result_Value, Latest_Result_Timestamp, No_of_Samples, Ready_for_Inference)
-        VALUES (1, 40, 1, 10, 50, 30, 5, 420, '20240223120000', 10, 'No');
+        VALUES (1, 40, 1, 10, 50, 30, 5, 420, 1708689600, 10, 'No');
         """)
         self.conn.commit()
 
@@ -154,5 +157,136 @@ class TestDatabaseHandlers(unittest.TestCase):
         self.assertEqual(updated_record[10], "Yes")  # Ready_for_Inference
 
 
+    @patch("database_functionality.db_operations.connect_db")
+    def test_process_oru_existing_patient(self, mock_connect_db):
+        """Test ORU^R01 read-modify-write for an existing patient."""
+        mock_connect_db.return_value = self.conn
+        self.cursor.execute("""
+        INSERT INTO Patient_Data (PID, Admission_Status) VALUES (1, 'Yes');
+        """)
+        self.cursor.execute("""
+        INSERT INTO Feature_Store (PID, Last_Result_Value, Latest_Result_Timestamp, No_of_Samples, Ready_for_Inference)
+        VALUES (1, 420, 1708689600, 1, 'No');
+        """)
+        self.conn.commit()
+
+        def update_feature(old_feature):
+            self.assertEqual(old_feature["Last_Result_Value"], 420)
+            return dict(old_feature, Last_Result_Value=430, No_of_Samples=2)
+
+        result = process_oru((1, 430, "20240224120000"), update_feature)
+
+        self.assertEqual(result["Last_Result_Value"], 430)
+        self.assertFalse(self.conn.in_transaction)
+        self.cursor.execute("SELECT Last_Result_Value, No_of_Samples FROM Feature_Store WHERE PID = 1")
+        self.assertEqual(self.cursor.fetchone(), (430, 2))
+
+    @patch("database_functionality.db_operations.connect_db")
+    def test_process_oru_new_patient(self, mock_connect_db):
+        """Test ORU^R01 read-modify-write for a new patient."""
+        mock_connect_db.return_value = self.conn
+        update_feature = MagicMock()
+
+        result = process_oru((2, 450, "20240225120000"), update_feature)
+
+        self.assertIsNone(result)
+        update_feature.assert_not_called()
+        self.cursor.execute("SELECT Admission_Status FROM Patient_Data WHERE PID = 2")
+        self.assertEqual(self.cursor.fetchone()[0], "Pending")
+
+    @patch("database_functionality.db_operations.connect_db")
+    def test_readmission_updates_only_that_patient(self, mock_connect_db):
+        """ADT^A01 for a known patient admits that patient only."""
+        mock_connect_db.return_value = self.conn
+        for pid in (1, 2):
+            self.cursor.execute("INSERT INTO Patient_Data (PID, Admission_Status) VALUES (?, 'No');", (pid,))
+            self.cursor.execute("INSERT INTO Feature_Store (PID, Ready_for_Inference) VALUES (?, 'No');", (pid,))
+        self.conn.commit()
+
+        handle_adt_a01((1, 40, "M"))
+
+        self.cursor.execute("SELECT PID, Admission_Status FROM Patient_Data ORDER BY PID")
+        self.assertEqual(self.cursor.fetchall(), [(1, "Yes"), (2, "No")])
+
+    @patch("database_functionality.db_operations.connect_db")
+    def test_handle_adt_a03(self, mock_connect_db):
+        """ADT^A03 discharges the patient and keeps their history."""
+        mock_connect_db.return_value = self.conn
+        handle_adt_a01((1, 40, "M"))
+        handle_adt_a01((2, 35, "F"))
+
+        handle_adt_a03(("1",))
+        handle_adt_a03(("3",))  # unknown patient: nothing to do
+
+        self.cursor.execute("SELECT PID, Admission_Status FROM Patient_Data ORDER BY PID")
+        self.assertEqual(self.cursor.fetchall(), [(1, "No"), (2, "Yes")])
+        self.cursor.execute("SELECT COUNT(*) FROM Feature_Store")
+        self.assertEqual(self.cursor.fetchone()[0], 2)
+
+    @patch("database_functionality.db_operations.connect_db")
+    def test_process_oru_rolls_back_on_error(self, mock_connect_db):
+        """A failing feature update leaves the stored record untouched."""
+        mock_connect_db.return_value = self.conn
+        self.cursor.execute("INSERT INTO Patient_Data (PID, Admission_Status) VALUES (1, 'Yes');")
+        self.cursor.execute("INSERT INTO Feature_Store (PID, Last_Result_Value) VALUES (1, 420);")
+        self.conn.commit()
+
+        with self.assertRaises(ValueError):
+            process_oru((1, 430, "20240224120000"), MagicMock(side_effect=ValueError("bad feature")))
+
+        self.assertFalse(self.conn.in_transaction)
+        self.cursor.execute("SELECT Last_Result_Value FROM Feature_Store WHERE PID = 1")
+        self.assertEqual(self.cursor.fetchone()[0], 420)
+
+    @patch("database_functionality.db_operations.pool")
+    @patch("database_functionality.db_operations.connect_db")
+    def test_process_oru_database_error_propagates(self, mock_connect_db, mock_pool):
+        """A database error discards the connection and is raised, so the message is not ACKed."""
+        error = sqlite3.OperationalError("database is locked")
+        mock_connect_db.return_value.execute.side_effect = error
+
+        with self.assertRaises(sqlite3.OperationalError):
+            process_oru((1, 430, "20240224120000"), MagicMock())
+
+        mock_pool.discard.assert_called_once_with(error)
+
+
+class TestConnectionPool(unittest.TestCase):
+
+    def setUp(self):
+        """Create a pool on a temporary database file."""
+        self.directory = tempfile.TemporaryDirectory()
+        self.pool = ConnectionPool(os.path.join(self.directory.name, "patient_database.db"))
+
+    def tearDown(self):
+        self.pool.discard()
+        self.directory.cleanup()
+
+    def test_connection_is_reused_and_tuned(self):
+        """The same connection is returned on every call, in WAL mode."""
+        conn = self.pool.connection()
+        self.assertIs(self.pool.connection(), conn)
+        self.assertEqual(conn.execute("PRAGMA journal_mode").fetchone()[0], "wal")
+        self.assertEqual(conn.execute("PRAGMA synchronous").fetchone()[0], 1)  # NORMAL
+
+    def test_reopen_on_error(self):
+        """A database error discards the connection, an integrity error does not."""
+        conn = self.pool.connection()
+        self.pool.discard(sqlite3.IntegrityError("UNIQUE constraint failed"))
+        self.assertIs(self.pool.connection(), conn)
+
+        self.pool.discard(sqlite3.OperationalError("disk I/O error"))
+        self.assertIsNot(self.pool.connection(), conn)
+
+    @patch("database_functionality.db_operations.HEALTH_CHECK_INTERVAL", -1)
+    def test_health_check_reopens_closed_connection(self):
+        """A connection that fails its health check is replaced."""
+        conn = self.pool.connection()
+        conn.close()
+        new_conn = self.pool.connection()
+        self.assertIsNot(new_conn, conn)
+        self.assertEqual(new_conn.execute("SELECT 1").fetchone()[0], 1)
+
+
 if __name__ == "__main__":
     unittest.main()
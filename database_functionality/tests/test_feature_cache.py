@@ -0,0 +1,194 @@
+import unittest
+import sqlite3
+import os
+import io
+import tempfile
+import contextlib
+import threading
+from unittest.mock import patch
+from database_functionality import create_db, db_operations
+from database_functionality.pid_index import PidIndex
+from database_functionality.feature_cache import FeatureCache
+
+class TestFeatureCache(unittest.TestCase):
+
+    def setUp(self):
+        """Create a database with one patient in a temporary directory."""
+        self.directory = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.directory.name, "patient_database.db")
+        self.journal_path = os.path.join(self.directory.name, "feature_cache.journal")
+        with contextlib.redirect_stdout(io.StringIO()):
+            create_db.main(self.db_path)
+        self.conn = sqlite3.connect(self.db_path)
+        self.conn.execute("INSERT INTO Patient_Data (PID, Admission_Status) VALUES (1, 'Pending');")
+        self.conn.execute("""
+        INSERT INTO Feature_Store (PID, Sex, Age, Min, Max, Mean, Standard_Deviation, Last_Result_Value,
+                                   Latest_Result_Timestamp, No_of_Samples, Ready_for_Inference)
+        VALUES (1, NULL, NULL, 10, 50, 30, 5, 420, 1708689600, 10, 'No');
+        """)
+        self.conn.commit()
+
+    def tearDown(self):
+        self.conn.close()
+        self.directory.cleanup()
+
+    def open_cache(self, **kwargs):
+        return FeatureCache(lambda: self.conn, self.journal_path, fsync=False, **kwargs).open()
+
+    def stored(self, pid):
+        return self.conn.execute(
+            "SELECT Last_Result_Value, No_of_Samples FROM Feature_Store WHERE PID = ?", (pid,)).fetchone()
+
+    def test_warm_and_lookup(self):
+        """Records are served from memory after warm-up."""
+        cache = self.open_cache()
+        feature = cache.handle_oru_a01(("1", 430, "20240224120000"))
+        self.assertEqual(feature["Mean"], 30)
+        self.assertEqual(feature["PID"], "1")
+        self.assertEqual(feature["Latest_Result_Timestamp"], "20240223120000")  # stored as epoch seconds
+        self.assertIn("1", cache)
+
+    def test_write_back_on_flush(self):
+        """Writes reach SQLite only when flushed."""
+        cache = self.open_cache()
+        cache.process_oru(("1", 430, "20240224120000"),
+                          lambda old: dict(old, Last_Result_Value=430, No_of_Samples=11))
+        self.assertIsNone(cache.handle_oru_a01(("2", 99, "20240224130000")))  # new patient
+        self.assertEqual(self.stored("1"), (420, 10))
+
+        self.assertEqual(cache.flush(), 2)
+        self.assertEqual(self.stored("1"), (430, 11))
+        self.assertEqual(self.stored("2"), (99, 1))
+        self.assertEqual(os.path.getsize(self.journal_path), 0)
+
+    def test_leading_zero_mrn_is_the_same_patient(self):
+        """An MRN with leading zeros ('0001') updates the record of patient 1."""
+        from parsing.hl7 import mssg_parser
+        cache = self.open_cache()
+        mssg_type, data = mssg_parser(b"MSH|^~\\&|SIMULATION|SOUTH RIVERSIDE|||202402241200||ORU^R01|||2.5\r"
+                                      b"PID|1||0001\r"
+                                      b"OBR|1||||||20240224120000\r"
+                                      b"OBX|1|SN|CREATININE||430")
+        cache.process_oru(data, lambda old: dict(old, Last_Result_Value=data[1], No_of_Samples=11))
+        cache.flush()
+
+        self.assertEqual(data[0], "1")
+        self.assertNotIn("0001", cache)
+        self.assertEqual(self.stored(1), (430, 11))
+        self.assertEqual(self.conn.execute("SELECT COUNT(*) FROM Feature_Store").fetchone(), (1,))
+
+    def test_inference_runs_outside_cache_lock(self):
+        """A ready record is predicted after the cache lock is released."""
+        from message_parsing.main import parsed_message_consumer
+        cache = self.open_cache()
+
+        def try_lock(acquired):
+            acquired.append(cache._lock.acquire(blocking=False))
+            if acquired[-1]:
+                cache._lock.release()
+
+        def lock_free(record):
+            acquired = []
+            thread = threading.Thread(target=try_lock, args=(acquired,))
+            thread.start()
+            thread.join()
+            self.assertEqual(acquired, [True])
+
+        ready = lambda old, data, mssg_type: dict(old, Ready_for_Inference="Yes")
+        with patch.object(db_operations, "cache", cache), patch("message_parsing.main.update", ready), \
+                patch("message_parsing.main.ml_consumer", side_effect=lock_free) as ml_consumer, \
+                contextlib.redirect_stdout(io.StringIO()):
+            parsed_message_consumer("ORU^R01", ("1", 430, "20240224120000"))
+
+        ml_consumer.assert_called_once()
+        self.assertEqual(cache.handle_oru_a01(("1", 430, "20240224120000"))["Ready_for_Inference"], "No")
+
+    def test_admission(self):
+        """ADT^A01 updates a known patient and admits a new one."""
+        cache = self.open_cache()
+        feature = cache.handle_adt_a01(("1", 40, "F"))
+        self.assertEqual((feature["Age"], feature["Sex"]), (40, 1))
+        self.assertIsNone(cache.handle_adt_a01(("3", 35, "M")))
+        cache.flush()
+        statuses = dict(self.conn.execute("SELECT PID, Admission_Status FROM Patient_Data"))
+        self.assertEqual(statuses, {1: "Yes", 3: "Yes"})
+
+    def test_warm_loads_admitted_patients_only(self):
+        """Only the admitted patients are loaded at startup, others are read through."""
+        self.conn.execute("INSERT INTO Patient_Data (PID, Admission_Status) VALUES (2, 'Yes');")
+        self.conn.execute("INSERT INTO Feature_Store (PID, No_of_Samples, Ready_for_Inference) VALUES (2, 0, 'No');")
+        self.conn.commit()
+
+        cache = self.open_cache()
+        self.assertEqual(len(cache), 1)
+        self.assertNotIn("1", cache)
+        self.assertEqual(cache.get("1")["No_of_Samples"], 10)  # read through from SQLite
+        self.assertIn("1", cache)
+
+    def test_discharge_evicts_patient(self):
+        """ADT^A03 is written back, then the patient leaves the cache; history stays in SQLite."""
+        cache = self.open_cache()
+        cache.handle_adt_a01(("1", 40, "F"))
+        cache.handle_adt_a01(("3", 35, "M"))
+        cache.flush()
+        self.assertEqual(len(cache), 2)
+
+        cache.handle_adt_a03(("1",))
+        self.assertIn("1", cache)  # until flushed
+        cache.flush()
+
+        self.assertNotIn("1", cache)
+        self.assertEqual(len(cache), 1)
+        self.assertEqual(self.conn.execute("SELECT Admission_Status FROM Patient_Data WHERE PID = 1").fetchone()[0], "No")
+        self.assertEqual(self.stored("1"), (420, 10))
+        self.assertEqual(cache.get("1")["Age"], 40)  # read through again on readmission
+
+    def test_patients_not_admitted_are_evicted(self):
+        """Patients only seen in ORU messages do not stay cached once flushed."""
+        cache = self.open_cache()
+        cache.process_oru(("1", 430, "20240224120000"),
+                          lambda old: dict(old, Last_Result_Value=430, No_of_Samples=11))
+        cache.handle_oru_a01(("2", 99, "20240224130000"))
+        cache.flush()
+
+        self.assertEqual(len(cache), 0)
+        self.assertEqual(cache.get("1")["No_of_Samples"], 11)
+
+    def test_pid_index_skips_read_through(self):
+        """With a PID index, a new patient is not looked up in SQLite, and is then indexed."""
+        index = PidIndex.load(self.conn)
+        cache = self.open_cache(pids=index)
+        statements = []
+        self.conn.set_trace_callback(statements.append)
+
+        self.assertIsNone(cache.handle_oru_a01(("2", 99, "20240224130000")))
+
+        self.conn.set_trace_callback(None)
+        self.assertEqual(statements, [])
+        self.assertTrue(index.may_exist("2"))
+
+    def test_crash_recovery_replays_journal(self):
+        """Unflushed writes survive a crash through the journal."""
+        cache = self.open_cache()
+        cache.process_oru(("1", 430, "20240224120000"),
+                          lambda old: dict(old, Last_Result_Value=430, No_of_Samples=11))
+        cache._journal.close()  # crash: no flush
+
+        recovered = self.open_cache()
+        self.assertEqual(self.stored("1"), (430, 11))
+        self.assertEqual(recovered.get("1")["No_of_Samples"], 11)
+
+    def test_flush_triggers(self):
+        """Flush after flush_rows dirty patients, or once max_staleness has passed."""
+        cache = self.open_cache(flush_rows=2, max_staleness=0)
+        cache.handle_oru_a01(("2", 99, "20240224130000"))
+        cache.handle_oru_a01(("3", 98, "20240224130000"))
+        self.assertEqual(self.stored("3"), (98, 1))  # flush_rows reached
+
+        cache.handle_oru_a01(("4", 97, "20240224130000"))
+        cache.flush_if_due()
+        self.assertEqual(self.stored("4"), (97, 1))
+
+
+if __name__ == "__main__":
+    unittest.main()
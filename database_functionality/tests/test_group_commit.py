@@ -0,0 +1,102 @@
+import unittest
+import sqlite3
+from unittest.mock import patch
+from database_functionality import db_operations
+from database_functionality.db_operations import process_oru
+from database_functionality.group_commit import GroupCommitWriter
+
+class TestGroupCommitWriter(unittest.TestCase):
+
+    def setUp(self):
+        """Set up an in-memory SQLite database with one patient."""
+        self.conn = sqlite3.connect(":memory:")
+        self.cursor = self.conn.cursor()
+        self.cursor.execute("""
+        CREATE TABLE Patient_Data (
+            PID INTEGER PRIMARY KEY,
+            Admission_Status TEXT,
+            DOB TEXT,
+            Admission_Date TEXT
+        );
+        """)
+        self.cursor.execute("""
+        CREATE TABLE Feature_Store (
+            PID INTEGER PRIMARY KEY,
+            Sex FLOAT,
+            Age INTEGER,
+            Min FLOAT,
+            Max FLOAT,
+            Mean FLOAT,
+            Standard_Deviation FLOAT,
+            Last_Result_Value FLOAT,
+            Latest_Result_Timestamp INTEGER,
+            No_of_Samples INTEGER,
+            Ready_for_Inference TEXT
+        );
+        """)
+        self.cursor.execute("INSERT INTO Patient_Data (PID, Admission_Status) VALUES (1, 'Yes');")
+        self.cursor.execute("""
+        INSERT INTO Feature_Store (PID, Sex, Age, Last_Result_Value, No_of_Samples, Ready_for_Inference)
+        VALUES ('1', 1, 40, 420, 1, 'No');
+        """)
+        self.conn.commit()
+
+        self.writer = GroupCommitWriter(lambda: self.conn, max_rows=10, max_delay=60)
+        patcher_connect = patch("database_functionality.db_operations.connect_db", return_value=self.conn)
+        patcher_connect.start()
+        self.addCleanup(patcher_connect.stop)
+        db_operations.enable_group_commit(self.writer)
+        self.addCleanup(db_operations.enable_group_commit, None)
+
+    def tearDown(self):
+        self.conn.close()
+
+    @staticmethod
+    def add_sample(old_feature):
+        return dict(old_feature, Last_Result_Value=old_feature["Last_Result_Value"] + 1,
+                    No_of_Samples=old_feature["No_of_Samples"] + 1)
+
+    def stored(self, pid):
+        self.cursor.execute("SELECT Last_Result_Value, No_of_Samples FROM Feature_Store WHERE PID = ?", (pid,))
+        return self.cursor.fetchone()
+
+    def test_writes_buffered_until_commit(self):
+        """Updates are visible to later messages but only written on commit."""
+        process_oru(("1", 0, "20240224120000"), self.add_sample)
+        result = process_oru(("1", 0, "20240224130000"), self.add_sample)
+
+        self.assertEqual((result["Last_Result_Value"], result["No_of_Samples"]), (422, 3))
+        self.assertEqual(result["Age"], 40)  # untouched columns come from the stored row
+        self.assertEqual(self.stored("1"), (420, 1))
+
+        self.assertEqual(self.writer.commit(), 1)
+        self.assertEqual(self.stored("1"), (422, 3))
+        self.assertEqual(len(self.writer), 0)
+
+    def test_new_patient_buffered(self):
+        """A patient first seen in the batch is inserted on commit."""
+        self.assertIsNone(process_oru(("2", 99, "20240224120000"), self.add_sample))
+        result = process_oru(("2", 0, "20240224130000"), self.add_sample)
+        self.assertEqual(result["No_of_Samples"], 2)
+        self.assertIsNone(self.stored("2"))
+
+        self.writer.commit()
+        self.assertEqual(self.stored("2"), (100, 2))
+        self.cursor.execute("SELECT Admission_Status FROM Patient_Data WHERE PID = 2")
+        self.assertEqual(self.cursor.fetchone()[0], "Pending")
+
+    def test_due_and_rollback(self):
+        """The batch is due once max_rows patients are pending; rollback drops it."""
+        self.writer.max_rows = 2
+        process_oru(("1", 0, "20240224120000"), self.add_sample)
+        self.assertFalse(self.writer.due())
+        process_oru(("2", 99, "20240224120000"), self.add_sample)
+        self.assertTrue(self.writer.due())
+
+        self.writer.rollback()
+        self.assertEqual(self.writer.commit(), 0)
+        self.assertEqual(self.stored("1"), (420, 1))
+
+
+if __name__ == "__main__":
+    unittest.main()
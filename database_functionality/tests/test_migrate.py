@@ -0,0 +1,177 @@
+import contextlib
+import io
+import os
+import sqlite3
+import tempfile
+import unittest
+from database_functionality import create_db, migrate
+from database_functionality.schema import SCHEMA_VERSION, from_epoch, to_epoch
+
+class TestMigrate(unittest.TestCase):
+
+    def setUp(self):
+        """Set up a version 1 database with two patients."""
+        self.directory = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.directory.name, "patient_database.db")
+        conn = sqlite3.connect(self.db_path)
+        conn.executescript(migrate.V1_TABLES_SQL)
+        conn.execute("INSERT INTO Patient_Data VALUES (1, 'Yes', '202402231200', '19800520')")
+        conn.execute("INSERT INTO Patient_Data VALUES (2, 'Pending', NULL, NULL)")
+        conn.execute("""
+        INSERT INTO Feature_Store VALUES ('1', 1.0, 43, 10, 50, 30, 5, 420, '20240223120000', 10, 'Yes')
+        """)
+        conn.execute("""
+        INSERT INTO Feature_Store VALUES ('2', NULL, NULL, NULL, NULL, NULL, NULL, 99, NULL, 1, 'No')
+        """)
+        conn.commit()
+        conn.close()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def upgrade(self):
+        with contextlib.redirect_stdout(io.StringIO()):
+            return migrate.upgrade(self.db_path)
+
+    def test_timestamps_round_trip(self):
+        """Stored epoch seconds convert back to the original strings."""
+        self.assertEqual(to_epoch("20240223120000"), 1708689600)
+        self.assertEqual(from_epoch(1708689600), "20240223120000")
+        self.assertEqual(from_epoch(to_epoch("19800520"), "%Y%m%d"), "19800520")
+        self.assertIsNone(to_epoch(None))
+        self.assertIsNone(from_epoch(None))
+
+    def test_upgrade_keeps_data(self):
+        """Version 1 rows are copied with integer PIDs and epoch timestamps."""
+        self.assertTrue(self.upgrade())
+
+        conn = sqlite3.connect(self.db_path)
+        self.assertEqual(conn.execute("PRAGMA user_version").fetchone()[0], SCHEMA_VERSION)
+        self.assertEqual(conn.execute("SELECT * FROM Patient_Data ORDER BY PID").fetchall(), [
+            (1, "Yes", to_epoch("202402231200"), to_epoch("19800520")),
+            (2, "Pending", None, None),
+        ])
+        self.assertEqual(conn.execute("SELECT * FROM Feature_Store ORDER BY PID").fetchall(), [
+            (1, 1, 43, 10.0, 50.0, 30.0, 5.0, 420.0, 1708689600, 10, "Yes"),
+            (2, None, None, None, None, None, None, 99.0, None, 1, "No"),
+        ])
+        self.assertEqual(conn.execute("SELECT typeof(PID) FROM Feature_Store WHERE PID = 1").fetchone(), ("integer",))
+        conn.close()
+
+    def test_upgrade_is_idempotent(self):
+        """A database already at the current version is left alone, as is a new one."""
+        self.upgrade()
+        self.assertFalse(self.upgrade())
+
+        new_path = os.path.join(self.directory.name, "new.db")
+        with contextlib.redirect_stdout(io.StringIO()):
+            create_db.main(new_path)
+        self.assertFalse(migrate.upgrade(new_path))
+
+    def test_failed_upgrade_keeps_v1(self):
+        """A PID that is not an integer stops the upgrade before anything changes."""
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("INSERT INTO Feature_Store (PID, Ready_for_Inference) VALUES ('A3', 'No')")
+        conn.commit()
+        conn.close()
+
+        with self.assertRaises(ValueError):
+            self.upgrade()
+
+        conn = sqlite3.connect(self.db_path)
+        self.assertEqual(migrate.schema_version(conn), 1)
+        self.assertEqual(conn.execute("SELECT COUNT(*) FROM Feature_Store").fetchone()[0], 3)
+        conn.close()
+
+    def test_colliding_pids_refused(self):
+        """'01' and '1' would merge into one patient: the upgrade stops before anything changes."""
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("INSERT INTO Feature_Store (PID, Last_Result_Value, Ready_for_Inference) VALUES ('01', 77, 'No')")
+        conn.commit()
+        conn.close()
+
+        with self.assertRaises(ValueError):
+            self.upgrade()
+
+        conn = sqlite3.connect(self.db_path)
+        self.assertEqual(migrate.schema_version(conn), 1)
+        self.assertEqual(conn.execute("SELECT PID FROM Feature_Store ORDER BY PID").fetchall(), [("01",), ("1",), ("2",)])
+        conn.close()
+
+    def test_batched_upgrade(self):
+        """Copying one row per transaction gives the same tables."""
+        with contextlib.redirect_stdout(io.StringIO()):
+            migrate.upgrade(self.db_path, batch_rows=1)
+
+        conn = sqlite3.connect(self.db_path)
+        self.assertEqual(conn.execute("SELECT PID, Latest_Result_Timestamp FROM Feature_Store ORDER BY PID").fetchall(),
+                         [(1, 1708689600), (2, None)])
+        self.assertEqual(conn.execute("SELECT COUNT(*) FROM Patient_Data").fetchone()[0], 2)
+        conn.close()
+
+    def test_interrupted_upgrade_resumes(self):
+        """Rows left in the new tables by an interrupted run are copied again."""
+        conn = sqlite3.connect(self.db_path)
+        conn.executescript(migrate.V2_TABLES_SQL)
+        conn.execute("INSERT INTO Patient_Data_v2 (PID, Admission_Status) VALUES (1, 'No')")
+        conn.commit()
+        conn.close()
+
+        self.upgrade()
+
+        conn = sqlite3.connect(self.db_path)
+        self.assertEqual(conn.execute("SELECT Admission_Status FROM Patient_Data WHERE PID = 1").fetchone(), ("Yes",))
+        self.assertEqual(conn.execute("SELECT name FROM sqlite_master WHERE name LIKE '%_v2'").fetchall(), [])
+        conn.close()
+
+    def test_upgraded_schema_matches_new(self):
+        """An upgraded database has the same tables as one created at the latest version."""
+        self.assertEqual(migrate.MIGRATIONS[-1][0], SCHEMA_VERSION)
+        self.upgrade()
+        new_path = os.path.join(self.directory.name, "new.db")
+        with contextlib.redirect_stdout(io.StringIO()):
+            create_db.main(new_path)
+
+        def layout(path):
+            conn = sqlite3.connect(path)
+            tables = {table: conn.execute(f"PRAGMA table_info({table})").fetchall()
+                      for table in ("Patient_Data", "Feature_Store")}
+            tables["indexes"] = conn.execute(
+                "SELECT name, tbl_name FROM sqlite_master WHERE type = 'index' ORDER BY name").fetchall()
+            tables["foreign_keys"] = conn.execute("PRAGMA foreign_key_list(Feature_Store)").fetchall()
+            conn.close()
+            return tables
+
+        self.assertEqual(layout(self.db_path), layout(new_path))
+
+    def test_dry_run(self):
+        """A dry run times the pending migrations and leaves the database unchanged."""
+        report = migrate.dry_run(self.db_path)
+
+        self.assertEqual([version for version, description, seconds in report], [2, 3])
+        conn = sqlite3.connect(self.db_path)
+        self.assertEqual(migrate.schema_version(conn), 1)
+        self.assertEqual(conn.execute("SELECT PID FROM Feature_Store ORDER BY PID").fetchall(), [("1",), ("2",)])
+        conn.close()
+
+    def test_newer_database_refused(self):
+        """A database newer than the code is not touched."""
+        conn = sqlite3.connect(self.db_path)
+        conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION + 1}")
+        conn.close()
+
+        with self.assertRaises(ValueError):
+            self.upgrade()
+
+    def test_create_db_upgrades_existing(self):
+        """create_db.main upgrades an existing version 1 database."""
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.assertEqual(create_db.main(self.db_path), 1)
+
+        conn = sqlite3.connect(self.db_path)
+        self.assertEqual(migrate.schema_version(conn), SCHEMA_VERSION)
+        conn.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,105 @@
+import sqlite3
+import unittest
+from unittest.mock import patch
+from database_functionality import db_operations, pid_index
+from database_functionality.db_operations import handle_adt_a01, process_oru
+from database_functionality.pid_index import PidIndex
+from database_functionality.schema import create_tables
+
+class TestPidIndex(unittest.TestCase):
+
+    def test_membership(self):
+        """Known PIDs are found as int or str, unknown ones are not."""
+        index = PidIndex([30, 10, 20])
+        self.assertTrue(index.may_exist(10))
+        self.assertTrue(index.may_exist("20"))
+        self.assertFalse(index.may_exist("15"))
+        self.assertFalse(index.may_exist(40))
+
+    def test_pids_that_are_not_integers_may_exist(self):
+        """PIDs the index cannot hold are always reported as possibly known."""
+        index = PidIndex()
+        for pid in ("A123", "", "1_000", str(1 << 64), None):
+            index.add(pid)
+            self.assertTrue(index.may_exist(pid))
+        self.assertEqual(len(index), 0)
+
+    @patch("database_functionality.pid_index.MIN_MERGE_SIZE", 4)
+    def test_added_pids_are_merged(self):
+        """PIDs added at runtime are found before and after being merged into the sorted array."""
+        index = PidIndex(range(0, 100, 10))
+        for pid in (5, 95, 5, 55, 15):
+            index.add(pid)
+        self.assertEqual(len(index), 14)
+        self.assertEqual(list(index._sorted)[:4], [0, 5, 10, 15])
+        for pid in (5, 15, 55, 95, 90):
+            self.assertTrue(index.may_exist(pid))
+        self.assertFalse(index.may_exist(25))
+
+    def test_load(self):
+        """The index is built from Patient_Data."""
+        conn = sqlite3.connect(":memory:")
+        create_tables(conn)
+        conn.executemany("INSERT INTO Patient_Data (PID, Admission_Status) VALUES (?, 'Pending')",
+                         [(pid,) for pid in (3, 1, 2)])
+
+        index = PidIndex.load(conn, batch_rows=2)
+
+        self.assertEqual(list(index._sorted), [1, 2, 3])
+        conn.close()
+
+
+class TestHandlersWithPidIndex(unittest.TestCase):
+
+    def setUp(self):
+        """A database with one patient, and an index of it installed."""
+        self.conn = sqlite3.connect(":memory:")
+        create_tables(self.conn)
+        self.conn.execute("INSERT INTO Patient_Data (PID, Admission_Status) VALUES (1, 'Yes')")
+        self.conn.execute("INSERT INTO Feature_Store (PID, Last_Result_Value, No_of_Samples, Ready_for_Inference) "
+                          "VALUES (1, 420, 1, 'No')")
+        self.conn.commit()
+
+        patcher = patch("database_functionality.db_operations.connect_db", return_value=self.conn)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.index = PidIndex.load(self.conn)
+        db_operations.enable_pid_index(self.index)
+        self.addCleanup(db_operations.enable_pid_index, None)
+        self.statements = []
+        self.conn.set_trace_callback(self.statements.append)
+
+    def tearDown(self):
+        self.conn.close()
+
+    def selects(self):
+        return [sql for sql in self.statements if sql.lstrip().startswith("SELECT")]
+
+    def test_new_patient_inserted_without_query(self):
+        """A first-time patient goes straight to the inserts and is added to the index."""
+        self.assertIsNone(process_oru(("2", 99, "20240224130000"), lambda old: old))
+        self.assertIsNone(handle_adt_a01(("3", 35, "F")))
+
+        self.assertEqual(self.selects(), [])
+        self.assertTrue(self.index.may_exist("2"))
+        self.assertEqual(self.conn.execute("SELECT PID FROM Patient_Data ORDER BY PID").fetchall(), [(1,), (2,), (3,)])
+
+    def test_known_patient_fetched(self):
+        """A known patient is fetched by key, as without the index."""
+        feature = process_oru(("1", 430, "20240224120000"), lambda old: dict(old, Last_Result_Value=430))
+
+        self.assertEqual(feature["Last_Result_Value"], 430)
+        self.assertEqual(len(self.selects()), 1)
+
+    def test_stale_entry_falls_back_to_query(self):
+        """A PID in the index but not in the database (rolled back insert) is still inserted."""
+        self.index.add("4")
+
+        self.assertIsNone(process_oru(("4", 99, "20240224130000"), lambda old: old))
+
+        self.assertEqual(len(self.selects()), 1)
+        self.assertEqual(self.conn.execute("SELECT COUNT(*) FROM Feature_Store WHERE PID = 4").fetchone()[0], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,11 +1,22 @@
+import contextlib
+import io
+import os
+import tempfile
 import unittest
 import sqlite3
+import numpy as np
 import pandas as pd
 from unittest.mock import patch
+from database_functionality import create_db
+from database_functionality.schema import to_epoch
 from database_functionality.populate_db import (
     process_creatinine_data,
     add_demographics,
     insert_into_database,
+    epoch_seconds,
+    load_history,
+    parse_dates,
+    read_history,
 )
 
 class ConnectionWrapper:
@@ -134,5 +145,105 @@ class TestHistoryFileProcessing(unittest.TestCase):
         # self.assertEqual(len(patient_data_records), len(self.dataset))
 
 
+class TestLoadHistory(unittest.TestCase):
+    HISTORY = (
+        "mrn,creatinine_date_0,creatinine_result_0,creatinine_date_1,creatinine_result_1\n"
+        "1,2024-01-01 15:13:00,126.48,2024-01-15 10:45:00,152.24\n"
+        "2,2024-02-01 08:00:00,90.0,,\n"
+        "3,,,,\n"
+    )
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.csv_path = os.path.join(self.tmp.name, "history.csv")
+        self.db_path = os.path.join(self.tmp.name, "patient_database.db")
+        with open(self.csv_path, "w") as f:
+            f.write(self.HISTORY)
+        with contextlib.redirect_stdout(io.StringIO()):
+            create_db.main(self.db_path)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def features(self):
+        conn = sqlite3.connect(self.db_path)
+        try:
+            return conn.execute("""
+                SELECT PID, Min, Max, Mean, Last_Result_Value, Latest_Result_Timestamp, No_of_Samples
+                FROM Feature_Store ORDER BY PID""").fetchall()
+        finally:
+            conn.close()
+
+    def test_epoch_seconds(self):
+        """datetime64 values are converted to epoch seconds, NaT to None"""
+        values = np.array(["2024-01-15T10:45:07", "NaT"], dtype="datetime64[ns]")
+        self.assertEqual(epoch_seconds(values).tolist(), [1705315507, None])
+
+    def test_load_history(self):
+        """Latest result and aggregates are loaded, rows without results get NULLs"""
+        rows = load_history(self.csv_path, self.db_path, use_random=False)
+
+        self.assertEqual(rows, 3)
+        self.assertEqual(self.features(), [
+            (1, 126.48, 152.24, 139.36, 152.24, to_epoch("20240115104500"), 2),
+            (2, 90.0, 90.0, 90.0, 90.0, to_epoch("20240201080000"), 1),
+            (3, None, None, None, None, None, 0),
+        ])
+        conn = sqlite3.connect(self.db_path)
+        self.assertEqual(conn.execute("SELECT PID, DOB, Admission_Status FROM Patient_Data ORDER BY PID").fetchall(),
+                         [(1, None, "Pending"), (2, None, "Pending"), (3, None, "Pending")])
+        # The bulk load runs without a journal; the normal mode is restored afterwards
+        self.assertEqual(conn.execute("PRAGMA journal_mode").fetchone()[0], "delete")
+        conn.close()
+
+    def test_load_history_in_chunks(self):
+        """Loading one row at a time gives the same tables"""
+        load_history(self.csv_path, self.db_path, use_random=False)
+        whole = self.features()
+
+        load_history(self.csv_path, self.db_path, use_random=False, chunk_rows=1)
+
+        self.assertEqual(self.features(), whole)
+
+    def test_load_history_random_demographics(self):
+        """Random demographics fill DOB, Age and Sex within the schema's constraints"""
+        load_history(self.csv_path, self.db_path, use_random=True)
+
+        conn = sqlite3.connect(self.db_path)
+        for age, sex in conn.execute("SELECT Age, Sex FROM Feature_Store"):
+            self.assertGreaterEqual(age, 18)
+            self.assertIn(sex, (0, 1))
+        for (dob,) in conn.execute("SELECT DOB FROM Patient_Data"):
+            self.assertEqual(dob % 86400, 0)  # midnight
+        conn.close()
+
+    def test_parse_dates(self):
+        """ISO dates are parsed directly, other formats through inference, missing values as NaT"""
+        iso = parse_dates(np.array(["2029-08-24 20:29:32", None], dtype=object))
+        self.assertEqual(iso[0], np.datetime64("2029-08-24T20:29:32"))
+        self.assertTrue(np.isnat(iso[1]))
+        other = parse_dates(np.array(["24 Aug 2029 20:29"], dtype=object))
+        self.assertEqual(other[0], np.datetime64("2029-08-24T20:29"))
+
+    def test_chunks_sized_by_cells(self):
+        """Chunks hold at most HISTORY_CHUNK_CELLS cells, however wide the rows"""
+        with patch("database_functionality.populate_db.HISTORY_CHUNK_CELLS", 10):
+            chunks = list(read_history(self.csv_path))
+
+        # 5 columns: 2 rows per chunk
+        self.assertEqual([len(chunk) for chunk in chunks], [2, 1])
+        self.assertEqual(chunks[1]["creatinine_result_1"].dtype, float)
+
+    def test_failed_load_leaves_empty_tables(self):
+        """A failing load (duplicate PID) is not left half-inserted"""
+        with open(self.csv_path, "a") as f:
+            f.write("1,2024-03-01 08:00:00,80.0,,\n")
+
+        with self.assertRaises(sqlite3.IntegrityError):
+            load_history(self.csv_path, self.db_path, use_random=False)
+
+        self.assertEqual(self.features(), [])
+
+
 if __name__ == "__main__":
     unittest.main()
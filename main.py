@@ -1,66 +1,331 @@
 #!/usr/bin/env python3
+import time
+PROCESS_START = time.perf_counter()  # before the other imports, for the startup report
 import socket
+import select
 import os
-import time
-from utils import parse_mllp_stream, build_hl7_ack, GracefulKiller
-from message_parsing.main import message_consumer
+import threading
+import importlib
+import asyncio
+from utils import MLLPReader, build_hl7_ack, GracefulKiller
+import message_parsing.main
+import ml.main
+from message_parsing.main import message_consumer, parsed_message_consumer, enable_micro_batching
+from parsing.pool import ParserPool
+from async_pipeline import AsyncPipeline
 from database_functionality import populate_db
 from database_functionality import create_db
-from monitoring.metrics import init_metrics, SOCKET_TIMEOUTS
+from database_functionality import db_operations
+from database_functionality.feature_cache import FeatureCache
+from database_functionality.group_commit import GroupCommitWriter
+from database_functionality.pid_index import PidIndex
+from ml.inference import load_model, start_model_watcher
+from ml.batching import MicroBatcher
+from ml.main import ml_consumer_batch, enable_pager_dispatch
+from ml.dispatch import PagerDispatcher
+from ml.pager import PagerClient
+from monitoring.metrics import init_metrics, SOCKET_TIMEOUTS, startup_phase, record_startup_phase
 
 DELAY_RETRY = 10
+CONNECT_RETRY = 1  # seconds between attempts to connect to the simulator
 TIMEOUT = 20
+# Opt-in: ACK all messages decoded from one recv with a single sendall
+PIPELINE_ACKS = os.getenv("PIPELINE_ACKS", "0") == "1"
+# Opt-in: serve Feature_Store from memory, written back through a journal
+FEATURE_CACHE = os.getenv("FEATURE_CACHE", "0") == "1"
+FEATURE_CACHE_JOURNAL = os.path.join("/state", "feature_cache.journal")
+FEATURE_CACHE_FLUSH_ROWS = int(os.getenv("FEATURE_CACHE_FLUSH_ROWS", 500))
+FEATURE_CACHE_MAX_STALENESS = float(os.getenv("FEATURE_CACHE_MAX_STALENESS", 1.0))  # seconds
+# Opt-in: keep the known PIDs in memory, so first-time patients are inserted without an existence query
+PID_INDEX = os.getenv("PID_INDEX", "0") == "1"
+# Opt-in: commit ORU writes in groups, holding their ACKs until the group is durable
+GROUP_COMMIT = os.getenv("GROUP_COMMIT", "0") == "1"
+GROUP_COMMIT_ROWS = int(os.getenv("GROUP_COMMIT_ROWS", 100))
+GROUP_COMMIT_DELAY = float(os.getenv("GROUP_COMMIT_DELAY_MS", 0)) / 1000  # seconds, 0: commit when the socket is idle
+# Opt-in: predict for the patients of several messages with one model call
+MICRO_BATCH = os.getenv("MICRO_BATCH", "0") == "1"
+MICRO_BATCH_ROWS = int(os.getenv("MICRO_BATCH_ROWS", 32))
+MICRO_BATCH_DELAY = float(os.getenv("MICRO_BATCH_DELAY_MS", 0)) / 1000  # seconds, 0: predict when the socket is idle
+# Opt-in: run the staged asyncio pipeline (async_pipeline.py) instead of the synchronous loop
+ASYNC_PIPELINE = os.getenv("ASYNC_PIPELINE", "0") == "1"
+PIPELINE_QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", 256))
+# Opt-in: parse the hl7apy fallbacks on this many worker processes (0: parse everything in the main loop)
+PARSE_WORKERS = int(os.getenv("PARSE_WORKERS", 0))
+PARSE_CHUNK_SIZE = int(os.getenv("PARSE_CHUNK_SIZE", 16))
+# Pages are sent by background workers; undelivered ones are kept in a journal
+PAGER_JOURNAL = os.path.join("/state", "pager.journal")
+PAGER_WORKERS = int(os.getenv("PAGER_WORKERS", 4))
+PAGER_CONNECT_TIMEOUT = float(os.getenv("PAGER_CONNECT_TIMEOUT", 0.2))  # seconds
+PAGER_READ_TIMEOUT = float(os.getenv("PAGER_READ_TIMEOUT", 1.0))  # seconds
+# Seconds between checks for a new model version in MODEL_DIR (0: never reload)
+MODEL_WATCH_INTERVAL = float(os.getenv("MODEL_WATCH_INTERVAL", 30))
+
+first_ack_sent = False
+
+def send_acks(sock, ack_message, count):
+    """
+    Send 'count' ACKs in one sendall call. ACKs carry no message reference,
+    so sending them back to back keeps the order the simulator expects.
+    """
+    global first_ack_sent
+    if count:
+        sock.sendall(ack_message * count)
+        if count == 1:
+            print("[main] Sent MLLP ACK.")
+        else:
+            print(f"[main] Sent {count} MLLP ACKs.")
+        if not first_ack_sent:
+            first_ack_sent = True
+            record_startup_phase("first_ack", time.perf_counter() - PROCESS_START)
+
+class AckQueue:
+    """
+    ACKs of processed messages, in arrival order. An ACK is only sent once
+    its message is fully handled: immediately by default, otherwise after
+    the group-commit writer's next commit and the micro-batcher's next
+    predictions.
+    """
+
+    def __init__(self, sock, ack_message, pipeline=False, writer=None, batcher=None):
+        self.sock = sock
+        self.ack_message = ack_message
+        self.pipeline = pipeline  # hold ACKs until release() at the end of a read
+        self.writer = writer      # GroupCommitWriter or None
+        self.batcher = batcher    # MicroBatcher or None
+        self.pending = 0          # processed messages not ACKed yet
+        self.durable = 0          # how many of those are fully handled
+
+    def buffered(self):
+        """The writer and batcher that hold work of pending messages."""
+        return [stage for stage in (self.writer, self.batcher) if stage is not None and len(stage)]
+
+    def add(self):
+        """Record one processed message."""
+        self.pending += 1
+        if not self.buffered():
+            self.durable = self.pending  # nothing buffered: everything so far is handled
+        if not self.pipeline:
+            self.release()
+
+    def release(self, force=False):
+        """Send the ACKs of durable messages, committing/predicting first if a batch is due (or force)."""
+        buffered = self.buffered()
+        if buffered and (force or any(stage.due() for stage in buffered)):
+            if self.writer is not None:
+                self.writer.commit()
+            if self.batcher is not None:
+                self.batcher.flush()
+            self.durable = self.pending
+        send_acks(self.sock, self.ack_message, self.durable)
+        self.pending -= self.durable
+        self.durable = 0
+
+    def wait_time(self):
+        """How long the next read may block before held ACKs must be released (None: no limit)."""
+        if not self.pending:
+            return None
+        if self.writer is None and self.batcher is None:
+            return 0
+        waits = [stage.time_left() for stage in self.buffered()]
+        return min(waits) if waits else None
+
+    def abort(self):
+        """
+        Connection lost or processing failed: ACK what is already durable and
+        drop the buffered writes, whose messages will be redelivered. Buffered
+        predictions still run, so no alert is lost. Never raises, so the error
+        that caused the abort is the one reported.
+        """
+        if self.writer is not None:
+            try:
+                self.writer.rollback()
+            except Exception as e:
+                print(f"[main] Error {e} while rolling back buffered writes")
+        if self.batcher is not None:
+            try:
+                self.batcher.flush()
+            except Exception as e:
+                print(f"[main] Error {e} while flushing predictions")
+        try:
+            send_acks(self.sock, self.ack_message, self.durable)
+        except Exception as e:
+            print(f"[main] Error {e} while sending ACKs")
+        self.pending = self.durable = 0
+
+def warm_up():
+    """
+    Load the heavy dependencies (sklearn model, hl7apy) in the background,
+    while the database is set up and the socket connects. Anything
+    not loaded yet when the first message arrives is loaded on first use.
+    """
+    try:
+        with startup_phase("model_load"):
+            load_model()
+        if MODEL_WATCH_INTERVAL > 0:
+            start_model_watcher(MODEL_WATCH_INTERVAL)
+        with startup_phase("import_hl7apy"):
+            importlib.import_module("hl7apy.parser")
+    except Exception as e:
+        print(f"[main] Warm-up error: {e}")
+
+def init_pipeline():
+    """
+    Create and populate the database, then set up the pager dispatcher and
+    the opt-in stages. Returns the parser pool, or None.
+    """
+    with startup_phase("db_init"):
+        db_flag = create_db.main()
+        if not db_flag:
+            populate_db.main()   # populate the db with history.csv
+    pager = PagerClient(connect_timeout=PAGER_CONNECT_TIMEOUT, read_timeout=PAGER_READ_TIMEOUT,
+                        pool_size=PAGER_WORKERS)
+    pager_dispatcher = PagerDispatcher(pager.send, PAGER_JOURNAL, workers=PAGER_WORKERS)
+    enable_pager_dispatch(pager_dispatcher.open().start())
+    if PID_INDEX:
+        with startup_phase("pid_index"):
+            pid_index = PidIndex.load(db_operations.connect_db())
+            db_operations.enable_pid_index(pid_index)
+        print(f"[main] PID index: {len(pid_index)} patients, {pid_index.nbytes() / 2**20:.1f} MB")
+    if FEATURE_CACHE:
+        with startup_phase("feature_cache"):
+            feature_cache = FeatureCache(db_operations.connect_db, FEATURE_CACHE_JOURNAL,
+                                         flush_rows=FEATURE_CACHE_FLUSH_ROWS,
+                                         max_staleness=FEATURE_CACHE_MAX_STALENESS,
+                                         pids=db_operations.pids).open()
+            feature_cache.start_flusher()
+            db_operations.enable_feature_cache(feature_cache)
+    if GROUP_COMMIT:
+        db_operations.enable_group_commit(GroupCommitWriter(db_operations.connect_db,
+                                                            max_rows=GROUP_COMMIT_ROWS,
+                                                            max_delay=GROUP_COMMIT_DELAY))
+    if MICRO_BATCH:
+        enable_micro_batching(MicroBatcher(ml_consumer_batch, max_rows=MICRO_BATCH_ROWS,
+                                           max_delay=MICRO_BATCH_DELAY))
+    parser_pool = None
+    if PARSE_WORKERS > 0:
+        with startup_phase("parser_pool"):
+            parser_pool = ParserPool(PARSE_WORKERS, chunk_size=PARSE_CHUNK_SIZE)
+            parser_pool.warm_up()
+    return parser_pool
+
+def shutdown(parser_pool):
+    """
+    Stop what init_pipeline set up, after it failed or before the pod stops:
+    the cached features are written back, undelivered pages stay in the
+    pager journal.
+    """
+    if parser_pool is not None:
+        parser_pool.close()
+    if ml.main.dispatcher is not None:
+        ml.main.dispatcher.close(timeout=1)
+        enable_pager_dispatch(None)
+    if db_operations.cache is not None:
+        db_operations.cache.close()
+        db_operations.enable_feature_cache(None)
+    db_operations.enable_group_commit(None)
+    db_operations.enable_pid_index(None)
+    enable_micro_batching(None)
 
 def main():
     killer = GracefulKiller()
-    init_flag = True
+    metrics_started = False  # metrics server and warm-up: once, before the first connect attempt
+    init_flag = True         # database and pipeline setup: until it succeeds, before connecting
+    connected = False        # first successful connect, for the startup report
     timeout_reconnect_flag = False #prevent print statement if reconnect is due to timeout (prevent spam)
+    pipeline = None
+    parser_pool = None
     while not killer.kill_now:
         try:
-            if init_flag:
-                init_flag = False
+            if not metrics_started:
+                metrics_started = True
                 prometheus_port = int(os.getenv("PROMETHEUS_PORT", 9090))
                 init_metrics(prometheus_port)
                 print(f"[main] Prometheus metrics server running on port {prometheus_port}.")
-                db_flag = create_db.main()
-                if not db_flag:
-                    populate_db.main()   # populate the db with history.csv
+                record_startup_phase("imports", time.perf_counter() - PROCESS_START)
+                threading.Thread(target=warm_up, name="warm-up", daemon=True).start()
+
+            # Set up before connecting: the simulator waits only a few seconds
+            # for each ACK, less than loading a large history.csv takes
+            if init_flag:
+                try:
+                    parser_pool = init_pipeline()
+                except Exception as e:
+                    print(f"[main] Setup error: {e}, retrying in {DELAY_RETRY} seconds")
+                    shutdown(None)
+                    time.sleep(DELAY_RETRY)
+                    continue
+                init_flag = False
 
             sim_address = os.getenv('MLLP_ADDRESS')  # Connect to Simulator's TCP MLLP port
             # sim_address = 'localhost:8440'
 
             sim_host, sim_port = sim_address.split(":")
             sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            sock.connect((sim_host, int(sim_port)))
+            try:
+                sock.connect((sim_host, int(sim_port)))
+            except OSError as e:
+                print(f"[main] Could not connect to simulator at {sim_host}:{sim_port}: {e}, "
+                      f"retrying in {CONNECT_RETRY} seconds")
+                sock.close()
+                time.sleep(CONNECT_RETRY)
+                continue
             sock.settimeout(TIMEOUT)
             if not timeout_reconnect_flag:
                 timeout_reconnect_flag = False
                 print(f"[main] Connected to simulator at {sim_host}:{sim_port} ...")
-            leftover = b""
+
+            if not connected:
+                connected = True
+                record_startup_phase("connect", time.perf_counter() - PROCESS_START)
             ack_message = build_hl7_ack()
+            if ASYNC_PIPELINE:
+                if pipeline is None:
+                    pipeline = AsyncPipeline(ack_message, killer, timeout=TIMEOUT, queue_size=PIPELINE_QUEUE_SIZE,
+                                             batch_rows=MICRO_BATCH_ROWS, parser_pool=parser_pool)
+                try:
+                    timeout_reconnect_flag = not asyncio.run(pipeline.serve(sock))
+                except Exception as e:
+                    print(f"[main] Error: {e}, reconnecting to socket in {DELAY_RETRY} seconds")
+                    timeout_reconnect_flag = False
+                    time.sleep(DELAY_RETRY)
+                continue
+
+            reader = MLLPReader(sock)
+            acks = AckQueue(sock, ack_message, pipeline=PIPELINE_ACKS, writer=db_operations.writer,
+                            batcher=message_parsing.main.batcher)
             while not killer.kill_now:
                 try:
+                    # 0. Release held ACKs if a batch window closes before more data arrives
+                    wait = acks.wait_time()
+                    if wait is not None and not select.select([sock], [], [], wait)[0]:
+                        acks.release(force=True)
+                        continue
+
                     # 1. Read data from the simulator
-                    chunk = sock.recv(1024)
-                    if not chunk:
+                    if not reader.read():
                         print("[main] Simulator closed connection.")
                         timeout_reconnect_flag = False
+                        acks.abort()
                         break  # connection closed by server
-                    leftover += chunk
 
-                    # 2. Try to parse out complete MLLP‐framed messages
-                    messages, leftover = parse_mllp_stream(leftover)
+                    # 2. For each complete MLLP‐framed HL7 message:
+                    if parser_pool is not None:
+                        # Parse this read's frames (hl7apy fallbacks on the workers), then consume in order
+                        received = time.time()
+                        for mssg_type, data in parser_pool.parse([bytes(msg) for msg in reader]):
+                            parsed_message_consumer(mssg_type, data, received)
+                            acks.add()
+                    else:
+                        for msg in reader:
+                            # Here 'msg' is a memoryview of the raw HL7 bytes between 0x0B and 0x1C
+                            # hl7_str = msg.decode("utf-8", errors="replace")
+                            # print(f"[main] Received HL7 message:\n{hl7_str}")
 
-                    # 3. For each complete HL7 message:
-                    for msg in messages:
-                        # Here 'msg' is the raw HL7 bytes between 0x0B and 0x1C
-                        # hl7_str = msg.decode("utf-8", errors="replace")
-                        # print(f"[main] Received HL7 message:\n{hl7_str}")
+                            message_consumer(msg)
+                            acks.add()
 
-                        message_consumer(msg)
-
-                        sock.sendall(ack_message)
-                        print("[main] Sent MLLP ACK.")
+                    # 3. ACK whatever is durable (all of it unless a commit group is still open)
+                    acks.release()
 
                 except socket.timeout:
                     #print(f"[main] Socket timed out.")
@@ -70,6 +335,7 @@ def main():
                 except Exception as e:
                     print(f"[main] Error: {e}, reconnecting to socket in {DELAY_RETRY} seconds")
                     timeout_reconnect_flag = False
+                    acks.abort()
                     try:
                         sock.close()
                     except Exception as e:
@@ -83,5 +349,7 @@ def main():
             print(f"[main] Received Error: {e}")
             continue
 
+    shutdown(parser_pool)
+
 if __name__ == "__main__":
     main()
@@ -1,12 +1,63 @@
-from database_functionality.db_operations import handle_adt_a01
-from database_functionality.db_operations import handle_oru_a01
-from database_functionality.db_operations import update_feature_store
+from database_functionality.db_operations import handle_adt_a01, handle_adt_a03
+from database_functionality.db_operations import process_oru
 from ml.feature_construct import update
 from ml.main import ml_consumer
 from parsing.hl7 import mssg_parser
 from monitoring.metrics import MESSAGES_PROCESSED, PROCESSING_TIME, SYSTEM_HEALTH, record_error
 import time
 
+# ml.batching.MicroBatcher, installed by main.py when MICRO_BATCH=1
+batcher = None
+
+def enable_micro_batching(micro_batcher):
+    """Send records ready for inference to 'micro_batcher' (None: predict one at a time)."""
+    global batcher
+    batcher = micro_batcher
+
+def construct_feature(old_feat, data, mssg_type, ready):
+    '''
+    Feature construction for an ORU^R01 message, called by process_oru
+    with the patient's stored record while it holds the write lock
+    -> updates the old feature with incoming data
+    -> hands a copy of the record to 'ready' when it is ready for inference
+
+    Returns the feature to write back to the DB. Inference is left to the
+    caller, after the transaction: a model call or a page must not hold
+    the write lock.
+    '''
+    new_feature = update(old_feat, data, mssg_type)
+
+    if new_feature['Ready_for_Inference'] == 'Yes':
+        ready(dict(new_feature))
+        new_feature['Ready_for_Inference'] = 'No'
+
+    return new_feature
+
+def predict(record):
+    '''
+    Send a record that is ready for inference to the micro-batcher, or
+    predict (and page) for it now
+    '''
+    if batcher is not None:
+        batcher.add(record)
+    else:
+        ml_consumer(record)
+
+def store_message(mssg_type, data):
+    '''
+    DB part of message_consumer, for callers that run inference themselves
+    (see async_pipeline): applies a parsed message to the DB and returns the
+    record that is ready for inference, or None
+    '''
+    ready = []
+    if mssg_type=='ADT^A01':
+        handle_adt_a01(data)
+    elif mssg_type=='ADT^A03':
+        handle_adt_a03(data)
+    elif mssg_type=='ORU^R01':
+        process_oru(data, lambda old_feat: construct_feature(old_feat, data, mssg_type, ready.append))
+    return ready[0] if ready else None
+
 def message_consumer(msg):
     '''
     Handles the incoming messages individually
@@ -23,36 +74,46 @@ def message_consumer(msg):
         start_time = time.time()
         # hl7 message parsing
         mssg_type, data = mssg_parser(msg) 
+    except Exception as e:
+        record_error(error_type=str(e.__class__.__name__), component="message_consumer")
+        print(f"[message_consumer] Error: {e}")
+        raise
+    parsed_message_consumer(mssg_type, data, start_time)
+
+def parsed_message_consumer(mssg_type, data, start_time=None):
+    '''
+    message_consumer for a message that is already parsed (see parsing.pool)
+
+    Args-
+    mssg_type, data: result of mssg_parser
+    start_time: time.time() when the message was received
+    '''
+    try:
+        if start_time is None:
+            start_time = time.time()
 
         # Increment the counter for the message type
         MESSAGES_PROCESSED.labels(message_type=mssg_type).inc()
 
         # Fetch data from DB
         if mssg_type=='ADT^A01':
-            old_feat = handle_adt_a01(data)
+            handle_adt_a01(data)
+        elif mssg_type=='ADT^A03':
+            handle_adt_a03(data)
         elif mssg_type=='ORU^R01':
-            old_feat = handle_oru_a01(data)
-        else:
-            old_feat = None
-
-        # feture construction
-        if old_feat is not None and mssg_type=='ORU^R01':
-            new_feature = update(old_feat, data, mssg_type)  #updates the old feature with incoming data
-
-            # Send to ML Queue when ready for inference
-            if new_feature['Ready_for_Inference'] == 'Yes':
-
-                ml_consumer(new_feature)
-                new_feature['Ready_for_Inference'] = 'No'
-
-            # Update the DB with the new feature
-            update_feature_store(new_feature['PID'], new_feature)
+            # Read, update and write back the feature in one DB transaction,
+            # then run inference once it is committed
+            ready = []
+            new_feature = process_oru(data, lambda old_feat: construct_feature(old_feat, data, mssg_type, ready.append))
+            for record in ready:
+                predict(record)
 
-            # Record processing time
-            end_time = time.time()
-            processing_time = end_time - start_time
-            PROCESSING_TIME.labels(message_type=mssg_type).observe(processing_time)
+            if new_feature is not None:
+                # Record processing time
+                end_time = time.time()
+                processing_time = end_time - start_time
+                PROCESSING_TIME.labels(message_type=mssg_type).observe(processing_time)
     except Exception as e:
         record_error(error_type=str(e.__class__.__name__), component="message_consumer")
         print(f"[message_consumer] Error: {e}")
-        raise
\ No newline at end of file
+        raise
@@ -1,27 +1,31 @@
 import unittest
 from unittest.mock import patch, MagicMock
-from message_parsing.main import message_consumer
+from message_parsing.main import message_consumer, store_message
 
 
 class TestMessageConsumer(unittest.TestCase):
 
     @patch("message_parsing.main.mssg_parser")
     @patch("message_parsing.main.handle_adt_a01")
-    @patch("message_parsing.main.handle_oru_a01")
+    @patch("message_parsing.main.process_oru")
     @patch("message_parsing.main.update")
     @patch("message_parsing.main.ml_consumer")
-    @patch("message_parsing.main.update_feature_store")
     def test_message_consumer_oru_r01_ready_for_inference(
-        self, mock_update_feature_store, mock_ml_consumer, 
-        mock_update, mock_handle_oru_a01, mock_handle_adt_a01, mock_mssg_parser
+        self, mock_ml_consumer, mock_update, mock_process_oru, mock_handle_adt_a01, mock_mssg_parser
     ):
         """Test ORU^R01 message where feature is ready for inference"""
         
         # Mock HL7 message parser
         mock_mssg_parser.return_value = ('ORU^R01', ['12345', 1.2, '20250204120000'])
 
-        # Mock database response
-        mock_handle_oru_a01.return_value = {'PID': '12345', 'Mean': 1.1, 'Ready_for_Inference': 'No'}
+        # Mock database transaction: call back with the stored record; no
+        # inference may run while it is open
+        old_feature = {'PID': '12345', 'Mean': 1.1, 'Ready_for_Inference': 'No'}
+        def transaction(data, update_feature):
+            new_feature = update_feature(old_feature)
+            mock_ml_consumer.assert_not_called()
+            return new_feature
+        mock_process_oru.side_effect = transaction
 
         # Mock feature update
         updated_feature = {'PID': '12345', 'Mean': 1.1, 'Ready_for_Inference': 'Yes'}
@@ -30,16 +34,19 @@ class TestMessageConsumer(unittest.TestCase):
         # Call function
         message_consumer("fake_hl7_message")
 
-        # Verify ML was called
-        mock_ml_consumer.assert_called_once_with(updated_feature)
+        # Verify the feature was constructed from the stored record
+        mock_update.assert_called_once_with(old_feature, ['12345', 1.2, '20250204120000'], 'ORU^R01')
+
+        # Verify ML was called, after the transaction, with the ready record
+        mock_ml_consumer.assert_called_once_with({'PID': '12345', 'Mean': 1.1, 'Ready_for_Inference': 'Yes'})
 
-        # Verify feature store update was called
-        mock_update_feature_store.assert_called_once_with('12345', {'PID': '12345', 'Mean': 1.1, 'Ready_for_Inference': 'No'})  
+        # Verify the feature written back is no longer ready for inference
+        self.assertEqual(updated_feature['Ready_for_Inference'], 'No')
 
     @patch("message_parsing.main.mssg_parser")
     @patch("message_parsing.main.handle_adt_a01")
-    @patch("message_parsing.main.update_feature_store")
-    def test_message_consumer_adt_a01(self, mock_update_feature_store, mock_handle_adt_a01, mock_mssg_parser):
+    @patch("message_parsing.main.process_oru")
+    def test_message_consumer_adt_a01(self, mock_process_oru, mock_handle_adt_a01, mock_mssg_parser):
         """Test ADT^A01 message type"""
         
         # Mock HL7 message parser
@@ -51,8 +58,51 @@ class TestMessageConsumer(unittest.TestCase):
         # Call function
         message_consumer("fake_hl7_message")
 
-        # Verify update_feature_store was NOT called
-        mock_update_feature_store.assert_not_called()
+        # Verify the ORU transaction was NOT run
+        mock_process_oru.assert_not_called()
+
+    @patch("message_parsing.main.mssg_parser")
+    @patch("message_parsing.main.handle_adt_a03")
+    @patch("message_parsing.main.process_oru")
+    def test_message_consumer_adt_a03(self, mock_process_oru, mock_handle_adt_a03, mock_mssg_parser):
+        """Test ADT^A03 message type"""
+        mock_mssg_parser.return_value = ('ADT^A03', ['12345'])
+
+        message_consumer("fake_hl7_message")
+
+        mock_handle_adt_a03.assert_called_once_with(['12345'])
+        mock_process_oru.assert_not_called()
+
+    @patch("message_parsing.main.mssg_parser")
+    @patch("message_parsing.main.process_oru")
+    @patch("message_parsing.main.update")
+    @patch("message_parsing.main.ml_consumer")
+    def test_message_consumer_micro_batching(self, mock_ml_consumer, mock_update, mock_process_oru, mock_mssg_parser):
+        """Test that a ready record goes to the micro-batcher when one is installed"""
+        mock_mssg_parser.return_value = ('ORU^R01', ['12345', 1.2, '20250204120000'])
+        mock_process_oru.side_effect = lambda data, update_feature: update_feature({'PID': '12345'})
+        mock_update.return_value = {'PID': '12345', 'Ready_for_Inference': 'Yes'}
+        batcher = MagicMock()
+
+        with patch("message_parsing.main.batcher", batcher):
+            message_consumer("fake_hl7_message")
+
+        batcher.add.assert_called_once()
+        self.assertEqual(batcher.add.call_args[0][0]['PID'], '12345')
+        mock_ml_consumer.assert_not_called()
+
+    @patch("message_parsing.main.process_oru")
+    @patch("message_parsing.main.update")
+    @patch("message_parsing.main.ml_consumer")
+    def test_store_message_returns_ready_record(self, mock_ml_consumer, mock_update, mock_process_oru):
+        """Test that store_message hands back the ready record instead of running inference"""
+        mock_process_oru.side_effect = lambda data, update_feature: update_feature({'PID': '12345'})
+        mock_update.return_value = {'PID': '12345', 'Ready_for_Inference': 'Yes'}
+
+        record = store_message('ORU^R01', ['12345', 1.2, '20250204120000'])
+
+        self.assertEqual(record, {'PID': '12345', 'Ready_for_Inference': 'Yes'})
+        mock_ml_consumer.assert_not_called()
 
 
 if __name__ == "__main__":
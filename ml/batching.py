@@ -0,0 +1,54 @@
+"""
+batching.py
+
+Micro-batching of model inference.
+
+Every sklearn predict call pays a fixed cost (input validation, array
+creation) that is far larger than the arithmetic for a single patient.
+MicroBatcher collects the records that are ready for inference and hands
+them to 'consume' (ml.main.ml_consumer_batch) in one call once 'max_rows'
+records are pending or the oldest one is 'max_delay' seconds old.
+
+main.py holds the MLLP ACKs of the buffered messages until flush() returns,
+as it does for the group-commit writer.
+"""
+import time
+
+from monitoring.metrics import ML_BATCH_ROWS
+
+
+class MicroBatcher:
+    """Buffers records ready for inference and predicts them in batches."""
+
+    def __init__(self, consume, max_rows=32, max_delay=0.0):
+        self.consume = consume      # called with a list of feature dicts
+        self.max_rows = max_rows
+        self.max_delay = max_delay  # seconds
+        self._records = []
+        self._oldest = None
+
+    def __len__(self):
+        return len(self._records)
+
+    def add(self, record):
+        """Buffer one feature dict (a copy is kept)."""
+        if not self._records:
+            self._oldest = time.monotonic()
+        self._records.append(dict(record))
+
+    def time_left(self):
+        """Seconds until the pending batch is due, or None if nothing is pending."""
+        if not self._records:
+            return None
+        return max(0.0, self.max_delay - (time.monotonic() - self._oldest))
+
+    def due(self):
+        return len(self) >= self.max_rows or self.time_left() == 0.0
+
+    def flush(self):
+        """Run inference on every pending record. Returns the number of records."""
+        records, self._records = self._records, []
+        if records:
+            ML_BATCH_ROWS.observe(len(records))
+            self.consume(records)
+        return len(records)
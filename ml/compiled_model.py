@@ -0,0 +1,178 @@
+"""
+compiled_model.py
+
+Export of the trained sklearn pipeline to flat arrays, and a predictor that
+evaluates them without sklearn.
+
+The trained model is a StandardScaler followed by a binary linear
+classifier (LogisticRegressionCV), so it reduces to
+
+    score = sum((x - mean) / scale * coef) + intercept
+    label = classes[score > 0]
+
+The arrays are stored either as JSON (floats round-trip exactly through
+repr) or as a flat binary artifact that is memory-mapped rather than read
+(see ml.registry for the versioned copies). Loading takes well under a
+millisecond and needs neither sklearn nor NumPy. Batches are evaluated with
+NumPy using the same operations as sklearn; single rows use a plain loop.
+
+Binary layout (little-endian): a 32 byte header
+    magic b"AKIM", format u16, n_features u16, intercept f64, classes 2 x i64
+followed by the float64 arrays mean, scale and coef (n_features each).
+
+Usage (regenerate an artifact after retraining; .bin selects the binary layout):
+    python -m ml.compiled_model ml/trained_model.pkl ml/trained_model.json
+    python -m ml.compiled_model ml/trained_model.pkl ml/models/aki-model-2.bin
+"""
+import json
+import mmap
+import os
+import struct
+import sys
+
+FORMAT = "linear-v1"
+
+BINARY_MAGIC = b"AKIM"
+BINARY_FORMAT = 1
+BINARY_HEADER = struct.Struct("<4sHHd2q")
+
+
+def export_model(estimator):
+    """Flatten a fitted (StandardScaler +) binary linear classifier into a dict of lists."""
+    steps = [step for _, step in estimator.steps] if hasattr(estimator, "steps") else [estimator]
+    *transforms, classifier = steps
+    coef = getattr(classifier, "coef_", None)
+    if coef is None or coef.shape[0] != 1 or len(classifier.classes_) != 2:
+        raise ValueError(f"Unsupported model: {type(classifier).__name__} is not a binary linear classifier")
+
+    n_features = coef.shape[1]
+    mean, scale = [0.0] * n_features, [1.0] * n_features
+    if len(transforms) > 1 or (transforms and type(transforms[0]).__name__ != "StandardScaler"):
+        raise ValueError(f"Unsupported preprocessing: {[type(step).__name__ for step in transforms]}")
+    if transforms:
+        # with_mean=False still fits mean_, but transform does not subtract it
+        scaler = transforms[0]
+        if scaler.with_mean:
+            mean = scaler.mean_.tolist()
+        if scaler.with_std:
+            scale = scaler.scale_.tolist()
+
+    return {
+        "format": FORMAT,
+        "mean": mean,
+        "scale": scale,
+        "coef": coef[0].tolist(),
+        "intercept": float(classifier.intercept_[0]),
+        "classes": classifier.classes_.tolist(),
+    }
+
+
+class LinearModel:
+    """Predictor for an exported model, with the predict() interface of the sklearn pipeline."""
+
+    __slots__ = ("mean", "scale", "coef", "intercept", "classes", "_arrays")
+
+    def __init__(self, params):
+        if params.get("format") != FORMAT:
+            raise ValueError(f"Unknown model format: {params.get('format')}")
+        self.mean = params["mean"]
+        self.scale = params["scale"]
+        self.coef = params["coef"]
+        self.intercept = params["intercept"]
+        self.classes = params["classes"]
+        self._arrays = None
+
+    def decision_function(self, X):
+        """Scores of the rows of X (NumPy, same operations as sklearn)."""
+        import numpy as np  # imported lazily: single rows do not need it
+
+        if self._arrays is None:
+            self._arrays = (np.array(self.mean), np.array(self.scale),
+                            np.array([self.coef]).T, np.array([self.intercept]))
+        mean, scale, coef, intercept = self._arrays
+        X = np.array(X, dtype=float)
+        X -= mean
+        X /= scale
+        return (X @ coef + intercept).reshape(-1)
+
+    def predict_one(self, row):
+        """Label of one row, evaluated in a plain loop."""
+        score = self.intercept
+        for x, mean, scale, coef in zip(row, self.mean, self.scale, self.coef):
+            score += (x - mean) / scale * coef
+        return self.classes[score > 0]
+
+    def predict(self, X):
+        """Labels of the rows of X (a list of rows or a 2D array)."""
+        if isinstance(X, list) and len(X) == 1:
+            return [self.predict_one(X[0])]
+        import numpy as np
+
+        return np.asarray(self.classes)[(self.decision_function(X) > 0).astype(int)]
+
+
+def save(params, path):
+    """
+    Write an exported model, as JSON or (for a .bin path) in the binary
+    layout. The file is written next to 'path' and renamed into place, so
+    a watcher never sees a partial artifact.
+    """
+    temp_path = f"{path}.tmp"
+    if path.endswith(".bin"):
+        with open(temp_path, "wb") as f:
+            f.write(BINARY_HEADER.pack(BINARY_MAGIC, BINARY_FORMAT, len(params["coef"]),
+                                       params["intercept"], *params["classes"]))
+            for name in ("mean", "scale", "coef"):
+                f.write(struct.pack(f"<{len(params[name])}d", *params[name]))
+    else:
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(params, f, indent=1)
+    os.replace(temp_path, path)
+
+
+def load(path):
+    """Load an exported model (JSON, or the binary layout for a .bin path)."""
+    if path.endswith(".bin"):
+        return load_binary(path)
+    with open(path, encoding="utf-8") as f:
+        return LinearModel(json.load(f))
+
+
+def load_binary(path):
+    """
+    Memory-map a binary artifact. The weights are float64 views of the
+    mapping, which stays open for as long as the model is referenced.
+    """
+    if sys.byteorder != "little":
+        raise ValueError("Binary model artifacts need a little-endian host")
+    with open(path, "rb") as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    magic, version, n_features, intercept, *classes = BINARY_HEADER.unpack_from(
+        mapped.read(BINARY_HEADER.size).ljust(BINARY_HEADER.size, b"\0"))
+    size = BINARY_HEADER.size + 3 * 8 * n_features
+    if magic != BINARY_MAGIC or version != BINARY_FORMAT or len(mapped) != size:
+        mapped.close()
+        raise ValueError(f"Not a model artifact: {path}")
+    weights = memoryview(mapped)[BINARY_HEADER.size:].cast("d")
+    return LinearModel({
+        "format": FORMAT,
+        "mean": weights[:n_features],
+        "scale": weights[n_features:2 * n_features],
+        "coef": weights[2 * n_features:],
+        "intercept": intercept,
+        "classes": classes,
+    })
+
+
+def main(argv):
+    import pickle
+
+    source, target = argv
+    with open(source, "rb") as f:
+        params = export_model(pickle.load(f))
+    save(params, target)
+    print(f"[compiled_model] Exported {source} to {target}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,219 @@
+"""
+dispatch.py
+
+Background delivery of pages.
+
+ml.main hands each AKI alert to PagerDispatcher.submit, which journals it
+and returns at once; a bounded pool of worker threads sends the pages and
+retries failures with exponential backoff (capped at 'max_delay'), so a
+slow or failing pager never stalls the MLLP loop.
+
+Only network errors (no status) and 5xx responses are retried. A page the
+pager refuses with another status (4xx: bad MRN, bad request) would be
+refused again, so it is final: logged, counted as "rejected" and dropped.
+
+The journal holds one JSON line per event: ["page", mrn, timestamp] when a
+page is submitted, ["done", mrn, timestamp] once it was delivered and
+["rejected", mrn, timestamp] if the pager refused it. It is fsync'ed
+before submit returns, so a page survives a restart: open() re-queues
+every page without a "done" or "rejected" entry. Pages are deduplicated on
+(MRN, timestamp) - pending ones and the last 'dedup_size' delivered ones -
+so a message redelivered after a reconnect does not page twice.
+"""
+import collections
+import heapq
+import itertools
+import json
+import os
+import random
+import threading
+import time
+
+from monitoring.metrics import PAGER_REQUESTS, PAGER_PENDING, record_error
+
+
+class PagerDispatcher:
+    """Journaled queue of pages, delivered by worker threads with retries."""
+
+    def __init__(self, send, journal_path, workers=4, base_delay=0.5, max_delay=30.0,
+                 dedup_size=100000, fsync=True):
+        self.send = send                # send(mrn, timestamp) -> HTTP status or None
+        self.journal_path = journal_path
+        self.workers = workers
+        self.base_delay = base_delay    # seconds before the first retry
+        self.max_delay = max_delay      # cap of the backoff
+        self.dedup_size = dedup_size
+        self.fsync = fsync
+
+        self._pending = {}                          # (mrn, timestamp) -> failed attempts
+        self._delivered = collections.OrderedDict() # recently delivered (mrn, timestamp)
+        self._queue = []                            # heap of (due, seq, key)
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._stop = False
+        self._threads = []
+        self._journal = None
+        self._entries = 0                           # lines in the journal
+
+    # ------------------------------------------------------------------
+    # Startup and shutdown
+    # ------------------------------------------------------------------
+
+    def open(self):
+        """Re-queue the pages left undelivered by a previous run and open the journal."""
+        if os.path.exists(self.journal_path):
+            with open(self.journal_path, encoding="utf-8") as journal:
+                for line in journal:
+                    try:
+                        event, mrn, timestamp = json.loads(line)
+                    except ValueError:
+                        break  # torn last write: submit never returned
+                    key = (mrn, timestamp)
+                    if event == "page" and key not in self._delivered:
+                        self._pending[key] = 0
+                    elif event in ("done", "rejected"):
+                        self._pending.pop(key, None)
+                        self._remember(key)
+        if self._pending:
+            print(f"[pager] Re-queued {len(self._pending)} undelivered pages")
+        for key in self._pending:
+            heapq.heappush(self._queue, (0.0, next(self._seq), key))
+        self._compact()
+        PAGER_PENDING.set(len(self._pending))
+        return self
+
+    def start(self):
+        """Start the worker threads."""
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"pager-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def close(self, timeout=None):
+        """Stop the workers. Undelivered pages stay in the journal for the next run."""
+        with self._cond:
+            self._stop = True
+            self._cond.notify_all()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+        with self._cond:
+            if self._journal is not None:
+                self._journal.close()
+                self._journal = None
+
+    # ------------------------------------------------------------------
+    # Submission
+    # ------------------------------------------------------------------
+
+    def submit(self, mrn, timestamp):
+        """Queue a page (durably). Returns False if it is a duplicate."""
+        key = (str(mrn), str(timestamp))
+        with self._cond:
+            if key in self._pending or key in self._delivered:
+                return False
+            self._log("page", key)
+            self._pending[key] = 0
+            heapq.heappush(self._queue, (time.monotonic(), next(self._seq), key))
+            PAGER_PENDING.set(len(self._pending))
+            self._cond.notify()
+            return True
+
+    def __len__(self):
+        """Number of pages not delivered yet."""
+        return len(self._pending)
+
+    # ------------------------------------------------------------------
+    # Delivery
+    # ------------------------------------------------------------------
+
+    def _work(self):
+        while True:
+            with self._cond:
+                key = self._next()
+                if key is None:
+                    return
+            try:
+                status = self.send(*key)
+            except Exception as e:
+                record_error(error_type=str(e.__class__.__name__), component="pager")
+                status = None
+            if status is not None and 200 <= status < 300:
+                PAGER_REQUESTS.labels(status="success").inc()
+                self._finish(key, "done")
+            elif status is not None and status < 500:
+                PAGER_REQUESTS.labels(status="rejected").inc()
+                record_error(error_type=f"HTTP {status}", component="pager")
+                print(f"[pager] Page for MRN {key[0]} at {key[1]} rejected by the pager (HTTP {status}), not retried")
+                self._finish(key, "rejected")
+            else:
+                PAGER_REQUESTS.labels(status="error").inc()
+                self._retry(key)
+
+    def _next(self):
+        """Wait for the next due page (called with the condition held). None once stopped."""
+        while not self._stop:
+            if self._queue:
+                wait = self._queue[0][0] - time.monotonic()
+                if wait <= 0:
+                    return heapq.heappop(self._queue)[2]
+                self._cond.wait(wait)
+            else:
+                self._cond.wait()
+        return None
+
+    def _finish(self, key, event):
+        """Drop a page that is delivered ("done") or refused ("rejected") from the queue."""
+        with self._cond:
+            self._pending.pop(key, None)
+            self._remember(key)
+            if self._journal is not None:
+                self._log(event, key)
+                if self._entries > 2 * self.dedup_size:
+                    self._compact()
+            PAGER_PENDING.set(len(self._pending))
+
+    def _retry(self, key):
+        with self._cond:
+            attempts = self._pending[key] = self._pending.get(key, 0) + 1
+            delay = min(self.max_delay, self.base_delay * 2 ** (attempts - 1))
+            delay *= random.uniform(0.5, 1.0)  # jitter, so retries of many pages spread out
+            if attempts == 1:
+                print(f"[pager] Page for MRN {key[0]} failed, retrying in the background")
+            heapq.heappush(self._queue, (time.monotonic() + delay, next(self._seq), key))
+            self._cond.notify()
+
+    # ------------------------------------------------------------------
+    # Journal (called with the condition held)
+    # ------------------------------------------------------------------
+
+    def _remember(self, key):
+        self._delivered[key] = None
+        self._delivered.move_to_end(key)
+        if len(self._delivered) > self.dedup_size:
+            self._delivered.popitem(last=False)
+
+    def _log(self, event, key):
+        self._journal.write(json.dumps([event, *key]) + "\n")
+        self._journal.flush()
+        if self.fsync:
+            os.fsync(self._journal.fileno())
+        self._entries += 1
+
+    def _compact(self):
+        """Rewrite the journal with only the remembered deliveries and the pending pages."""
+        if self._journal is not None:
+            self._journal.close()
+        temp_path = f"{self.journal_path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as journal:
+            for key in self._delivered:
+                journal.write(json.dumps(["done", *key]) + "\n")
+            for key in self._pending:
+                journal.write(json.dumps(["page", *key]) + "\n")
+            journal.flush()
+            if self.fsync:
+                os.fsync(journal.fileno())
+        os.replace(temp_path, self.journal_path)
+        self._entries = len(self._delivered) + len(self._pending)
+        self._journal = open(self.journal_path, "a", encoding="utf-8")
@@ -1,3 +1,125 @@
+import math
+from database_functionality.schema import FEATURE_COLUMNS
+
+
+class PatientFeatures:
+    '''
+    Running creatinine features of one patient.
+
+    The mean and standard deviation are kept as a Welford accumulator
+    (count, mean, M2), which is numerically stable over long histories and
+    converts exactly to and from the Mean / Standard_Deviation /
+    No_of_Samples columns of a Feature_Store row (M2 = std^2 * count).
+    '''
+    __slots__ = ("pid", "sex", "age", "count", "mean", "m2", "min", "max",
+                 "last_value", "last_timestamp")
+
+    def __init__(self, pid, sex=None, age=None, count=0, mean=0.0, m2=0.0, min=None, max=None,
+                 last_value=None, last_timestamp=None):
+        self.pid = pid
+        self.sex = sex
+        self.age = age
+        self.count = count
+        self.mean = mean
+        self.m2 = m2
+        self.min = min
+        self.max = max
+        self.last_value = last_value
+        self.last_timestamp = last_timestamp
+
+    @property
+    def std(self):
+        '''Population standard deviation (ddof=0), None before the first result'''
+        return math.sqrt(self.m2 / self.count) if self.count else None
+
+    @property
+    def ready(self):
+        '''Every feature used by the model is known'''
+        return self.count > 0 and self.sex is not None and self.age is not None
+
+    def add(self, value, timestamp):
+        '''Welford update with one test result'''
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+        self.last_value = value
+        self.last_timestamp = timestamp
+
+    def add_many(self, values, timestamps):
+        '''
+        Add many test results (in arrival order) at once: the batch is
+        summarised with NumPy and merged with Chan et al.'s parallel formula.
+        '''
+        import numpy as np  # imported lazily, only needed for batch updates
+
+        values = np.asarray(values, dtype=float)
+        if not len(values):
+            return
+        n_b = len(values)
+        mean_b = values.mean()
+        m2_b = np.square(values - mean_b).sum()
+
+        total = self.count + n_b
+        delta = mean_b - self.mean
+        self.mean += delta * n_b / total
+        self.m2 += m2_b + delta * delta * self.count * n_b / total
+        self.count = total
+        self.min = float(values.min()) if self.min is None else min(self.min, float(values.min()))
+        self.max = float(values.max()) if self.max is None else max(self.max, float(values.max()))
+        self.last_value = float(values[-1])
+        self.last_timestamp = timestamps[-1]
+
+    @classmethod
+    def from_row(cls, row):
+        '''Build from a Feature_Store record (dict keyed by column name)'''
+        count = row.get("No_of_Samples") or 0
+        if row.get("Mean") is None:
+            # No statistics yet. A patient first seen in an ORU message has
+            # its first result stored only as Last_Result_Value: start from it.
+            if row.get("Last_Result_Value") is not None and count:
+                value = row["Last_Result_Value"]
+                return cls(row.get("PID"), row.get("Sex"), row.get("Age"), 1, value, 0.0, value, value,
+                           value, row.get("Latest_Result_Timestamp"))
+            return cls(row.get("PID"), row.get("Sex"), row.get("Age"))
+        std = row.get("Standard_Deviation") or 0.0
+        return cls(row.get("PID"), row.get("Sex"), row.get("Age"), count, row["Mean"], std * std * count,
+                   row.get("Min"), row.get("Max"), row.get("Last_Result_Value"), row.get("Latest_Result_Timestamp"))
+
+    def to_row(self, ready_for_inference=None):
+        '''Feature_Store record (dict keyed by column name)'''
+        if ready_for_inference is None:
+            ready_for_inference = 'Yes' if self.ready else 'No'
+        return {
+            'PID': self.pid,
+            'Sex': self.sex,
+            'Age': self.age,
+            'Min': self.min,
+            'Max': self.max,
+            'Mean': self.mean if self.count else None,
+            'Standard_Deviation': self.std,
+            'Last_Result_Value': self.last_value,
+            'Latest_Result_Timestamp': self.last_timestamp,
+            'No_of_Samples': self.count,
+            'Ready_for_Inference': ready_for_inference,
+        }
+
+    @classmethod
+    def from_rows(cls, rows):
+        '''Build many from Feature_Store row tuples (FEATURE_COLUMNS order), e.g. a fetchall()'''
+        return [cls.from_row(dict(zip(FEATURE_COLUMNS, row))) for row in rows]
+
+    @staticmethod
+    def to_rows(features):
+        '''Feature_Store row tuples (FEATURE_COLUMNS order), e.g. for executemany'''
+        rows = []
+        for feature in features:
+            row = feature.to_row()
+            rows.append(tuple(row[col] for col in FEATURE_COLUMNS))
+        return rows
+
 
 def update(feature, data, mssg_type):
     '''
@@ -12,30 +134,13 @@ def update(feature, data, mssg_type):
     Returns-
     feature - similar to above dict with changes values
     '''
+    if mssg_type != 'ORU^R01':
+        return feature
 
-    # First time patient with no history
-    if mssg_type=='ORU^R01' and feature['Mean'] == None:
-        feature['Min'] = data[1]
-        feature['Max'] = data[1]
-        feature['Mean'] = data[1]
-        feature['Standard_Deviation'] = 0
-        feature['Last_Result_Value'] = data[1]
-        feature['Latest_Result_Timestamp'] = data[2]
-        feature['No_of_Samples'] += 1
-
-    # Patient with history records
-    elif mssg_type=='ORU^R01' and feature['Mean']!=None:
-        n = feature['No_of_Samples']
-        feature['Min'] = min(data[1], feature['Min'])
-        feature['Max'] = max(data[1], feature['Max'])
-        feature['Mean'] = (n*feature['Mean'] + data[1])/(n+1)
-        feature['Standard_Deviation'] = ( (n/(n+1))*(feature['Standard_Deviation']**2) + ((data[1]-feature['Mean'])**2)/n  )**0.5
-        feature['Last_Result_Value'] = data[1]
-        feature['Latest_Result_Timestamp'] = data[2]
-        feature['No_of_Samples'] += 1
-
-    # Check for inference
-    if all(value is not None for value in feature.values()):
-        feature['Ready_for_Inference'] ='Yes'
+    state = PatientFeatures.from_row(feature)
+    state.add(data[1], data[2])
 
+    # Ready_for_Inference is only ever switched on here; the caller resets it
+    ready = 'Yes' if state.ready else feature.get('Ready_for_Inference')
+    feature.update(state.to_row(ready_for_inference=ready))
     return feature
@@ -1,13 +1,53 @@
 import pickle
 import os
+import threading
+import time
+from ml import compiled_model
+from ml.registry import ModelRegistry
+from monitoring.metrics import MODEL_VERSION, MODEL_LOAD_SECONDS
 
-# Load model once at startup
+# Loaded lazily (see load_model) so that importing this module does not
+# pull in sklearn; main.warm_up loads it in the background at startup.
 MODEL_PATH = "ml/trained_model.pkl"
-if os.path.exists(MODEL_PATH):
-    with open(MODEL_PATH, "rb") as f:
-        model = pickle.load(f)
-else:
-    raise FileNotFoundError(f"Model file not found: {MODEL_PATH}")
+# The same model exported by ml.compiled_model, evaluated without sklearn
+COMPILED_MODEL_PATH = "ml/trained_model.json"
+# Versioned exports, hot-reloaded by the registry (see ml.registry)
+MODEL_DIR = os.getenv("MODEL_DIR", "ml/models")
+model = None
+_model_lock = threading.Lock()
+
+def _activate(new_model):
+    """Swap in a model: one reference assignment, so predictions never see a partial model."""
+    global model
+    model = new_model
+
+registry = ModelRegistry(MODEL_DIR, on_swap=_activate)
+
+def load_model():
+    """
+    Load the model on first use and return it: the newest versioned
+    artifact in MODEL_DIR if any, else the compiled export, else the
+    sklearn pickle.
+    """
+    if model is None:
+        with _model_lock:
+            if model is None and not registry.refresh():
+                start = time.perf_counter()
+                if os.path.exists(COMPILED_MODEL_PATH):
+                    new_model = compiled_model.load(COMPILED_MODEL_PATH)
+                else:
+                    if not os.path.exists(MODEL_PATH):
+                        raise FileNotFoundError(f"Model file not found: {MODEL_PATH}")
+                    with open(MODEL_PATH, "rb") as f:
+                        new_model = pickle.load(f)
+                MODEL_VERSION.set(0)
+                MODEL_LOAD_SECONDS.set(time.perf_counter() - start)
+                _activate(new_model)
+    return model
+
+def start_model_watcher(interval):
+    """Check MODEL_DIR for a new model version every 'interval' seconds."""
+    registry.start_watcher(interval)
 
 def preprocess_data(data):
     """Extract and prepare features from the input dictionary."""
@@ -16,6 +56,18 @@ def preprocess_data(data):
     features = [data["Age"], data["Sex"], data["Mean"], data["Standard_Deviation"], data["Max"], data["Min"], data['Last_Result_Value']]
     return features, mrn, timestamp
 
+def preprocess_batch(records):
+    """Stack the features of many records into one float matrix (one row per record)."""
+    import numpy as np  # imported lazily, like the model
+
+    features = np.empty((len(records), 7), dtype=float)
+    mrns, timestamps = [], []
+    for row, data in enumerate(records):
+        features[row], mrn, timestamp = preprocess_data(data)
+        mrns.append(mrn)
+        timestamps.append(timestamp)
+    return features, mrns, timestamps
+
 def predict_aki(data):
     """
     Predict AKI using the pre-trained model.
@@ -28,8 +80,24 @@ def predict_aki(data):
     """
     try:
         features, mrn, timestamp = preprocess_data(data)
-        result = model.predict([features])  # Wrap in a list for model input
+        result = load_model().predict([features])  # Wrap in a list for model input
         return result, mrn, timestamp
     except Exception as e:
         print(f"[ml_inference] Prediction error: {e}")
-        return None, None, None
\ No newline at end of file
+        return None, None, None
+
+def predict_aki_batch(features):
+    """
+    Predict AKI for many patients with one model call.
+
+    Args:
+        features (numpy.ndarray): one row per patient, columns as in preprocess_data.
+
+    Returns:
+        numpy.ndarray: one prediction per row, or None on failure
+    """
+    try:
+        return load_model().predict(features)
+    except Exception as e:
+        print(f"[ml_inference] Batch prediction error: {e}")
+        return None
@@ -1,15 +1,20 @@
-import time
-from ml.inference import predict_aki
+from ml.inference import predict_aki, predict_aki_batch, preprocess_batch
 from ml.pager import send_pager_request
 from monitoring.metrics import PREDICTIONS_MADE, PAGER_REQUESTS, SYSTEM_HEALTH, record_error
 
+# ml.dispatch.PagerDispatcher, installed by main.py: pages are sent in the
+# background instead of blocking the message path
+dispatcher = None
 
-RESEND_DELAY = 10
+def enable_pager_dispatch(pager_dispatcher):
+    """Queue pages on 'pager_dispatcher' (None: send them synchronously)."""
+    global dispatcher
+    dispatcher = pager_dispatcher
 
 def ml_consumer(data, resend_flag = False):
     '''
-    Function to recieve data after feature reconstruction 
-    -> Predict using ML model 
+    Function to recieve data after feature reconstruction
+    -> Predict using ML model
     -> Send the result to pager
     '''
     try:
@@ -21,33 +26,71 @@ def ml_consumer(data, resend_flag = False):
         if aki_result == None:
             print("[ml_consumer] Prediction Error")
             return
-        if not resend_flag:
-            # Track prediction results
-            PREDICTIONS_MADE.labels(
-                result="positive" if aki_result[0] == 1 else "negative"
-            ).inc()
-
-        if aki_result[0] == 1:
-            pager_status = send_pager_request(mrn, timestamp)
-
-            if pager_status == None or pager_status != 200:
-                PAGER_REQUESTS.labels(status="error").inc()
-                # Network Error or Pager returned 5xx
-                if not resend_flag:
-                    print(f"[ml_consumer] Pager error, retrying in {RESEND_DELAY} seconds")
-                    time.sleep(RESEND_DELAY)
-                    ml_consumer(data, True)
-                else:
-                    print(f"[ml_consumer] Pager error on second retry")
-
-
-            elif pager_status == 200:
-                PAGER_REQUESTS.labels(status="success").inc()
-                # Success => ACK
-                print("[ml_consumer] Pager success, ACKing message.")
-        else:
-            # Add logging for when AKI is not detected
-            print("[ml_consumer] AKI not detected")
+        handle_prediction(aki_result[0], mrn, timestamp, data, resend_flag)
     except Exception as e:
         record_error(error_type=str(e.__class__.__name__), component="ml_inference")
         print(f"[ml_consumer] ERROR: {e}")
+
+def ml_consumer_batch(records):
+    '''
+    Batched version of ml_consumer, called by ml.batching.MicroBatcher
+    -> Predict for every record with one model call
+    -> Send each positive result to pager
+    '''
+    try:
+        SYSTEM_HEALTH.labels(component="ml_inference").set(1)
+        features, mrns, timestamps = preprocess_batch(records)
+        aki_results = predict_aki_batch(features)
+    except Exception as e:
+        record_error(error_type=str(e.__class__.__name__), component="ml_inference")
+        print(f"[ml_consumer] ERROR: {e}")
+        return
+    if aki_results is None:
+        print("[ml_consumer] Prediction Error")
+        return
+
+    for aki_result, mrn, timestamp, data in zip(aki_results, mrns, timestamps, records):
+        try:
+            handle_prediction(aki_result, mrn, timestamp, data)
+        except Exception as e:
+            record_error(error_type=str(e.__class__.__name__), component="ml_inference")
+            print(f"[ml_consumer] ERROR: {e}")
+
+def handle_prediction(aki_result, mrn, timestamp, data, resend_flag = False):
+    '''
+    Record one prediction and page the clinicians if AKI was detected
+    '''
+    if not resend_flag:
+        # Track prediction results
+        PREDICTIONS_MADE.labels(
+            result="positive" if aki_result == 1 else "negative"
+        ).inc()
+
+    if aki_result == 1:
+        if dispatcher is not None:
+            # Delivered (and retried) in the background, see ml.dispatch
+            if dispatcher.submit(mrn, timestamp):
+                print("[ml_consumer] Page queued, ACKing message.")
+            else:
+                print("[ml_consumer] Page already sent or queued.")
+            return
+
+        pager_status = send_pager_request(mrn, timestamp)
+
+        if pager_status == None or pager_status != 200:
+            PAGER_REQUESTS.labels(status="error").inc()
+            # Network Error or Pager returned 5xx
+            if not resend_flag:
+                print(f"[ml_consumer] Pager error, retrying")
+                ml_consumer(data, True)
+            else:
+                print(f"[ml_consumer] Pager error on second retry")
+
+
+        elif pager_status == 200:
+            PAGER_REQUESTS.labels(status="success").inc()
+            # Success => ACK
+            print("[ml_consumer] Pager success, ACKing message.")
+    else:
+        # Add logging for when AKI is not detected
+        print("[ml_consumer] AKI not detected")
@@ -1,11 +1,105 @@
 import requests
 import os
+import threading
+import time
+from requests.adapters import HTTPAdapter
+from monitoring.metrics import PAGER_LATENCY, PAGER_CIRCUIT_OPEN
 
+PAGER_PORT = 8441
 
 
+def resolve_pager_url(address=None):
+    """Pager endpoint from 'address' or PAGER_ADDRESS (host:port or a full URL)."""
+    url = address or os.getenv('PAGER_ADDRESS', default=f"http://127.0.0.1:{PAGER_PORT}/page")
+    if 'http' not in url:
+        url = 'http://' + url + '/page'
+    return url
+
+
+class PagerClient:
+    """
+    Pager HTTP client: the URL is resolved once and pages go through one
+    keep-alive requests.Session (connection pool of 'pool_size').
+
+    A circuit breaker stops calling a pager that keeps failing: after
+    'failure_threshold' consecutive failures (network errors or 5xx) pages
+    fail immediately for 'reset_timeout' seconds, then a single trial page
+    decides whether to close the circuit again.
+    """
+
+    def __init__(self, address=None, connect_timeout=0.2, read_timeout=1.0, pool_size=4,
+                 failure_threshold=5, reset_timeout=5.0):
+        self.url = resolve_pager_url(address)
+        self.timeout = (connect_timeout, read_timeout)
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout  # seconds
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self._lock = threading.Lock()
+        self._failures = 0        # consecutive failures
+        self._opened_at = None    # monotonic time the circuit opened, None when closed
+        self._trial = False       # a half-open trial page is in flight
+
+    def _allow(self):
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if self._trial or time.monotonic() - self._opened_at < self.reset_timeout:
+                return False
+            self._trial = True  # half-open: let one page through
+            return True
+
+    def _record(self, success):
+        with self._lock:
+            self._trial = False
+            if success:
+                self._failures = 0
+                if self._opened_at is not None:
+                    print("[ml_pager] Pager recovered, circuit closed")
+                self._opened_at = None
+            else:
+                self._failures += 1
+                if self._failures >= self.failure_threshold:
+                    if self._opened_at is None:
+                        print(f"[ml_pager] {self._failures} consecutive pager failures, circuit open")
+                    self._opened_at = time.monotonic()
+            PAGER_CIRCUIT_OPEN.set(self._opened_at is not None)
+
+    def send(self, mrn, timestamp):
+        """
+        Sends a pager request with MRN and timestamp.
+
+        Returns:
+            int or None: HTTP status code of the pager, None on a network
+                         error or while the circuit is open.
+        """
+        if not self._allow():
+            return None
+        start = time.perf_counter()
+        try:
+            response = self.session.post(self.url, data=f"{mrn},{timestamp}", timeout=self.timeout)
+        except requests.exceptions.RequestException as e:
+            print(f'[ml_pager] Network error while paging, {e}')
+            self._record(False)
+            return None
+        PAGER_LATENCY.observe(time.perf_counter() - start)
+        self._record(response.status_code < 500)
+        return response.status_code
+
+    def close(self):
+        self.session.close()
+
+
+_client = None
+_client_lock = threading.Lock()
+
 def send_pager_request(mrn, timestamp):
     """
-    Sends a pager request with MRN and timestamp.
+    Sends a pager request with MRN and timestamp through a shared PagerClient.
 
     Args:
         mrn (str): The Medical Record Number (MRN).
@@ -15,13 +109,9 @@ def send_pager_request(mrn, timestamp):
         int or None: HTTP status code if the request is successful or fails with an HTTP error,
                      None if a network-related error occurs.
     """
-    try:
-        PAGER_PORT = 8441
-        PAGER_URL = os.getenv('PAGER_ADDRESS', default=f"http://127.0.0.1:{PAGER_PORT}/page")
-        if 'http' not in PAGER_URL:
-            PAGER_URL = 'http://' + PAGER_URL + '/page'
-        response = requests.post(PAGER_URL, data=f"{mrn},{timestamp}", timeout=0.2)
-        return response.status_code  # Return actual status code
-    except requests.exceptions.RequestException as e:
-        print(f'[ml_pager] Network error while paging, {e}')
-        return None  # Return None for network-related errors
\ No newline at end of file
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = PagerClient()
+    return _client.send(mrn, timestamp)
@@ -0,0 +1,99 @@
+"""
+registry.py
+
+Versioned model artifacts with hot reload.
+
+A model directory holds binary artifacts named aki-model-<version>.bin
+(see ml.compiled_model for the layout); the highest version is the active
+one. ModelRegistry memory-maps it and, from a background thread, polls the
+directory for a higher version. A new model is fully loaded before it is
+swapped in with a single reference assignment, so the MLLP loop keeps
+predicting with the old model until then and never waits for a load.
+
+Publish a new version by writing it with ml.compiled_model (which renames
+the finished file into place), e.g.
+    python -m ml.compiled_model new_model.pkl ml/models/aki-model-2.bin
+"""
+import os
+import re
+import threading
+import time
+
+from ml import compiled_model
+from monitoring.metrics import MODEL_VERSION, MODEL_LOAD_SECONDS
+
+ARTIFACT_PATTERN = re.compile(r"aki-model-(\d+)\.bin")
+
+
+class ModelRegistry:
+    """Loads the newest model artifact of 'directory' and swaps in newer ones."""
+
+    def __init__(self, directory, on_swap=None):
+        self.directory = directory
+        self.on_swap = on_swap  # called with each newly activated model
+        self.active = None      # (version, model)
+        self._failed = set()    # versions that could not be loaded
+        self._stop = threading.Event()
+        self._watcher = None
+
+    @property
+    def version(self):
+        return None if self.active is None else self.active[0]
+
+    @property
+    def model(self):
+        return None if self.active is None else self.active[1]
+
+    def versions(self):
+        """Available (version, path) pairs, highest version last."""
+        if not os.path.isdir(self.directory):
+            return []
+        found = []
+        for entry in os.scandir(self.directory):
+            match = ARTIFACT_PATTERN.fullmatch(entry.name)
+            if match:
+                found.append((int(match.group(1)), entry.path))
+        return sorted(found)
+
+    def refresh(self):
+        """Activate the highest version if it is newer than the active one. Returns True on a swap."""
+        candidates = [(version, path) for version, path in self.versions() if version not in self._failed]
+        if not candidates:
+            return False
+        version, path = candidates[-1]
+        if self.active is not None and version <= self.active[0]:
+            return False
+
+        start = time.perf_counter()
+        try:
+            model = compiled_model.load(path)
+        except (OSError, ValueError) as e:
+            self._failed.add(version)
+            print(f"[model_registry] Could not load {path}: {e}")
+            return False
+        elapsed = time.perf_counter() - start
+
+        self.active = (version, model)
+        MODEL_VERSION.set(version)
+        MODEL_LOAD_SECONDS.set(elapsed)
+        if self.on_swap is not None:
+            self.on_swap(model)
+        print(f"[model_registry] Loaded model version {version} in {1000 * elapsed:.2f} ms")
+        return True
+
+    def start_watcher(self, interval):
+        """Poll the directory for new versions every 'interval' seconds."""
+        self._watcher = threading.Thread(target=self._watch, args=(interval,), name="model-watcher", daemon=True)
+        self._watcher.start()
+
+    def _watch(self, interval):
+        while not self._stop.wait(interval):
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"[model_registry] Watch error: {e}")
+
+    def stop(self):
+        self._stop.set()
+        if self._watcher is not None:
+            self._watcher.join()
@@ -0,0 +1,46 @@
+import unittest
+from unittest.mock import MagicMock
+from ml.batching import MicroBatcher
+
+class TestMicroBatcher(unittest.TestCase):
+
+    def setUp(self):
+        self.consume = MagicMock()
+
+    def test_flush_hands_over_one_batch(self):
+        """Buffered records are consumed with a single call."""
+        batcher = MicroBatcher(self.consume, max_rows=10, max_delay=60)
+        batcher.add({"PID": "1"})
+        batcher.add({"PID": "2"})
+        self.assertEqual(len(batcher), 2)
+
+        self.assertEqual(batcher.flush(), 2)
+        self.consume.assert_called_once_with([{"PID": "1"}, {"PID": "2"}])
+        self.assertEqual(len(batcher), 0)
+        self.assertEqual(batcher.flush(), 0)
+        self.consume.assert_called_once()
+
+    def test_records_are_copied(self):
+        """Later changes to a record do not reach the batch."""
+        batcher = MicroBatcher(self.consume, max_rows=10, max_delay=60)
+        record = {"PID": "1", "Ready_for_Inference": "Yes"}
+        batcher.add(record)
+        record["Ready_for_Inference"] = "No"
+        batcher.flush()
+        self.assertEqual(self.consume.call_args[0][0][0]["Ready_for_Inference"], "Yes")
+
+    def test_due_after_max_rows_or_max_delay(self):
+        """A batch is due when full or when its oldest record is too old."""
+        batcher = MicroBatcher(self.consume, max_rows=2, max_delay=60)
+        self.assertIsNone(batcher.time_left())
+        batcher.add({"PID": "1"})
+        self.assertFalse(batcher.due())
+        batcher.add({"PID": "2"})
+        self.assertTrue(batcher.due())
+
+        batcher = MicroBatcher(self.consume, max_rows=2, max_delay=0)
+        batcher.add({"PID": "1"})
+        self.assertTrue(batcher.due())
+
+if __name__ == "__main__":
+    unittest.main()
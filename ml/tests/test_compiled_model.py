@@ -0,0 +1,65 @@
+import unittest
+import pickle
+import json
+import numpy as np
+from ml import compiled_model
+from ml.inference import MODEL_PATH, COMPILED_MODEL_PATH
+
+class TestCompiledModel(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        with open(MODEL_PATH, "rb") as f:
+            cls.estimator = pickle.load(f)
+        cls.compiled = compiled_model.load(COMPILED_MODEL_PATH)
+
+        # Fixture rows of the other ml tests, plus random rows around the decision boundary
+        rng = np.random.default_rng(0)
+        mean = rng.uniform(50, 200, 5000)
+        std = rng.uniform(0, 30, 5000)
+        random_rows = np.column_stack([rng.integers(18, 90, 5000), rng.integers(0, 2, 5000), mean, std,
+                                       mean + 2 * std, mean - std, rng.uniform(50, 400, 5000)])
+        cls.features = np.vstack([[[40, 1, 410, 10, 420, 400, 420], [40, 1, 1, 0, 1, 1, 1],
+                                   [45, 1.0, 1.6, 0.4, 2.0, 1.2, 2.0]], random_rows]).astype(float)
+
+    def test_artifact_is_up_to_date(self):
+        """The committed JSON export matches the committed pickle."""
+        with open(COMPILED_MODEL_PATH) as f:
+            self.assertEqual(compiled_model.export_model(self.estimator), json.load(f))
+
+    def test_batch_predictions_bit_identical(self):
+        """Vectorised scores and labels are exactly those of sklearn."""
+        np.testing.assert_array_equal(self.compiled.decision_function(self.features),
+                                      self.estimator.decision_function(self.features))
+        np.testing.assert_array_equal(self.compiled.predict(self.features), self.estimator.predict(self.features))
+        self.assertGreater(self.estimator.predict(self.features).sum(), 0)  # both classes covered
+
+    def test_single_row_predictions(self):
+        """The per-row loop gives sklearn's label for every row."""
+        expected = self.estimator.predict(self.features).tolist()
+        self.assertEqual([self.compiled.predict([row])[0] for row in self.features.tolist()], expected)
+
+    def test_scaler_options(self):
+        """A scaler fitted without centring or without scaling is exported as it transforms."""
+        from sklearn.linear_model import LogisticRegression
+        from sklearn.pipeline import make_pipeline
+        from sklearn.preprocessing import StandardScaler
+        labels = self.estimator.predict(self.features)
+        for with_mean, with_std in ((False, True), (True, False), (False, False)):
+            with self.subTest(with_mean=with_mean, with_std=with_std):
+                estimator = make_pipeline(StandardScaler(with_mean=with_mean, with_std=with_std),
+                                          LogisticRegression(max_iter=1000)).fit(self.features, labels)
+                compiled = compiled_model.LinearModel(compiled_model.export_model(estimator))
+                np.testing.assert_allclose(compiled.decision_function(self.features),
+                                           estimator.decision_function(self.features), rtol=1e-9, atol=1e-9)
+                np.testing.assert_array_equal(compiled.predict(self.features), estimator.predict(self.features))
+
+    def test_unsupported_model(self):
+        """Only linear binary classifiers can be exported."""
+        from sklearn.tree import DecisionTreeClassifier
+        tree = DecisionTreeClassifier().fit([[0], [1]], [0, 1])
+        with self.assertRaises(ValueError):
+            compiled_model.export_model(tree)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,105 @@
+import unittest
+import os
+import io
+import time
+import tempfile
+import threading
+import contextlib
+from unittest.mock import MagicMock
+from ml.dispatch import PagerDispatcher
+
+class TestPagerDispatcher(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.journal_path = os.path.join(self.directory.name, "pager.journal")
+        self.dispatchers = []
+
+    def tearDown(self):
+        for dispatcher in self.dispatchers:
+            dispatcher.close(timeout=1)
+        self.directory.cleanup()
+
+    def dispatcher(self, send, **kwargs):
+        dispatcher = PagerDispatcher(send, self.journal_path, fsync=False, **kwargs)
+        self.dispatchers.append(dispatcher)
+        with contextlib.redirect_stdout(io.StringIO()):
+            return dispatcher.open()
+
+    def wait_for(self, condition, timeout=2):
+        deadline = time.monotonic() + timeout
+        while not condition():
+            if time.monotonic() > deadline:
+                self.fail("timed out")
+            time.sleep(0.005)
+
+    def test_submit_does_not_block(self):
+        """submit returns while the pager is still busy."""
+        release = threading.Event()
+        send = MagicMock(side_effect=lambda mrn, timestamp: release.wait() and 200)
+        dispatcher = self.dispatcher(send, workers=1).start()
+
+        start = time.monotonic()
+        self.assertTrue(dispatcher.submit("1", "20250101000000"))
+        self.assertLess(time.monotonic() - start, 0.1)
+        release.set()
+        self.wait_for(lambda: not len(dispatcher))
+        send.assert_called_once_with("1", "20250101000000")
+
+    def test_retries_with_backoff(self):
+        """Failed pages are retried until the pager accepts them."""
+        send = MagicMock(side_effect=[None, 500, 200])
+        dispatcher = self.dispatcher(send, workers=2, base_delay=0.01, max_delay=0.02).start()
+        with contextlib.redirect_stdout(io.StringIO()):
+            dispatcher.submit("1", "20250101000000")
+            self.wait_for(lambda: not len(dispatcher))
+        self.assertEqual(send.call_count, 3)
+
+    def test_rejected_page_is_not_retried(self):
+        """A 4xx is final: not retried, and not re-queued after a restart."""
+        send = MagicMock(return_value=400)
+        dispatcher = self.dispatcher(send, base_delay=0.01, max_delay=0.02).start()
+        with contextlib.redirect_stdout(io.StringIO()):
+            dispatcher.submit("1", "20250101000000")
+            self.wait_for(lambda: not len(dispatcher))
+            time.sleep(0.05)
+        send.assert_called_once_with("1", "20250101000000")
+        dispatcher.close()
+
+        restarted = self.dispatcher(MagicMock(return_value=200))
+        self.assertEqual(len(restarted), 0)
+        self.assertFalse(restarted.submit("1", "20250101000000"))
+
+    def test_deduplicates_pages(self):
+        """The same (MRN, timestamp) is paged once, pending or delivered."""
+        send = MagicMock(return_value=200)
+        dispatcher = self.dispatcher(send).start()
+        self.assertTrue(dispatcher.submit("1", "20250101000000"))
+        self.assertFalse(dispatcher.submit("1", "20250101000000"))
+        self.wait_for(lambda: not len(dispatcher))
+        self.assertFalse(dispatcher.submit("1", "20250101000000"))
+        self.assertTrue(dispatcher.submit("1", "20250101000100"))
+        self.wait_for(lambda: not len(dispatcher))
+        self.assertEqual(send.call_count, 2)
+
+    def test_pages_survive_restart(self):
+        """Undelivered pages are re-queued from the journal; delivered ones are not repeated."""
+        delivered = self.dispatcher(MagicMock(return_value=200)).start()
+        delivered.submit("1", "20250101000000")
+        self.wait_for(lambda: not len(delivered))
+        delivered.close()
+
+        down = self.dispatcher(MagicMock(return_value=None))  # never started: pager down, pod stops
+        down.submit("2", "20250101000000")
+        down.close()
+
+        send = MagicMock(return_value=200)
+        restarted = self.dispatcher(send)
+        self.assertEqual(len(restarted), 1)
+        self.assertFalse(restarted.submit("1", "20250101000000"))
+        restarted.start()
+        self.wait_for(lambda: not len(restarted))
+        send.assert_called_once_with("2", "20250101000000")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,6 +1,8 @@
 import unittest
+import random
+import numpy as np
 from copy import deepcopy
-from ml.feature_construct import update
+from ml.feature_construct import update, PatientFeatures
 
 class TestUpdateFunction(unittest.TestCase):
     def setUp(self):
@@ -67,6 +69,17 @@ class TestUpdateFunction(unittest.TestCase):
         
         self.assertEqual(feature['Ready_for_Inference'], 'Yes')
 
+    def test_equal_and_older_timestamps_are_counted(self):
+        """Results drawn in the same minute, or arriving late, are all counted."""
+        feature = deepcopy(self.base_feature)
+        for data in (['12345', 1.0, '20250204120500'], ['12345', 3.0, '20250204120500'],
+                     ['12345', 5.0, '20250204120000']):
+            feature = update(feature, data, 'ORU^R01')
+
+        self.assertEqual(feature['No_of_Samples'], 3)
+        self.assertAlmostEqual(feature['Mean'], 3.0)
+        self.assertAlmostEqual(feature['Standard_Deviation'], np.std([1.0, 3.0, 5.0]))
+
     def test_ignore_unknown_message_type(self):
         """Test that an unknown message type does not modify the feature."""
         feature = deepcopy(self.base_feature)
@@ -75,5 +88,86 @@ class TestUpdateFunction(unittest.TestCase):
 
         self.assertEqual(updated_feature, self.base_feature)  # No change
 
+class TestPatientFeatures(unittest.TestCase):
+
+    def histories(self):
+        """Random creatinine histories, including long and badly conditioned ones."""
+        rng = random.Random(0)
+        for size in (1, 2, 3, 10, 100, 5000):
+            offset = rng.choice([0, 1e6])
+            yield [offset + rng.uniform(20, 500) for _ in range(size)]
+
+    def test_incremental_matches_numpy(self):
+        """Welford updates agree with numpy.std(ddof=0) after every result."""
+        for values in self.histories():
+            state = PatientFeatures('1', 1, 45)
+            for i, value in enumerate(values, 1):
+                state.add(value, str(i))
+            self.assertEqual(state.count, len(values))
+            self.assertAlmostEqual(state.mean, np.mean(values), delta=1e-9 * abs(np.mean(values)))
+            self.assertAlmostEqual(state.std, np.std(values, ddof=0), delta=1e-6)
+            self.assertEqual((state.min, state.max), (min(values), max(values)))
+
+    def test_round_trip_through_rows(self):
+        """Persisting to a Feature_Store row after every result loses no accuracy."""
+        for values in self.histories():
+            row = PatientFeatures('1', 1, 45).to_row()
+            for i, value in enumerate(values, 1):
+                state = PatientFeatures.from_row(row)
+                state.add(value, str(i))
+                row = state.to_row()
+            self.assertEqual(row['No_of_Samples'], len(values))
+            self.assertAlmostEqual(row['Standard_Deviation'], np.std(values, ddof=0), delta=1e-6)
+
+    def test_batch_update_matches_incremental(self):
+        """add_many gives the same state as adding the results one by one."""
+        rng = random.Random(1)
+        for values in self.histories():
+            split = rng.randrange(len(values))
+            timestamps = [str(i) for i in range(len(values))]
+            one, batch = PatientFeatures('1', 1, 45), PatientFeatures('1', 1, 45)
+            for value, ts in zip(values, timestamps):
+                one.add(value, ts)
+            for value, ts in zip(values[:split], timestamps[:split]):
+                batch.add(value, ts)
+            batch.add_many(values[split:], timestamps[split:])
+
+            self.assertEqual(batch.count, one.count)
+            self.assertAlmostEqual(batch.mean, one.mean, delta=1e-9 * abs(one.mean))
+            self.assertAlmostEqual(batch.std, np.std(values, ddof=0), delta=1e-6)
+            self.assertEqual((batch.min, batch.max, batch.last_value, batch.last_timestamp),
+                             (one.min, one.max, one.last_value, one.last_timestamp))
+
+    def test_readiness(self):
+        """Ready once sex, age and at least one result are known."""
+        state = PatientFeatures('1', sex=None, age=45)
+        state.add(100, '20250204120000')
+        self.assertFalse(state.ready)
+        state.sex = 0
+        self.assertTrue(state.ready)
+        self.assertEqual(state.to_row()['Ready_for_Inference'], 'Yes')
+
+    def test_first_result_of_new_patient_is_kept(self):
+        """A patient first seen in an ORU message starts from its stored first result."""
+        feature = {'PID': '1', 'Sex': None, 'Age': None, 'Min': None, 'Max': None, 'Mean': None,
+                   'Standard_Deviation': None, 'Last_Result_Value': 100.0,
+                   'Latest_Result_Timestamp': '1', 'No_of_Samples': 1, 'Ready_for_Inference': 'No'}
+        feature = update(feature, ['1', 200.0, '2'], 'ORU^R01')
+        self.assertEqual((feature['Min'], feature['Max'], feature['Mean']), (100.0, 200.0, 150.0))
+        self.assertEqual(feature['Standard_Deviation'], 50.0)
+        self.assertEqual(feature['No_of_Samples'], 2)
+
+    def test_bulk_rows(self):
+        """to_rows / from_rows convert Feature_Store tuples in column order."""
+        states = [PatientFeatures(str(pid), 0, 30 + pid) for pid in range(3)]
+        for state in states:
+            state.add_many([10.0, 20.0, 30.0], ['1', '2', '3'])
+        rows = PatientFeatures.to_rows(states)
+        self.assertEqual(rows[0][0], '0')
+        restored = PatientFeatures.from_rows(rows)
+        self.assertEqual([s.age for s in restored], [30, 31, 32])
+        self.assertAlmostEqual(restored[2].std, np.std([10, 20, 30]), places=12)
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -1,6 +1,9 @@
 import unittest
 from unittest.mock import patch, MagicMock
-from ml.inference import predict_aki, preprocess_data
+import ml.inference
+from ml.registry import ModelRegistry
+import numpy as np
+from ml.inference import predict_aki, preprocess_data, load_model, preprocess_batch, predict_aki_batch
 
 class TestPredictAki(unittest.TestCase):
 
@@ -68,5 +71,67 @@ class TestPredictAki(unittest.TestCase):
 
         self.assertIsNone(result)  # Should return None on failure
 
+class TestPredictAkiBatch(unittest.TestCase):
+
+    def setUp(self):
+        self.records = [
+            {"PID": str(pid), "Latest_Result_Timestamp": "20240323231900", "Age": 40, "Sex": pid % 2,
+             "Mean": 100.0 * pid, "Standard_Deviation": 10, "Max": 420, "Min": 80, "Last_Result_Value": 400}
+            for pid in range(1, 6)
+        ]
+
+    def test_preprocess_batch(self):
+        """Records are stacked into one float matrix."""
+        features, mrns, timestamps = preprocess_batch(self.records)
+        self.assertEqual(features.shape, (5, 7))
+        self.assertEqual(features[2].tolist(), [40, 1, 300, 10, 420, 80, 400])
+        self.assertEqual(mrns, ["1", "2", "3", "4", "5"])
+
+    def test_batch_matches_single_predictions(self):
+        """One batched call predicts the same as one call per patient."""
+        features, _, _ = preprocess_batch(self.records)
+        batch = predict_aki_batch(features)
+        single = [predict_aki(record)[0][0] for record in self.records]
+        self.assertEqual(batch.tolist(), single)
+
+    @patch("ml.inference.model")
+    def test_batch_prediction_error(self, mock_model):
+        """predict_aki_batch returns None on failure."""
+        mock_model.predict.side_effect = ValueError("Invalid input shape")
+        self.assertIsNone(predict_aki_batch(np.zeros((2, 3))))
+
+class TestLoadModel(unittest.TestCase):
+
+    @patch("ml.inference.model", None)
+    @patch("ml.inference.registry", ModelRegistry("missing"))
+    @patch("ml.inference.COMPILED_MODEL_PATH", "missing.json")
+    def test_load_model_once(self):
+        """Without compiled exports the model is unpickled on first use and then cached."""
+        with patch("ml.inference.pickle.load") as mock_load:
+            mock_load.return_value = MagicMock()
+            first = load_model()
+            second = load_model()
+
+        mock_load.assert_called_once()
+        self.assertIs(first, second)
+        self.assertIs(ml.inference.model, first)
+
+    @patch("ml.inference.model", None)
+    @patch("ml.inference.registry", ModelRegistry("missing"))
+    def test_compiled_model_preferred(self):
+        """The compiled export is loaded instead of the pickle when present."""
+        with patch("ml.inference.pickle.load") as mock_load:
+            self.assertIsInstance(load_model(), ml.inference.compiled_model.LinearModel)
+        mock_load.assert_not_called()
+
+    @patch("ml.inference.model", None)
+    def test_versioned_model_preferred(self):
+        """The newest artifact of the model registry comes first."""
+        registry = ModelRegistry(ml.inference.MODEL_DIR, on_swap=ml.inference._activate)
+        with patch("ml.inference.registry", registry):
+            loaded = load_model()
+        self.assertIs(loaded, registry.model)
+        self.assertEqual(registry.version, 1)
+
 if __name__ == "__main__":
     unittest.main()
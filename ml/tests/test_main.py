@@ -1,6 +1,6 @@
 import unittest
 from unittest.mock import patch, MagicMock
-from ml.main import ml_consumer
+from ml.main import ml_consumer, ml_consumer_batch
 
 class TestMLConsumer(unittest.TestCase):
     @patch("ml.main.predict_aki")
@@ -53,5 +53,51 @@ class TestMLConsumer(unittest.TestCase):
         mock_predict_aki.assert_called_once()
         mock_print.assert_any_call("[ml_consumer] Prediction Error")
 
+class TestPagerDispatch(unittest.TestCase):
+    @patch("ml.main.predict_aki")
+    @patch("ml.main.send_pager_request")
+    def test_page_queued_on_dispatcher(self, mock_send_pager_request, mock_predict_aki):
+        """With a dispatcher installed the page is queued, not sent from the message path."""
+        mock_predict_aki.return_value = ([1], "12345", "20250204120000")
+        dispatcher = MagicMock()
+        dispatcher.submit.return_value = True
+
+        with patch("ml.main.dispatcher", dispatcher), patch("builtins.print") as mock_print:
+            ml_consumer({"some": "data"})
+
+        dispatcher.submit.assert_called_once_with("12345", "20250204120000")
+        mock_send_pager_request.assert_not_called()
+        mock_print.assert_any_call("[ml_consumer] Page queued, ACKing message.")
+
+class TestMLConsumerBatch(unittest.TestCase):
+    @patch("ml.main.predict_aki_batch")
+    @patch("ml.main.send_pager_request")
+    def test_pages_positive_results(self, mock_send_pager_request, mock_predict_aki_batch):
+        """Only the patients predicted positive are paged, from one model call."""
+        mock_predict_aki_batch.return_value = [0, 1, 0]
+        mock_send_pager_request.return_value = 200
+        records = [{"PID": str(pid), "Latest_Result_Timestamp": f"2025020412000{pid}", "Age": 40, "Sex": 1,
+                    "Mean": 1, "Standard_Deviation": 0, "Max": 1, "Min": 1, "Last_Result_Value": 1}
+                   for pid in range(3)]
+
+        with patch("builtins.print"):
+            ml_consumer_batch(records)
+
+        mock_predict_aki_batch.assert_called_once()
+        self.assertEqual(mock_predict_aki_batch.call_args[0][0].shape, (3, 7))
+        mock_send_pager_request.assert_called_once_with("1", "20250204120001")
+
+    @patch("ml.main.predict_aki_batch")
+    def test_prediction_error(self, mock_predict_aki_batch):
+        """A failed batch prediction is reported."""
+        mock_predict_aki_batch.return_value = None
+        records = [{"PID": "1", "Latest_Result_Timestamp": "x", "Age": 40, "Sex": 1,
+                    "Mean": 1, "Standard_Deviation": 0, "Max": 1, "Min": 1, "Last_Result_Value": 1}]
+
+        with patch("builtins.print") as mock_print:
+            ml_consumer_batch(records)
+
+        mock_print.assert_any_call("[ml_consumer] Prediction Error")
+
 if __name__ == "__main__":
     unittest.main()
@@ -1,11 +1,17 @@
 import unittest
 import requests
 from unittest.mock import patch, MagicMock
-from ml.pager import send_pager_request
+from ml.pager import send_pager_request, resolve_pager_url, PagerClient
 
 class TestSendPagerRequest(unittest.TestCase):
 
-    @patch("ml.pager.requests.post")
+    def setUp(self):
+        """Every test gets a fresh shared client."""
+        patcher = patch("ml.pager._client", None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @patch("ml.pager.requests.Session.post")
     def test_pager_success(self, mock_post):
         """Test successful pager request."""
         mock_response = MagicMock()
@@ -15,7 +21,7 @@ class TestSendPagerRequest(unittest.TestCase):
         status = send_pager_request("163244486", "20240323231900")
         self.assertEqual(status, 200)
 
-    @patch("ml.pager.requests.post")
+    @patch("ml.pager.requests.Session.post")
     def test_pager_http_error(self, mock_post):
         """Test pager request with an HTTP error (e.g., 404 or 500)."""
         mock_response = MagicMock()
@@ -25,21 +31,65 @@ class TestSendPagerRequest(unittest.TestCase):
         status = send_pager_request("163244486", "20240323231900")
         self.assertEqual(status, 500)
 
-    @patch("ml.pager.requests.post")
+    @patch("ml.pager.requests.Session.post")
     def test_pager_timeout(self, mock_post):
         """Test pager request timeout handling."""
         mock_post.side_effect = requests.exceptions.Timeout()
 
-        status = send_pager_request("163244486", "20240323231900")
+        with patch("builtins.print"):
+            status = send_pager_request("163244486", "20240323231900")
         self.assertIsNone(status)
 
-    @patch("ml.pager.requests.post")
+    @patch("ml.pager.requests.Session.post")
     def test_pager_connection_error(self, mock_post):
         """Test pager request with a connection error."""
         mock_post.side_effect = requests.exceptions.ConnectionError()
 
-        status = send_pager_request("163244486", "20240323231900")
+        with patch("builtins.print"):
+            status = send_pager_request("163244486", "20240323231900")
         self.assertIsNone(status)
 
+class TestPagerClient(unittest.TestCase):
+
+    def client(self, **kwargs):
+        client = PagerClient("pager:8441", **kwargs)
+        client.session = MagicMock()
+        client.session.post.return_value.status_code = 200
+        return client
+
+    def test_url_resolved_once(self):
+        """The URL and timeouts are fixed when the client is created."""
+        self.assertEqual(resolve_pager_url("pager:8441"), "http://pager:8441/page")
+        self.assertEqual(resolve_pager_url("http://pager/page"), "http://pager/page")
+        client = self.client(connect_timeout=0.1, read_timeout=2)
+        with patch.dict("os.environ", {"PAGER_ADDRESS": "elsewhere:1"}):
+            client.send("1", "20240323231900")
+        client.session.post.assert_called_once_with("http://pager:8441/page", data="1,20240323231900",
+                                                    timeout=(0.1, 2))
+
+    def test_circuit_breaker(self):
+        """Consecutive failures open the circuit; a trial page after reset_timeout closes it."""
+        client = self.client(failure_threshold=2, reset_timeout=60)
+        client.session.post.side_effect = requests.exceptions.ConnectionError()
+        with patch("builtins.print"):
+            client.send("1", "t")
+            client.send("1", "t")
+            self.assertIsNone(client.send("1", "t"))  # open: not attempted
+        self.assertEqual(client.session.post.call_count, 2)
+
+        client.reset_timeout = 0
+        client.session.post.side_effect = None
+        with patch("builtins.print"):
+            self.assertEqual(client.send("1", "t"), 200)  # half-open trial succeeds
+        self.assertIsNone(client._opened_at)
+
+    def test_client_errors_do_not_open_circuit(self):
+        """A 4xx answer means the pager is up."""
+        client = self.client(failure_threshold=1)
+        client.session.post.return_value.status_code = 400
+        client.send("1", "t")
+        client.send("1", "t")
+        self.assertEqual(client.session.post.call_count, 2)
+
 if __name__ == "__main__":
     unittest.main()
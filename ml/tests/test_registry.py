@@ -0,0 +1,77 @@
+import unittest
+import os
+import json
+import io
+import contextlib
+import tempfile
+from ml import compiled_model
+from ml.registry import ModelRegistry
+from ml.inference import COMPILED_MODEL_PATH
+from monitoring.metrics import MODEL_VERSION
+
+class TestModelRegistry(unittest.TestCase):
+
+    def setUp(self):
+        """An empty model directory and the exported parameters of the trained model."""
+        self.directory = tempfile.TemporaryDirectory()
+        with open(COMPILED_MODEL_PATH) as f:
+            self.params = json.load(f)
+        self.swapped = []
+        self.registry = ModelRegistry(self.directory.name, on_swap=self.swapped.append)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def publish(self, version, **changes):
+        compiled_model.save(dict(self.params, **changes), os.path.join(self.directory.name, f"aki-model-{version}.bin"))
+
+    def refresh(self):
+        with contextlib.redirect_stdout(io.StringIO()):
+            return self.registry.refresh()
+
+    def test_binary_artifact_matches_export(self):
+        """The memory-mapped weights are exactly the exported ones."""
+        self.publish(1)
+        model = compiled_model.load(os.path.join(self.directory.name, "aki-model-1.bin"))
+        self.assertEqual(list(model.mean), self.params["mean"])
+        self.assertEqual(list(model.coef), self.params["coef"])
+        self.assertEqual((model.intercept, model.classes), (self.params["intercept"], self.params["classes"]))
+
+    def test_loads_highest_version(self):
+        """The highest version is activated and reported."""
+        self.assertFalse(self.refresh())
+        self.publish(1)
+        self.publish(2, intercept=1.0)
+        self.assertTrue(self.refresh())
+        self.assertEqual(self.registry.version, 2)
+        self.assertEqual(self.registry.model.intercept, 1.0)
+        self.assertEqual(MODEL_VERSION._value.get(), 2)
+        self.assertEqual(self.swapped, [self.registry.model])
+
+    def test_hot_reload(self):
+        """A newer version replaces the active model; older or equal ones do not."""
+        self.publish(3)
+        self.refresh()
+        old = self.registry.model
+        self.assertFalse(self.refresh())
+
+        self.publish(2, intercept=1.0)
+        self.assertFalse(self.refresh())
+        self.publish(4, intercept=1.0)
+        self.assertTrue(self.refresh())
+        self.assertIsNot(self.registry.model, old)
+        self.assertEqual(self.registry.version, 4)
+        self.assertEqual(old.predict([[40, 1, 410, 10, 420, 400, 420]]), [0])  # old model still usable
+
+    def test_broken_artifact_is_skipped(self):
+        """A corrupt artifact keeps the active model and is not retried."""
+        self.publish(1)
+        self.refresh()
+        with open(os.path.join(self.directory.name, "aki-model-2.bin"), "wb") as f:
+            f.write(b"garbage")
+        self.assertFalse(self.refresh())
+        self.assertEqual(self.registry.version, 1)
+        self.assertIn(2, self.registry._failed)
+
+if __name__ == "__main__":
+    unittest.main()
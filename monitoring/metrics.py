@@ -1,5 +1,6 @@
 import time
 import functools
+import contextlib
 from prometheus_client import Counter, Histogram, Gauge, start_http_server
 
 # Message processing metrics
@@ -11,11 +12,29 @@ PROCESSING_TIME = Histogram(
     "message_processing_seconds", "Time spent processing messages", ["message_type"]
 )
 
+HL7_PARSER_FALLBACKS = Counter(
+    "hl7_parser_fallbacks_total", "Number of HL7 messages parsed with hl7apy instead of the fast path"
+)
+
 # ML metrics
 PREDICTIONS_MADE = Counter(
     "predictions_made_total", "Number of AKI predictions made", ["result"]
 )
 
+ML_BATCH_ROWS = Histogram(
+    "ml_batch_rows",
+    "Number of patients per batched model prediction",
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256),
+)
+
+MODEL_VERSION = Gauge(
+    "model_version", "Version of the active AKI model (0: unversioned artifact)"
+)
+
+MODEL_LOAD_SECONDS = Gauge(
+    "model_load_seconds", "Time taken to load the active AKI model"
+)
+
 # Database metrics
 DB_OPERATIONS = Counter(
     "database_operations_total", "Number of database operations", ["operation_type", "status"]
@@ -27,11 +46,51 @@ DB_OPERATION_TIME = Histogram(
     ["operation_type"],
 )
 
+DB_RECONNECTS = Counter(
+    "database_reconnects_total", "Number of times a pooled database connection was reopened"
+)
+
+FEATURE_CACHE_PATIENTS = Gauge(
+    "feature_cache_patients", "Number of patients held in the in-memory feature cache"
+)
+
+FEATURE_CACHE_DIRTY = Gauge(
+    "feature_cache_dirty_patients", "Number of cached patients not yet flushed to SQLite"
+)
+
+FEATURE_CACHE_EVICTIONS = Counter(
+    "feature_cache_evictions_total", "Number of patients dropped from the feature cache once not admitted"
+)
+
+FEATURE_CACHE_MISSES = Counter(
+    "feature_cache_misses_total", "Number of feature cache lookups read through from SQLite"
+)
+
+GROUP_COMMIT_BATCH_ROWS = Histogram(
+    "group_commit_batch_rows",
+    "Number of Feature_Store rows written per group commit",
+    buckets=(1, 2, 5, 10, 25, 50, 100, 250, 500, 1000),
+)
+
 # Pager metrics
 PAGER_REQUESTS = Counter(
     "pager_requests_total", "Number of pager requests sent", ["status"]
 )
 
+PAGER_LATENCY = Histogram(
+    "pager_latency_seconds",
+    "Time taken by pager HTTP requests",
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0),
+)
+
+PAGER_CIRCUIT_OPEN = Gauge(
+    "pager_circuit_open", "1 while the pager circuit breaker is open"
+)
+
+PAGER_PENDING = Gauge(
+    "pager_pending_pages", "Number of pages queued or waiting for a retry"
+)
+
 # Error monitoring metrics
 ERROR_COUNTER = Counter(
     "application_errors_total",
@@ -43,10 +102,43 @@ SOCKET_TIMEOUTS = Counter(
     "socket_timeouts", "Number of times the socket has timed out"
 )
 
+# MLLP socket metrics
+MLLP_RECEIVED_BYTES = Counter(
+    "mllp_received_bytes_total", "Bytes received from the MLLP socket"
+)
+
+MLLP_RECV_CALLS = Counter(
+    "mllp_recv_calls_total", "Number of recv syscalls on the MLLP socket"
+)
+
+MLLP_CONNECTION_BYTES = Gauge(
+    "mllp_connection_received_bytes", "Bytes received on the current MLLP connection"
+)
+
+MLLP_CONNECTION_RECV_CALLS = Gauge(
+    "mllp_connection_recv_calls", "Number of recv syscalls on the current MLLP connection"
+)
+
+MLLP_READ_SIZE = Gauge(
+    "mllp_read_size_bytes", "Current adaptive recv size of the MLLP reader"
+)
+
 SIGTERM_COUNTER = Counter(
     "sigterm_counter", "Number of times the pod has received SIGTERM"
 )
 
+# Async pipeline metrics
+PIPELINE_QUEUE_DEPTH = Gauge(
+    "pipeline_queue_depth", "Number of messages waiting in front of each async pipeline stage", ["stage"]
+)
+
+# Startup metrics
+STARTUP_PHASE_SECONDS = Gauge(
+    "startup_phase_seconds",
+    "Duration of each startup phase; 'imports', 'connect' and 'first_ack' are measured from process start",
+    ["phase"],
+)
+
 # System health metrics
 SYSTEM_HEALTH = Gauge(
     "system_health_status", "Current health status of system components", ["component"]
@@ -64,6 +156,22 @@ def record_error(error_type: str, component: str):
     SYSTEM_HEALTH.labels(component=component).set(0)  # Mark component as unhealthy
 
 
+def record_startup_phase(phase, seconds):
+    """Record a startup phase duration and log it, -X importtime style"""
+    STARTUP_PHASE_SECONDS.labels(phase=phase).set(seconds)
+    print(f"[startup] {phase:<16} | {seconds * 1e6:>10.0f} us")
+
+
+@contextlib.contextmanager
+def startup_phase(phase):
+    """Time the enclosed block as startup phase 'phase'"""
+    start_time = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_startup_phase(phase, time.perf_counter() - start_time)
+
+
 def monitor_db_operation(operation_type):
     def decorator(func):
         @functools.wraps(func)
@@ -1,5 +1,5 @@
-from hl7apy.parser import parse_message
 from datetime import datetime
+from monitoring.metrics import HL7_PARSER_FALLBACKS
 
 def age_calculator(dob):
     '''
@@ -10,19 +10,83 @@ def age_calculator(dob):
     age = today.year - dob_date.year - ((today.month, today.day) < (dob_date.month, dob_date.day))
     return age
 
-def mssg_parser(mssg):
+def field(segment, index):
+    """Return field 'index' of a split segment, decoded to str."""
+    return segment[index].decode("utf-8", errors="replace")
+
+def canonical_mrn(mrn):
+    """
+    The MRN in the form stored in the database: PIDs are INTEGER columns,
+    so a numeric MRN loses its leading zeros ('0123' -> '123'). Normalized
+    here, once, so the feature cache key and the database row are the same
+    for '0123' and '123'. Pages carry this form too, not PID-3 as written
+    (the pager reads the MRN as an integer either way). MRNs that are not
+    ASCII digits are returned unchanged.
+    """
+    mrn = mrn.strip()
+    return str(int(mrn)) if mrn.isascii() and mrn.isdigit() else mrn
+
+def fast_mssg_parser(mssg):
     '''
-    Parse incoming hl7 message 
+    Extract the fields mssg_parser needs by splitting the raw bytes, without
+    building an hl7apy message tree.
+
+    Only MSH-9, PID-3/7/8, OBR-7 and OBX-5 are read. The field separator is
+    taken from MSH-1 and the component separator from MSH-2.
 
     Args-
-    mssg: byte format of hl7 message
+    mssg: byte format of hl7 message (bytes or memoryview)
 
     Return-
-    (str(message_type), List[data])
+    Same as mssg_parser, or None if the message is not one of the known
+    types or is malformed (the caller then falls back to hl7apy)
+    '''
+    try:
+        raw = bytes(mssg)
+        if not raw.startswith(b"MSH"):
+            return None
+        field_sep = raw[3:4]
+        component_sep = raw[4:5]
 
-    data changes according to the message type
+        # First occurrence of each segment, split into fields
+        segments = {}
+        for segment in raw.replace(b"\n", b"\r").split(b"\r"):
+            name = segment[:3]
+            if name not in segments:
+                segments[name] = segment.split(field_sep)
+
+        # MSH-1 is the separator itself, so MSH-9 is at index 8
+        mssg_type = segments[b"MSH"][8].replace(component_sep, b"^")
+
+        if mssg_type == b"ADT^A01":
+            pid = segments[b"PID"]
+            patient_id = canonical_mrn(field(pid, 3))
+            dob = field(pid, 7)
+            sex = field(pid, 8)
+            return "ADT^A01", [patient_id, age_calculator(dob), sex]
+
+        elif mssg_type == b"ORU^R01":
+            patient_id = canonical_mrn(field(segments[b"PID"], 3))
+            crt_result = float(segments[b"OBX"][5])
+            test_date = field(segments[b"OBR"], 7)
+            return "ORU^R01", [patient_id, crt_result, test_date]
+
+        elif mssg_type == b"ADT^A03":
+            return "ADT^A03", [canonical_mrn(field(segments[b"PID"], 3))]
+
+        elif mssg_type == b"ACK":
+            return "ACK", []
+
+    except (IndexError, KeyError, ValueError):
+        return None
+
+def hl7apy_mssg_parser(mssg):
     '''
-    hl7_str = mssg.decode("utf-8", errors="replace")
+    Parse incoming hl7 message with hl7apy (slow path, see mssg_parser)
+    '''
+    from hl7apy.parser import parse_message  # imported lazily, only the fallback needs it
+
+    hl7_str = str(mssg, "utf-8", errors="replace")
     mssg = parse_message(hl7_str, find_groups=False)
     mssg_type = mssg.MSH.MSH_9.value
 
@@ -30,7 +94,7 @@ def mssg_parser(mssg):
     if mssg_type == "ADT^A01":
         pid = mssg.PID
 
-        patient_id = pid.PID_3.value # Patient ID
+        patient_id = canonical_mrn(pid.PID_3.value) # Patient ID
         sex = pid.PID_8.value        # Patient sex
         dob = pid.PID_7.value        # Patient date of birth
         age = age_calculator(dob)
@@ -43,7 +107,7 @@ def mssg_parser(mssg):
         obr = mssg.OBR  # Get OBR segment
         obx = mssg.OBX  # Get OBX segment
 
-        patient_id = pid.PID_3.value  # Patient ID
+        patient_id = canonical_mrn(pid.PID_3.value)  # Patient ID
         crt_result = obx.OBX_5.value  # Creatinine Test Result
         test_date = obr.OBR_7.value  # Test Date/Time
 
@@ -51,10 +115,29 @@ def mssg_parser(mssg):
 
     # Patient discharge
     elif mssg_type == "ADT^A03":
-        return "ADT^A03", []
+        patient_id = canonical_mrn(mssg.PID.PID_3.value)  # Patient ID
+
+        return "ADT^A03", [patient_id]
 
     # Acknowledge
     elif mssg_type == "ACK":
         return "ACK", []
 
-    
\ No newline at end of file
+def mssg_parser(mssg):
+    '''
+    Parse incoming hl7 message 
+
+    Args-
+    mssg: byte format of hl7 message (bytes or memoryview)
+
+    Return-
+    (str(message_type), List[data])
+
+    data changes according to the message type
+    '''
+    result = fast_mssg_parser(mssg)
+    if result is not None:
+        return result
+
+    HL7_PARSER_FALLBACKS.inc()
+    return hl7apy_mssg_parser(mssg)
@@ -0,0 +1,100 @@
+"""
+pool.py
+
+HL7 parsing on a pool of worker processes, so parsing can use more than
+one core (hl7apy in particular is CPU-bound and holds the GIL).
+
+The fast-path parser (parsing.hl7.fast_mssg_parser) costs a few
+microseconds per message, less than a round trip to a worker, so
+ParserPool runs it in the calling process and sends only the frames it
+cannot parse to the ProcessPoolExecutor for hl7apy, in chunks of
+'chunk_size' (one round trip per chunk rather than per message). Results
+are returned in the order of the frames, as the stateful DB/feature stage
+needs them. Enabled with PARSE_WORKERS > 0 in main.py.
+"""
+import multiprocessing
+import signal
+from concurrent.futures import ProcessPoolExecutor
+
+from parsing import hl7
+from monitoring.metrics import HL7_PARSER_FALLBACKS
+
+
+def _ignore_interrupts():
+    """Workers leave Ctrl-C to the parent, which shuts the pool down (see main.py)."""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def parse_chunk(frames, parser="mssg_parser"):
+    """
+    Worker side: parse each frame (bytes). Returns the results and how many
+    frames fell back to hl7apy, as worker metrics are not exported.
+    """
+    if parser != "mssg_parser":
+        return [getattr(hl7, parser)(frame) for frame in frames], 0
+    results, fallbacks = [], 0
+    for frame in frames:
+        result = hl7.fast_mssg_parser(frame)
+        if result is None:
+            fallbacks += 1
+            result = hl7.hl7apy_mssg_parser(frame)
+        results.append(result)
+    return results, fallbacks
+
+
+class ParserPool:
+    """Parses batches of frames on 'workers' processes, keeping their order."""
+
+    def __init__(self, workers, chunk_size=16, parser="mssg_parser"):
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.parser = parser  # name of the parsing.hl7 function to run
+        # spawn: the service already runs threads (metrics server, warm-up), which fork does not mix with
+        self.executor = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn"),
+                                            initializer=_ignore_interrupts)
+
+    def chunks(self, frames):
+        return [frames[i:i + self.chunk_size] for i in range(0, len(frames), self.chunk_size)]
+
+    def split(self, frames):
+        """
+        Parse what the fast path can here. Returns the results, with None for
+        the frames left to the workers, the positions of those frames, their
+        chunks and the parser the workers run.
+        """
+        if self.parser != "mssg_parser":
+            return [None] * len(frames), range(len(frames)), self.chunks(frames), self.parser
+        results = [hl7.fast_mssg_parser(frame) for frame in frames]
+        slow = [i for i, result in enumerate(results) if result is None]
+        HL7_PARSER_FALLBACKS.inc(len(slow))
+        return results, slow, self.chunks([frames[i] for i in slow]), "hl7apy_mssg_parser"
+
+    def parse(self, frames):
+        """Parse a list of frames (bytes). Returns the (message_type, data) results in order."""
+        results, slow, chunks, parser = self.split(frames)
+        if slow:
+            parsed = [result for chunk, _ in self.executor.map(parse_chunk, chunks, [parser] * len(chunks))
+                      for result in chunk]
+            for i, result in zip(slow, parsed):
+                results[i] = result
+        return results
+
+    async def parse_async(self, loop, frames):
+        """parse() for the asyncio pipeline: the chunks are parsed concurrently without blocking the loop."""
+        import asyncio
+
+        results, slow, chunks, parser = self.split(frames)
+        if slow:
+            parsed = [result for chunk, _ in await asyncio.gather(*(
+                loop.run_in_executor(self.executor, parse_chunk, chunk, parser) for chunk in chunks))
+                      for result in chunk]
+            for i, result in zip(slow, parsed):
+                results[i] = result
+        return results
+
+    def warm_up(self):
+        """Start every worker process now rather than on the first message."""
+        list(self.executor.map(parse_chunk, [[]] * self.workers))
+
+    def close(self):
+        self.executor.shutdown(cancel_futures=True)
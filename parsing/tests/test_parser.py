@@ -1,7 +1,14 @@
+import os
 import unittest
 
+import simulator
+import simulator_test
+from benchmarks.synthetic import hl7_messages
 from parsing.hl7 import mssg_parser
 from parsing.hl7 import age_calculator
+from parsing.hl7 import fast_mssg_parser, hl7apy_mssg_parser, canonical_mrn
+
+SIMULATOR_MESSAGES = "messages.mllp"
 
 class TestHL7Parser(unittest.TestCase):
 
@@ -38,7 +45,7 @@ class TestHL7Parser(unittest.TestCase):
         hl7_msg = b"MSH|^~\&|SIMULATION|SOUTH RIVERSIDE|||202401221000||ADT^A03|||2.5\r" \
                   b"PID|1||478237423"
 
-        expected_output = ("ADT^A03", [])
+        expected_output = ("ADT^A03", ["478237423"])
         self.assertEqual(mssg_parser(hl7_msg), expected_output)
 
     def test_mssg_parser_ack(self):
@@ -49,5 +56,54 @@ class TestHL7Parser(unittest.TestCase):
         expected_output = ("ACK", [])
         self.assertEqual(mssg_parser(hl7_msg), expected_output)
 
+class TestFastPathParser(unittest.TestCase):
+
+    def simulator_messages(self):
+        """Messages from simulator_test, a synthetic stream and messages.mllp (if present)."""
+        messages = [
+            ("\r".join(segments) + "\r").encode("ascii")
+            for segments in (simulator_test.ADT_A01, simulator_test.ORU_R01,
+                             simulator_test.ADT_A03, simulator_test.ACK)
+        ]
+        messages.extend(hl7_messages(500, patients=50))
+        if os.path.exists(SIMULATOR_MESSAGES):
+            messages.extend(simulator.read_hl7_messages(SIMULATOR_MESSAGES))
+        return messages
+
+    def test_fast_path_matches_hl7apy(self):
+        #Differential test: both parsers must agree on every simulator message.
+        for hl7_msg in self.simulator_messages():
+            with self.subTest(hl7_msg=hl7_msg):
+                fast = fast_mssg_parser(hl7_msg)
+                self.assertIsNotNone(fast)
+                self.assertEqual(fast, hl7apy_mssg_parser(hl7_msg))
+
+    def test_fast_path_memoryview(self):
+        #The MLLP decoder hands out memoryviews.
+        hl7_msg = b"MSH|^~\\&|SIMULATION|SOUTH RIVERSIDE|||202401201800||ORU^R01|||2.5\r" \
+                  b"PID|1||478237423\r" \
+                  b"OBR|1||||||202401202243\r" \
+                  b"OBX|1|SN|CREATININE||103.4"
+        self.assertEqual(fast_mssg_parser(memoryview(hl7_msg)), ("ORU^R01", ["478237423", 103.4, "202401202243"]))
+
+    def test_leading_zero_mrn(self):
+        #PIDs are stored as INTEGER: both parsers drop the leading zeros so '0123' and '123' are one patient.
+        hl7_msg = b"MSH|^~\\&|SIMULATION|SOUTH RIVERSIDE|||202401221000||ADT^A03|||2.5\r" \
+                  b"PID|1||0478237423"
+        self.assertEqual(fast_mssg_parser(hl7_msg), ("ADT^A03", ["478237423"]))
+        self.assertEqual(hl7apy_mssg_parser(hl7_msg), ("ADT^A03", ["478237423"]))
+
+    def test_non_ascii_digit_mrn_is_kept(self):
+        #'²' passes str.isdigit() but not int(): the MRN is left as it is instead of failing the message.
+        self.assertEqual(canonical_mrn("0123"), "123")
+        self.assertEqual(canonical_mrn("12²"), "12²")
+        self.assertEqual(canonical_mrn("MRN0123"), "MRN0123")
+
+    def test_fast_path_malformed_falls_back(self):
+        #Missing OBX segment: the fast path gives up and hl7apy decides.
+        hl7_msg = b"MSH|^~\\&|SIMULATION|SOUTH RIVERSIDE|||202401201800||ORU^R01|||2.5\r" \
+                  b"PID|1||478237423"
+        self.assertIsNone(fast_mssg_parser(hl7_msg))
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,51 @@
+import unittest
+import asyncio
+from unittest.mock import patch
+from parsing.hl7 import mssg_parser
+from parsing.pool import ParserPool, parse_chunk
+from benchmarks.synthetic import hl7_messages
+
+class TestParserPool(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.pool = ParserPool(2, chunk_size=7)
+        cls.frames = list(hl7_messages(100))
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.pool.close()
+
+    def test_results_in_order(self):
+        """Frames parsed on the workers come back in their original order."""
+        self.assertEqual(self.pool.parse(self.frames), [mssg_parser(frame) for frame in self.frames])
+
+    def test_parse_async(self):
+        """The asyncio variant gives the same results."""
+        async def parse():
+            return await self.pool.parse_async(asyncio.get_running_loop(), self.frames)
+        self.assertEqual(asyncio.run(parse()), [mssg_parser(frame) for frame in self.frames])
+
+    def test_only_fallbacks_go_to_workers(self):
+        """Fast-path frames are parsed in process; the others keep their place among them."""
+        unknown = b"MSH|^~\\&|SIMULATION|SOUTH RIVERSIDE|||20240101000000||ADT^A08|||2.5\rPID|1||1"
+        with patch.object(self.pool, "executor") as executor:
+            self.pool.parse(self.frames)
+        executor.map.assert_not_called()
+
+        frames = self.frames[:3] + [unknown] + self.frames[3:10] + [unknown]
+        self.assertEqual(self.pool.parse(frames), [mssg_parser(frame) for frame in frames])
+
+    def test_empty_batch(self):
+        self.assertEqual(self.pool.parse([]), [])
+
+    def test_parse_chunk_counts_fallbacks(self):
+        """Frames the fast path cannot parse are counted as hl7apy fallbacks."""
+        frame = self.frames[0]
+        unknown = b"MSH|^~\\&|SIMULATION|SOUTH RIVERSIDE|||20240101000000||ADT^A08|||2.5\rPID|1||1"
+        results, fallbacks = parse_chunk([frame, unknown])
+        self.assertEqual(results[0], mssg_parser(frame))
+        self.assertEqual(fallbacks, 1)
+
+if __name__ == "__main__":
+    unittest.main()
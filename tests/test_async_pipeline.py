@@ -0,0 +1,79 @@
+import unittest
+import asyncio
+import socket
+import threading
+from unittest.mock import patch, MagicMock
+from async_pipeline import AsyncPipeline
+from benchmarks.synthetic import hl7_messages, to_mllp
+
+class TestAsyncPipeline(unittest.TestCase):
+
+    def setUp(self):
+        """A socket pair standing in for the simulator connection, and 50 synthetic messages."""
+        self.simulator, self.service = socket.socketpair()
+        self.messages = list(hl7_messages(50, patients=10))
+        self.killer = MagicMock(kill_now=False)
+        self.stored = []
+
+    def tearDown(self):
+        self.simulator.close()
+
+    def fake_store(self, mssg_type, data):
+        """Every ORU^R01 makes its patient ready for inference."""
+        self.stored.append(mssg_type)
+        if mssg_type == "ORU^R01":
+            return {"PID": data[0], "Latest_Result_Timestamp": data[2]}
+        return None
+
+    def run_pipeline(self, queue_size=4, writer=None, prediction=0):
+        """Send every message, close the connection and collect the ACKs."""
+        received = bytearray()
+        def simulate():
+            self.simulator.sendall(b"".join(to_mllp(message) for message in self.messages))
+            self.simulator.shutdown(socket.SHUT_WR)
+            while chunk := self.simulator.recv(65536):
+                received.extend(chunk)
+        thread = threading.Thread(target=simulate)
+        thread.start()
+
+        pipeline = AsyncPipeline(b"ACK", self.killer, queue_size=queue_size, batch_rows=8)
+        with patch("async_pipeline.store_message", side_effect=self.fake_store), \
+             patch("async_pipeline.preprocess_batch", side_effect=lambda records: (records, None, None)), \
+             patch("async_pipeline.predict_aki_batch", side_effect=lambda records: [prediction] * len(records)), \
+             patch("async_pipeline.handle_prediction") as self.handle_prediction, \
+             patch("async_pipeline.db_operations.writer", writer), \
+             patch("builtins.print"):
+            closed = asyncio.run(pipeline.serve(self.service))
+        thread.join()
+        return closed, bytes(received)
+
+    def test_every_message_acked_in_order(self):
+        """Each message is stored once, in arrival order, and ACKed once."""
+        closed, acks = self.run_pipeline()
+        self.assertTrue(closed)
+        self.assertEqual(acks, b"ACK" * len(self.messages))
+        self.assertEqual(len(self.stored), len(self.messages))
+
+    def test_positive_predictions_are_paged(self):
+        """Predictions reach the pager stage for every ready record."""
+        self.run_pipeline(prediction=1)
+        oru = sum(b"ORU^R01" in message for message in self.messages)
+        self.assertEqual(self.handle_prediction.call_count, oru)
+
+    def test_group_commit_before_ack(self):
+        """With a group-commit writer the batch is committed before its ACKs are sent."""
+        writer = MagicMock()
+        writer.__len__.return_value = 1
+        writer.due.return_value = False
+        closed, acks = self.run_pipeline(writer=writer)
+        self.assertEqual(acks, b"ACK" * len(self.messages))
+        self.assertGreater(writer.commit.call_count, 0)
+
+    def test_stage_failure_is_raised(self):
+        """A failing stage stops the pipeline; unacknowledged messages are not ACKed."""
+        self.fake_store = MagicMock(side_effect=RuntimeError("database is locked"))
+        with self.assertRaises(RuntimeError):
+            self.run_pipeline()
+
+if __name__ == "__main__":
+    unittest.main()
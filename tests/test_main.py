@@ -1,24 +1,24 @@
 import unittest
 from unittest.mock import patch, MagicMock
 import socket
-from main import main
+from main import main, send_acks, AckQueue
 
 class TestMain(unittest.TestCase):
     @patch('main.populate_db.main')
     @patch('main.socket.socket')
     @patch('main.build_hl7_ack')
-    @patch('main.parse_mllp_stream')
+    @patch('main.MLLPReader')
     @patch('main.message_consumer')
     @patch('main.os.getenv')
     def test_main_success(self, mock_getenv, mock_message_consumer,
-                          mock_parse_mllp_stream, mock_build_hl7_ack,
+                          mock_reader, mock_build_hl7_ack,
                           mock_socket, mock_populate_db):
         #Arrange
         mock_getenv.return_value = "localhost:12345"
         fake_socket_instance = MagicMock()
-        fake_socket_instance.recv.side_effect = [b"dummy chunk", b""]
         mock_socket.return_value = fake_socket_instance
-        mock_parse_mllp_stream.return_value = ([b"HL7 message"], b"")
+        mock_reader.return_value.read.side_effect = [11, 0]
+        mock_reader.return_value.__iter__.return_value = iter([b"HL7 message"])
         mock_build_hl7_ack.return_value = b"ACK"
 
         #Act
@@ -28,7 +28,7 @@ class TestMain(unittest.TestCase):
         mock_populate_db.assert_called_once()
         fake_socket_instance.connect.assert_called_once_with(('localhost', 12345))
         fake_socket_instance.settimeout.assert_called_once_with(20.0)
-        mock_parse_mllp_stream.assert_called()  
+        mock_reader.assert_called_with(fake_socket_instance)
         mock_message_consumer.assert_called_once_with(b"HL7 message")
         fake_socket_instance.sendall.assert_called_once_with(b"ACK")
         fake_socket_instance.close.assert_called_once()
@@ -40,7 +40,7 @@ class TestMain(unittest.TestCase):
         #Arrange
         mock_getenv.return_value = "localhost:12345"
         fake_socket_instance = MagicMock()
-        fake_socket_instance.recv.side_effect = socket.timeout
+        fake_socket_instance.recv_into.side_effect = socket.timeout
         mock_socket.return_value = fake_socket_instance
 
         #Act
@@ -57,7 +57,7 @@ class TestMain(unittest.TestCase):
         #Arrange
         mock_getenv.return_value = "localhost:12345"
         fake_socket_instance = MagicMock()
-        fake_socket_instance.recv.side_effect = KeyboardInterrupt
+        fake_socket_instance.recv_into.side_effect = KeyboardInterrupt
         mock_socket.return_value = fake_socket_instance
 
         #Act
@@ -70,18 +70,18 @@ class TestMain(unittest.TestCase):
     @patch('main.populate_db.main')
     @patch('main.socket.socket')
     @patch('main.build_hl7_ack')
-    @patch('main.parse_mllp_stream')
+    @patch('main.MLLPReader')
     @patch('main.message_consumer')
     @patch('main.os.getenv')
     def test_main_general_exception(self, mock_getenv, mock_message_consumer,
-                                    mock_parse_mllp_stream, mock_build_hl7_ack,
+                                    mock_reader, mock_build_hl7_ack,
                                     mock_socket, mock_populate_db):
         #Arrange
         mock_getenv.return_value = "localhost:12345"
         fake_socket_instance = MagicMock()
-        fake_socket_instance.recv.side_effect = [b"dummy chunk", b""]
         mock_socket.return_value = fake_socket_instance
-        mock_parse_mllp_stream.return_value = ([b"HL7 message"], b"")
+        mock_reader.return_value.read.side_effect = [11, 0]
+        mock_reader.return_value.__iter__.return_value = iter([b"HL7 message"])
         mock_build_hl7_ack.return_value = b"ACK"
         mock_message_consumer.side_effect = Exception("Test exception")
 
@@ -93,5 +93,209 @@ class TestMain(unittest.TestCase):
         fake_socket_instance.sendall.assert_not_called()
         mock_populate_db.assert_called_once()
 
+class TestConnectRetry(unittest.TestCase):
+    @patch('main.init_pipeline')
+    @patch('main.threading.Thread')
+    @patch('main.init_metrics')
+    @patch('main.time.sleep')
+    @patch('main.GracefulKiller')
+    @patch('main.socket.socket')
+    @patch('main.os.getenv')
+    def test_unreachable_simulator_retried_with_backoff(self, mock_getenv, mock_socket, mock_killer,
+                                                        mock_sleep, mock_init_metrics, mock_thread,
+                                                        mock_init_pipeline):
+        #Arrange
+        mock_init_pipeline.return_value = None
+        mock_getenv.side_effect = lambda key, default=None: "localhost:12345" if key == "MLLP_ADDRESS" else default
+        fake_socket_instance = MagicMock()
+        fake_socket_instance.connect.side_effect = ConnectionRefusedError("refused")
+        mock_socket.return_value = fake_socket_instance
+        killer = mock_killer.return_value
+        killer.kill_now = False
+
+        def stop_after_three(seconds):
+            if mock_sleep.call_count == 3:
+                killer.kill_now = True
+        mock_sleep.side_effect = stop_after_three
+
+        #Act
+        with patch("builtins.print"):
+            main()
+
+        #Assert: metrics and warm-up started once, connect retried after each back-off
+        mock_init_metrics.assert_called_once()
+        mock_thread.assert_called_once()
+        self.assertEqual(fake_socket_instance.connect.call_count, 3)
+        mock_sleep.assert_called_with(1)
+        mock_init_pipeline.assert_called_once()
+
+    @patch('main.shutdown')
+    @patch('main.init_pipeline')
+    @patch('main.threading.Thread')
+    @patch('main.init_metrics')
+    @patch('main.time.sleep')
+    @patch('main.GracefulKiller')
+    @patch('main.socket.socket')
+    @patch('main.os.getenv')
+    def test_failed_setup_retried_before_connecting(self, mock_getenv, mock_socket, mock_killer, mock_sleep,
+                                                    mock_init_metrics, mock_thread, mock_init_pipeline,
+                                                    mock_shutdown):
+        #Arrange
+        mock_getenv.side_effect = lambda key, default=None: "localhost:12345" if key == "MLLP_ADDRESS" else default
+        mock_init_pipeline.side_effect = [RuntimeError("history.csv unreadable"), None]
+        fake_socket_instance = MagicMock()
+        fake_socket_instance.connect.side_effect = ConnectionRefusedError("refused")
+        mock_socket.return_value = fake_socket_instance
+        killer = mock_killer.return_value
+        killer.kill_now = False
+
+        def stop_after_connect(seconds):
+            if fake_socket_instance.connect.called:
+                killer.kill_now = True
+        mock_sleep.side_effect = stop_after_connect
+
+        #Act
+        with patch("builtins.print"):
+            main()
+
+        #Assert: no connect until setup succeeded, and the failed setup was undone and retried
+        self.assertEqual(mock_init_pipeline.call_count, 2)
+        mock_sleep.assert_any_call(10)
+        mock_shutdown.assert_any_call(None)
+        fake_socket_instance.connect.assert_called_once_with(('localhost', 12345))
+
+class TestParserPoolPath(unittest.TestCase):
+    @patch('main.shutdown')
+    @patch('main.init_pipeline')
+    @patch('main.threading.Thread')
+    @patch('main.init_metrics')
+    @patch('main.GracefulKiller')
+    @patch('main.socket.socket')
+    @patch('main.MLLPReader')
+    @patch('main.parsed_message_consumer')
+    @patch('main.message_consumer')
+    @patch('main.os.getenv')
+    def test_frames_consumed_once_with_parser_pool(self, mock_getenv, mock_message_consumer,
+                                                   mock_parsed_message_consumer, mock_reader, mock_socket,
+                                                   mock_killer, mock_init_metrics, mock_thread,
+                                                   mock_init_pipeline, mock_shutdown):
+        #Arrange
+        mock_getenv.side_effect = lambda key, default=None: "localhost:12345" if key == "MLLP_ADDRESS" else default
+        parser_pool = mock_init_pipeline.return_value
+        parser_pool.parse.return_value = [("ADT^A03", ["1"])]
+        mock_socket.return_value = MagicMock()
+        killer = mock_killer.return_value
+        killer.kill_now = False
+
+        def read():
+            if mock_reader.return_value.read.call_count > 1:
+                killer.kill_now = True
+                return 0
+            return 11
+        mock_reader.return_value.read.side_effect = read
+        mock_reader.return_value.__iter__.side_effect = lambda: iter([b"HL7 message"])
+
+        #Act
+        with patch("builtins.print"):
+            main()
+
+        #Assert: the pool path consumed the frame, the inline path did not run as well
+        parser_pool.parse.assert_called_once_with([b"HL7 message"])
+        mock_parsed_message_consumer.assert_called_once()
+        mock_message_consumer.assert_not_called()
+
+class TestSendAcks(unittest.TestCase):
+    def test_send_acks_batches_into_one_sendall(self):
+        #Arrange
+        fake_socket_instance = MagicMock()
+        #Act
+        send_acks(fake_socket_instance, b"ACK", 3)
+        #Assert
+        fake_socket_instance.sendall.assert_called_once_with(b"ACKACKACK")
+
+    def test_send_acks_nothing_pending(self):
+        #Arrange
+        fake_socket_instance = MagicMock()
+        #Act
+        send_acks(fake_socket_instance, b"ACK", 0)
+        #Assert
+        fake_socket_instance.sendall.assert_not_called()
+
+class TestAckQueue(unittest.TestCase):
+    def setUp(self):
+        self.fake_socket_instance = MagicMock()
+        self.writer = MagicMock()
+        self.writer.__len__.return_value = 0
+
+    def test_acks_sent_immediately_without_group_commit(self):
+        #Arrange
+        acks = AckQueue(self.fake_socket_instance, b"ACK")
+        #Act
+        acks.add()
+        acks.add()
+        #Assert
+        self.assertEqual(self.fake_socket_instance.sendall.call_count, 2)
+
+    def test_acks_held_until_group_commit(self):
+        #Arrange
+        acks = AckQueue(self.fake_socket_instance, b"ACK", pipeline=True, writer=self.writer)
+        self.writer.__len__.return_value = 2  # both messages buffered writes
+        self.writer.due.return_value = False
+        #Act
+        acks.add()
+        acks.add()
+        acks.release()
+        #Assert: nothing durable yet
+        self.fake_socket_instance.sendall.assert_not_called()
+        self.assertEqual(acks.wait_time(), self.writer.time_left.return_value)
+        #Act: the window closes
+        acks.release(force=True)
+        #Assert
+        self.writer.commit.assert_called_once()
+        self.fake_socket_instance.sendall.assert_called_once_with(b"ACKACK")
+
+    def test_abort_acks_durable_and_drops_buffered(self):
+        #Arrange
+        acks = AckQueue(self.fake_socket_instance, b"ACK", pipeline=True, writer=self.writer)
+        acks.add()  # no buffered write: durable
+        self.writer.__len__.return_value = 1
+        acks.add()  # buffered write
+        #Act
+        acks.abort()
+        #Assert
+        self.writer.rollback.assert_called_once()
+        self.writer.commit.assert_not_called()
+        self.fake_socket_instance.sendall.assert_called_once_with(b"ACK")
+
+    def test_abort_on_broken_socket_does_not_raise(self):
+        #Arrange
+        acks = AckQueue(self.fake_socket_instance, b"ACK", pipeline=True, writer=self.writer)
+        acks.add()
+        self.fake_socket_instance.sendall.side_effect = BrokenPipeError("broken pipe")
+        self.writer.rollback.side_effect = RuntimeError("rollback failed")
+        #Act: the error that caused the abort must not be replaced by these
+        with patch("builtins.print"):
+            acks.abort()
+        #Assert
+        self.assertEqual(acks.pending, 0)
+
+    def test_acks_held_until_predictions(self):
+        #Arrange
+        batcher = MagicMock()
+        batcher.__len__.return_value = 1  # one record waiting for inference
+        batcher.due.return_value = False
+        acks = AckQueue(self.fake_socket_instance, b"ACK", pipeline=True, batcher=batcher)
+        #Act
+        acks.add()
+        acks.release()
+        #Assert
+        self.fake_socket_instance.sendall.assert_not_called()
+        #Act: the batch fills up
+        batcher.due.return_value = True
+        acks.release()
+        #Assert
+        batcher.flush.assert_called_once()
+        self.fake_socket_instance.sendall.assert_called_once_with(b"ACK")
+
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
@@ -1,5 +1,7 @@
 import unittest
-from utils import parse_mllp_stream, build_hl7_ack
+from unittest.mock import MagicMock
+import socket
+from utils import parse_mllp_stream, build_hl7_ack, MLLPDecoder, MLLPReader
 from utils import MLLP_START_OF_BLOCK, MLLP_END_OF_BLOCK, MLLP_CARRIAGE_RETURN
 
 class TestUtils(unittest.TestCase):
@@ -25,6 +27,79 @@ class TestUtils(unittest.TestCase):
         self.assertEqual(messages, [b"MSG1", b"MSG2"])
         self.assertEqual(leftover, b"")
     
+    def test_decoder_multiple_messages(self):
+        #Arrange
+        decoder = MLLPDecoder()
+        buffer = (
+            bytes([MLLP_START_OF_BLOCK]) + b"MSG1" + bytes([MLLP_END_OF_BLOCK, MLLP_CARRIAGE_RETURN]) +
+            bytes([MLLP_START_OF_BLOCK]) + b"MSG2" + bytes([MLLP_END_OF_BLOCK, MLLP_CARRIAGE_RETURN])
+        )
+        #Act
+        decoder.feed(buffer)
+        messages = [bytes(msg) for msg in decoder]
+        #Assert
+        self.assertEqual(messages, [b"MSG1", b"MSG2"])
+        self.assertEqual(len(decoder), 0)
+
+    def test_decoder_skips_junk_and_keeps_partial_frame(self):
+        #Arrange
+        decoder = MLLPDecoder(capacity=8)
+        frame = bytes([MLLP_START_OF_BLOCK]) + b"HL7_MESSAGE" + bytes([MLLP_END_OF_BLOCK, MLLP_CARRIAGE_RETURN])
+        stream = b"junk" + frame + b"junk" + frame
+        #Act
+        messages = []
+        for i in range(len(stream)):  # one byte at a time, split between 0x1C and 0x0D too
+            decoder.feed(stream[i:i + 1])
+            messages.extend(bytes(msg) for msg in decoder)
+        #Assert
+        self.assertEqual(messages, [b"HL7_MESSAGE", b"HL7_MESSAGE"])
+        self.assertEqual(len(decoder), 0)
+
+    def test_decoder_yields_memoryview(self):
+        #Arrange
+        decoder = MLLPDecoder()
+        decoder.feed(bytes([MLLP_START_OF_BLOCK]) + b"MSG1" + bytes([MLLP_END_OF_BLOCK]))
+        #Act
+        first = list(decoder)
+        decoder.feed(bytes([MLLP_CARRIAGE_RETURN]))
+        second = list(decoder)
+        #Assert
+        self.assertEqual(first, [])
+        self.assertIsInstance(second[0], memoryview)
+        self.assertEqual(second[0].tobytes(), b"MSG1")
+
+    def test_reader_recv_into(self):
+        #Arrange
+        client, server = socket.socketpair()
+        self.addCleanup(client.close)
+        self.addCleanup(server.close)
+        reader = MLLPReader(client)
+        frame = bytes([MLLP_START_OF_BLOCK]) + b"HL7_MESSAGE" + bytes([MLLP_END_OF_BLOCK, MLLP_CARRIAGE_RETURN])
+        server.sendall(frame * 3)
+        server.close()
+        #Act
+        messages = []
+        while reader.read():
+            messages.extend(bytes(msg) for msg in reader)
+        #Assert
+        self.assertEqual(messages, [b"HL7_MESSAGE"] * 3)
+        self.assertEqual(reader.bytes_received, 3 * len(frame))
+        self.assertGreaterEqual(reader.recv_calls, 2)
+
+    def test_reader_adapts_read_size(self):
+        #Arrange
+        fake_socket = MagicMock()
+        reader = MLLPReader(fake_socket, read_size=4096)
+        #Act / Assert: a full window grows the read size
+        fake_socket.recv_into.side_effect = lambda buf, size: size
+        reader.read()
+        self.assertEqual(reader.read_size, 8192)
+        # short reads shrink it again, but never below MIN_READ_SIZE
+        fake_socket.recv_into.side_effect = lambda buf, size: 1
+        for _ in range(10):
+            reader.read()
+        self.assertEqual(reader.read_size, MLLPReader.MIN_READ_SIZE)
+
     def test_build_hl7_ack(self):
         #Act
         ack = build_hl7_ack()
@@ -1,5 +1,12 @@
 import signal
-from monitoring.metrics import SIGTERM_COUNTER
+from monitoring.metrics import (
+    SIGTERM_COUNTER,
+    MLLP_RECEIVED_BYTES,
+    MLLP_RECV_CALLS,
+    MLLP_CONNECTION_BYTES,
+    MLLP_CONNECTION_RECV_CALLS,
+    MLLP_READ_SIZE,
+)
 
 # MLLP control characters
 MLLP_START_OF_BLOCK = 0x0b  # \x0B
@@ -50,6 +57,162 @@ def parse_mllp_stream(buffer):
     except Exception as e:
         print(f"[utils] Exception {e}")
 
+class MLLPDecoder:
+    """
+    Incremental MLLP frame decoder.
+
+    Received bytes are appended to a reusable bytearray buffer and frame
+    boundaries are located with bytes.find, so decoding a burst is linear
+    in its size. Complete messages are yielded as memoryview slices into
+    the buffer (no copy). A yielded view is only valid until the next call
+    to feed(); convert it with bytes() if it has to outlive that.
+
+    Semantics match parse_mllp_stream: bytes before 0x0B are skipped and an
+    incomplete frame is kept until the rest of it arrives.
+    """
+
+    START = bytes([MLLP_START_OF_BLOCK])
+    END = bytes([MLLP_END_OF_BLOCK, MLLP_CARRIAGE_RETURN])
+
+    def __init__(self, capacity=64 * 1024):
+        self._buf = bytearray(capacity)
+        self._view = memoryview(self._buf)
+        self._head = 0      # first unconsumed byte
+        self._tail = 0      # end of buffered data
+        self._scan = 0      # where to resume searching for the end block
+        self._open = False  # True if _head points at a 0x0B
+
+    def __len__(self):
+        return self._tail - self._head
+
+    def _reserve(self, size):
+        """Make room for 'size' more bytes after _tail."""
+        pending = self._tail - self._head
+        if pending == 0:
+            self._head = self._tail = self._scan = 0
+        if self._tail + size <= len(self._buf):
+            return
+        if pending + size <= len(self._buf):
+            # Compact in place: same-length slice assignment never resizes
+            self._buf[0:pending] = self._buf[self._head:self._tail]
+        else:
+            # Grow into a fresh buffer so views handed out earlier stay intact
+            capacity = max(2 * len(self._buf), pending + size)
+            buf = bytearray(capacity)
+            buf[0:pending] = self._view[self._head:self._tail]
+            self._buf = buf
+            self._view = memoryview(buf)
+        self._scan -= self._head
+        self._head, self._tail = 0, pending
+
+    def feed(self, data):
+        """Append received bytes to the buffer."""
+        size = len(data)
+        self._reserve(size)
+        self._buf[self._tail:self._tail + size] = data
+        self._tail += size
+
+    def writable(self, size):
+        """
+        Return a writable memoryview of 'size' free bytes at the end of the
+        buffer, e.g. for socket.recv_into. Call commit() with the number of
+        bytes actually written.
+        """
+        self._reserve(size)
+        return self._view[self._tail:self._tail + size]
+
+    def commit(self, size):
+        """Mark 'size' bytes written into writable() as received."""
+        self._tail += size
+
+    def __iter__(self):
+        """Yield every complete message currently buffered."""
+        buf = self._buf
+        while True:
+            if not self._open:
+                start = buf.find(self.START, self._head, self._tail)
+                if start < 0:
+                    self._head = self._scan = self._tail  # junk only
+                    return
+                self._head = start
+                self._scan = start + 1
+                self._open = True
+            end = buf.find(self.END, self._scan, self._tail)
+            if end < 0:
+                # Keep the partial frame; the 0x1C may be the last byte
+                self._scan = max(self._head + 1, self._tail - 1)
+                return
+            msg = self._view[self._head + 1:end]
+            self._head = self._scan = end + 2
+            self._open = False
+            yield msg
+
+
+class MLLPReader:
+    """
+    Socket reader for the MLLP client loop.
+
+    Reads with recv_into straight into the MLLPDecoder buffer, so no bytes
+    object is allocated per syscall. The read size adapts to the traffic:
+    a recv that fills the whole window means a backlog is waiting and the
+    window doubles, while short reads shrink it back towards a floor of a
+    couple of average-sized messages.
+
+    Bytes and recv calls are exported per connection in monitoring.metrics.
+    """
+
+    MIN_READ_SIZE = 1024
+    MAX_READ_SIZE = 256 * 1024
+
+    def __init__(self, sock, read_size=4096):
+        self.sock = sock
+        self.decoder = MLLPDecoder(capacity=2 * self.MAX_READ_SIZE)
+        self.read_size = read_size
+        self.bytes_received = 0
+        self.recv_calls = 0
+        self._avg_message_size = 0.0
+        MLLP_CONNECTION_BYTES.set(0)
+        MLLP_CONNECTION_RECV_CALLS.set(0)
+        MLLP_READ_SIZE.set(read_size)
+
+    def read(self):
+        """
+        Perform one recv_into. Return the number of bytes read; 0 means the
+        peer closed the connection. socket errors propagate to the caller.
+        """
+        nbytes = self.sock.recv_into(self.decoder.writable(self.read_size), self.read_size)
+        self.decoder.commit(nbytes)
+
+        self.recv_calls += 1
+        self.bytes_received += nbytes
+        MLLP_RECV_CALLS.inc()
+        MLLP_RECEIVED_BYTES.inc(nbytes)
+        MLLP_CONNECTION_RECV_CALLS.set(self.recv_calls)
+        MLLP_CONNECTION_BYTES.set(self.bytes_received)
+
+        self._adapt(nbytes)
+        return nbytes
+
+    def _adapt(self, nbytes):
+        if nbytes >= self.read_size:
+            read_size = min(2 * self.read_size, self.MAX_READ_SIZE)
+        elif nbytes <= self.read_size // 4:
+            floor = max(self.MIN_READ_SIZE, int(2 * self._avg_message_size))
+            read_size = max(self.read_size // 2, floor)
+        else:
+            return
+        if read_size != self.read_size:
+            self.read_size = read_size
+            MLLP_READ_SIZE.set(read_size)
+
+    def __iter__(self):
+        """Yield the complete messages received so far (see MLLPDecoder)."""
+        for msg in self.decoder:
+            # Exponential moving average of the message size, for _adapt
+            self._avg_message_size += 0.1 * (len(msg) - self._avg_message_size)
+            yield msg
+
+
 def build_hl7_ack():
     """
     Return a minimal HL7 ACK message wrapped in MLLP.